@@ -12,6 +12,8 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from GenAnnot.pagination import KeysetPagination
+
 from .forms import SignupForm
 from .models import CustomUser
 from .permissions import ReadOnly
@@ -125,11 +127,16 @@ class UserAPIView(APIView):
         if(not all(value is None for value in params.values())):
             # Filter the users based on the query parameters
             users = users.filter(**{k: v for k, v in params.items() if v is not None})
-            if(users.count() == 0):
+            if(not users.exists()):
                 return Response({"error": "No users found with query parameters provided."}, status=status.HTTP_404_NOT_FOUND)
         
-        # Pagination
-        if(request.GET.get('limit',None)):
+        # Pagination, by cursor on the username or by limit / offset
+        if(KeysetPagination.requested(request)):
+            paginator = KeysetPagination(ordering="username")
+            users = paginator.paginate_queryset(users, request)
+            serializer = UserSerializer(users, many=True)
+            return paginator.get_paginated_response(serializer.data)
+        elif(request.GET.get('limit',None)):
             paginator = LimitOffsetPagination()
             users = paginator.paginate_queryset(users, request)
             serializer = UserSerializer(users, many=True)
@@ -0,0 +1,128 @@
+import gzip
+from io import BytesIO
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+# Brotli and Zstandard are optional, encodings without their library are never negotiated
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class Encoder:
+    """Compresses a whole response body, or a stream of chunks flushed one by one"""
+
+    def __init__(self, name: str, level: int):
+        self.name = name
+        self.level = level
+
+    def available(self) -> bool:
+        return {"zstd": zstandard, "br": brotli}.get(self.name, gzip) is not None
+
+    def compress(self, data: bytes) -> bytes:
+        if self.name == "zstd":
+            return zstandard.ZstdCompressor(level=self.level).compress(data)
+        if self.name == "br":
+            return brotli.compress(data, quality=self.level)
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+    # Every chunk is flushed, so that the client receives the data as soon as it is produced
+    def stream(self, chunks):
+        if self.name == "zstd":
+            compressor = zstandard.ZstdCompressor(level=self.level).compressobj()
+            for chunk in chunks:
+                yield compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            yield compressor.flush()
+        elif self.name == "br":
+            compressor = brotli.Compressor(quality=self.level)
+            for chunk in chunks:
+                yield compressor.process(chunk) + compressor.flush()
+            yield compressor.finish()
+        else:
+            buffer = BytesIO()
+            with gzip.GzipFile(mode="wb", compresslevel=self.level, fileobj=buffer, mtime=0) as compressor:
+                for chunk in chunks:
+                    compressor.write(chunk)
+                    compressor.flush()
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Compresses responses with the encoding preferred by the server among the ones accepted by the client
+    / the order of COMPRESSION["encodings"] is the preference of the server, q-values of 0 refuse an encoding
+    / streaming responses are compressed chunk by chunk"""
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        config = settings.COMPRESSION
+        self.min_length = config["min_length"]
+        self.encoders = [Encoder(name, level) for name, level in config["encodings"].items()]
+        self.encoders = [encoder for encoder in self.encoders if encoder.available()]
+
+    # Used to pick the encoder of a request from its Accept-Encoding header
+    def negotiate(self, header: str):
+        accepted = {}
+        for item in header.split(","):
+            name, _, params = item.strip().partition(";")
+            try:
+                q = float(params.strip()[2:]) if params.strip().startswith("q=") else 1.0
+            except ValueError:
+                q = 0.0
+            accepted[name.strip().lower()] = q
+        for encoder in self.encoders:
+            if accepted.get(encoder.name, accepted.get("*", 0.0)) > 0:
+                return encoder
+        return None
+
+    def process_response(self, request, response):
+        # Short responses are not worth compressing
+        if not response.streaming and len(response.content) < self.min_length:
+            return response
+        if response.has_header("Content-Encoding"):
+            return response
+        # Byte ranges refer to the stored representation (e.g. the gzipped exports)
+        if response.get("Accept-Ranges", "none") != "none":
+            return response
+        # Pages carrying a CSRF token are not compressed (BREACH)
+        if response.get("Content-Type", "").startswith("text/html"):
+            return response
+        # Parquet files are compressed column by column
+        if response.get("Content-Type", "").startswith("application/vnd.apache.parquet"):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        encoder = self.negotiate(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoder is None:
+            return response
+
+        if response.streaming:
+            # Asynchronous streams are left to the server
+            if response.is_async:
+                return response
+            response.streaming_content = encoder.stream(response.streaming_content)
+            # The compressed length is only known once the stream is consumed
+            del response.headers["Content-Length"]
+        else:
+            content = encoder.compress(response.content)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response.headers["Content-Length"] = str(len(content))
+
+        # A strong ETag identifies the uncompressed representation
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = encoder.name
+        return response
@@ -0,0 +1,18 @@
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """Cursor pagination on an indexed and unique sort key, opted in with ?page_size=
+    / pages are read with a WHERE on the sort key instead of COUNT(*) and OFFSET,
+    so that a deep page costs the same as the first one"""
+
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+    def __init__(self, ordering: str):
+        self.ordering = ordering
+
+    # Used to know if a list is paged by cursor, the next / previous links keep page_size
+    def requested(request) -> bool:
+        return request.GET.get("page_size", None) is not None or request.GET.get("cursor", None) is not None
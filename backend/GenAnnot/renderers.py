@@ -0,0 +1,19 @@
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSON renderer serialising with orjson
+    / values orjson does not handle the same way as DRF (datetimes, decimals, lazy strings...)
+    are passed to the DRF encoder, so that the output is unchanged"""
+
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None) -> bytes:
+        if data is None:
+            return b""
+        options = self.options
+        # Indentation requested by the client (e.g. Accept: application/json; indent=2) is limited to 2 spaces
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            options |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=self.encoder_class().default, option=options)
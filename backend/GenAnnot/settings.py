@@ -71,6 +71,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
+    "GenAnnot.middleware.CompressionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -86,6 +87,19 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'GenAnnot.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+}
+
+# Response compression (GenAnnot.middleware.CompressionMiddleware)
+# encodings: level of each encoding, in order of preference, br and zstd are skipped when their library is missing
+# min_length: responses shorter than this (bytes) are sent as they are
+
+COMPRESSION = {
+    'encodings': {'zstd': 3, 'br': 4, 'gzip': 6},
+    'min_length': 1024,
 }
 
 FRONT_END_URL = "http://localhost:3000" if LOCAL else "http://client:3000"
@@ -139,6 +153,19 @@ DATABASES = {
     }
 }
 
+# Cache
+# Shared by the web and huey processes, so that invalidations are seen everywhere
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    } if LOCAL else {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": "redis://redis:6379/1",
+    }
+}
+
 # Authentification
 
 AUTH_USER_MODEL = "AccessControl.CustomUser"
@@ -250,7 +277,7 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # Huey settings
 
 HUEY = {
-    'huey_class': 'huey.RedisExpireHuey',
+    'huey_class': 'huey.PriorityRedisExpireHuey',
     'name': 'genannotator',
     'results': True,
     'store_none': False,
@@ -272,4 +299,225 @@ HUEY = {
         'health_check_interval': 1,
     },
     "expire_time": 86400,
-}
\ No newline at end of file
+}
+
+# Named huey queues (see GeneAtlas/queues.py)
+# Each queue is consumed by run_queue programs with the consumer options below
+# layered on top of HUEY['consumer']
+# The autoscale_queues supervisor keeps between min and max consumer processes per queue
+# and adds one when more than target_depth tasks wait per process or the head task
+# has been waiting for more than max_age seconds
+
+HUEY_QUEUES = {
+    # Short latency-sensitive jobs (emails, housekeeping)
+    'interactive': {
+        'consumer': {
+            'workers': 2,
+            'worker_type': 'thread',
+        },
+        'autoscale': {
+            'min': 1,
+            'max': 2,
+            'target_depth': 20,
+            'max_age': 5,
+        },
+    },
+    # Jobs waiting on remote services (NCBI BLAST, EBI PFAMScan)
+    'remote-io': {
+        'consumer': {
+            'workers': 4,
+            'worker_type': 'thread',
+        },
+        'autoscale': {
+            'min': 1,
+            'max': 4,
+            'target_depth': 8,
+            'max_age': 60,
+        },
+    },
+    # Batches of the pipelines, which hold a worker while calling the remote services for each gene
+    # Kept apart so that they never hold back the requests of the annotators on remote-io
+    'pipeline-batch': {
+        'consumer': {
+            'workers': 2,
+            'worker_type': 'thread',
+        },
+        'autoscale': {
+            'min': 1,
+            'max': 1,
+            'target_depth': 4,
+            'max_age': 600,
+        },
+    },
+    # Heavy local computations
+    'cpu-bound': {
+        'consumer': {
+            'workers': 2,
+            'worker_type': 'process',
+        },
+        'autoscale': {
+            'min': 1,
+            'max': 2,
+            'target_depth': 4,
+            'max_age': 300,
+        },
+    },
+}
+
+# Timeouts (seconds) of the async tasks by task type
+# soft: the task stops polling and returns an error result
+# hard: the task is aborted and its worker is given back
+# expires: the task is dropped if still queued after this delay
+# Rows outliving expires + hard + grace are rejected by the reconcile_tasks job
+# For PIPELINE the timeouts apply to each batch, the parent row is updated whenever a batch makes progress:
+# soft: the batch gives its worker back and runs again later, hard: deadline of a batch (one gene analysed past soft),
+# defer: delay before a batch runs again when the hourly budget of a remote service is used up (see ANALYSIS_PRECOMPUTE)
+
+HUEY_TASK_TIMEOUTS = {
+    'BLAST': {
+        'soft': None,
+        'hard': 1200,
+        'expires': 3600,
+        'grace': 60,
+    },
+    'PFAMScan': {
+        'soft': 660,
+        'hard': 900,
+        'expires': 3600,
+        'grace': 60,
+    },
+    'PIPELINE': {
+        'soft': 600,
+        'hard': 3600,
+        'expires': None,
+        'grace': 300,
+        'defer': 300,
+    },
+}
+
+# Nightly pre-computation of BLAST / PFAMScan results for RAW and ONGOING genes
+# window: UTC hours [start, end) during which the precompute_analyses job submits tasks
+# batch_size: maximum number of tasks submitted per task type and run (every 10 minutes)
+# budget: maximum number of tasks submitted per hour to each remote service, user requests included
+# user: username the tasks of unassigned genes are cached for (defaults to the first superuser)
+# priority: queue priority of the pre-computed tasks, below the one of user requests
+
+ANALYSIS_PRECOMPUTE = {
+    'enabled': True,
+    'window': (22, 6),
+    'batch_size': 25,
+    'budget': {
+        'BLAST': 60,
+        'PFAMScan': 30,
+    },
+    'user': None,
+    'priority': 0,
+}
+
+HUEY_AUTOSCALE = {
+    'interval': 10,
+    'cooldown': 60,
+}
+
+# Annotation notifications
+# immediate: mail the annotator as soon as an annotation is approved or rejected
+# digest: crontab minute of the digest sender, used when immediate is disabled
+# Events are otherwise queued in the Notification outbox and sent as one digest per recipient
+
+NOTIFICATIONS = {
+    'immediate': False,
+    'digest': '*/30',
+}
+
+# Change feed (api/changes/)
+# page_size: default / maximum number of changes per page
+# settle: seconds a change waits before being served, so that transactions committed
+# out of id order are not skipped by a cursor
+# The window relies on SQLite, which runs one write transaction at a time so that ids are handed out in commit order,
+# created_at is set at insert time: with concurrent writers a transaction committing more than settle seconds
+# after its insert would be skipped, the feed would then have to be paged on a commit-ordered sequence
+# retention: days the changes are kept, a client whose cursor is older must reload the data (only the last change of a row is kept)
+
+CHANGE_FEED = {
+    'page_size': 500,
+    'max_page_size': 5000,
+    'settle': 2,
+    'retention': 30,
+}
+
+# Batch lookup (api/batch/)
+# max_items: largest number of names resolved by a single request
+
+BATCH_LOOKUP = {
+    'max_items': 5000,
+}
+
+# Bulk creation (api/gene/ and api/peptide/ POST with a list)
+# max_items: largest number of genes / peptides created by a single request
+# batch_size: rows per INSERT
+
+BULK_CREATE = {
+    'max_items': 10000,
+    'batch_size': 1000,
+}
+
+# Bulk annotation (api/annotation/ PUT with a list)
+# max_items: largest number of gene annotations written by a single request
+
+BULK_UPDATE = {
+    'max_items': 5000,
+}
+
+# Streamed downloads (api/download/)
+# chunk_size: rows fetched per database round trip
+# buffer_size: bytes sent per chunk of the response
+# fasta_width: residues per line of the FASTA files
+
+DOWNLOADS = {
+    'chunk_size': 2000,
+    'buffer_size': 65536,
+    'fasta_width': 60,
+}
+
+# Genome exports (api/export/, see GeneAtlas/exports.py)
+# root: directory of the gzipped files
+# refresh: crontab minute of the refresh_exports job, which rebuilds the exports of the changed genomes
+# chunk_size: rows fetched per database round trip
+# level: gzip compression level of the files
+# retries / retry_delay: attempts left and seconds between them when a build fails or finds another build of the genome running
+# lock_timeout: seconds after which the lock of a build (and the flag of a queued build) expire, longer than any build
+
+EXPORTS = {
+    'root': BASE_DIR / 'exports',
+    'refresh': '*/30',
+    'chunk_size': 2000,
+    'level': 6,
+    'retries': 3,
+    'retry_delay': 120,
+    'lock_timeout': 3600,
+}
+
+# Columnar exports (api/columnar/ and the export_columnar command, see GeneAtlas/columnar.py)
+# chunk_size: rows fetched per database round trip
+# batch_size: rows per Arrow record batch / Parquet row group
+# compression: codec of the Parquet column chunks
+
+COLUMNAR_EXPORTS = {
+    'chunk_size': 5000,
+    'batch_size': 10000,
+    'compression': 'zstd',
+}
+
+# Conditional GET on the genome / gene / peptide / stats endpoints
+# max_age: seconds a browser or a reverse proxy may serve a response without revalidating it
+
+CONDITIONAL_GET = {
+    'max_age': 60,
+}
+
+# Throughput time series (api/stats/throughput/)
+# max_range: longest range (days) served at each granularity
+
+THROUGHPUT = {
+    'max_range': {'HOUR': 31, 'DAY': 366},
+}
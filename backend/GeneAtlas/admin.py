@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
 from .models import (
     Genome, Gene, Peptide, GeneAnnotation, 
-    PeptideAnnotation, GeneAnnotationStatus, AsyncTasksCache
+    PeptideAnnotation, GeneAnnotationStatus, AsyncTasksCache, Notification,
+    AnnotationRevision, ThroughputRollup, ExportArtifact
 )
 from .forms import GenomeAdminForm
 
@@ -121,4 +122,32 @@ class AsyncTasksCacheAdmin(admin.ModelAdmin):
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
         }),
-    )
\ No newline at end of file
+    )
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ('recipient', 'gene', 'mail_type', 'status', 'created_at')
+    list_filter = ('mail_type', 'status')
+    search_fields = ('recipient__username', 'gene__name')
+    raw_id_fields = ('recipient', 'gene')
+
+@admin.register(AnnotationRevision)
+class AnnotationRevisionAdmin(admin.ModelAdmin):
+    list_display = ('gene', 'revision', 'peptide', 'created_at')
+    list_filter = ('genome',)
+    search_fields = ('gene__name', 'peptide')
+    readonly_fields = ('gene', 'genome', 'revision', 'peptide', 'changes', 'created_at')
+
+@admin.register(ThroughputRollup)
+class ThroughputRollupAdmin(admin.ModelAdmin):
+    list_display = ('granularity', 'bucket', 'genome', 'annotator', 'submitted', 'approved', 'rejected')
+    list_filter = ('granularity', 'genome')
+    search_fields = ('annotator__username',)
+    readonly_fields = ('granularity', 'bucket', 'genome', 'annotator', 'submitted', 'approved', 'rejected')
+
+@admin.register(ExportArtifact)
+class ExportArtifactAdmin(admin.ModelAdmin):
+    list_display = ('genome', 'format', 'version', 'size', 'created_at')
+    list_filter = ('format',)
+    search_fields = ('genome__name', 'version')
+    readonly_fields = ('genome', 'format', 'version', 'path', 'size', 'created_at')
@@ -5,4 +5,6 @@ class GeneatlasConfig(AppConfig):
     name = "GeneAtlas"
 
     def ready(self):
+        import GeneAtlas.pipelines
+        import GeneAtlas.exports
         import GeneAtlas.signals
\ No newline at end of file
@@ -0,0 +1,132 @@
+import math
+import signal
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .queues import get_queue
+
+# Key under which the autoscaler publishes its last decision in the queue storage
+METRICS_KEY = "autoscale"
+
+
+class QueueAutoscaler:
+    """Keeps between min and max consumer processes running for a named queue,
+    based on the queue depth and the age of the task at the head of the queue"""
+
+    # Decisions taken by the autoscaler
+    up = "UP"
+    down = "DOWN"
+    hold = "HOLD"
+
+    def __init__(self, name: str, cooldown: float = 60.0):
+        config = settings.HUEY_QUEUES[name].get("autoscale", {})
+        self.name = name
+        self.huey = get_queue(name)
+        self.min = config.get("min", 1)
+        self.max = config.get("max", 1)
+        # Number of waiting tasks a single consumer process is expected to absorb
+        self.target_depth = config.get("target_depth", 10)
+        # Waiting time (seconds) of the head task after which capacity is added
+        self.max_age = config.get("max_age", 60)
+        # Number of pending tasks inspected to estimate the head age
+        self.sample_size = config.get("sample_size", 50)
+        self.cooldown = cooldown
+        self.last_change = 0.0
+        # Running consumers as (process, periodic) tuples, the first one enqueues periodic tasks
+        self.processes = []
+        # Consumers finishing their in-flight tasks before exiting
+        self.draining = []
+        # Time at which a pending task id was first seen at the head of the queue
+        self.first_seen = {}
+
+    # Used to start a consumer process, only one consumer per queue schedules periodic tasks
+    def spawn(self):
+        periodic = not any(p for _, p in self.processes)
+        command = [sys.executable, "manage.py", "run_queue", self.name]
+        if not periodic:
+            command.append("--no-periodic")
+        self.processes.append((subprocess.Popen(command, cwd=settings.BASE_DIR), periodic))
+
+    # Used to stop a consumer gracefully, SIGINT lets huey finish the running tasks
+    def drain(self):
+        # Keep the periodic consumer as long as possible
+        index = next((i for i in range(len(self.processes) - 1, -1, -1) if not self.processes[i][1]), len(self.processes) - 1)
+        process, _ = self.processes.pop(index)
+        process.send_signal(signal.SIGINT)
+        self.draining.append(process)
+
+    # Used to forget consumers that exited
+    def reap(self):
+        self.processes = [(p, periodic) for p, periodic in self.processes if p.poll() is None]
+        self.draining = [p for p in self.draining if p.poll() is None]
+
+    # Used to measure the queue depth and the age of the head task
+    def sample(self) -> tuple:
+        now = time.monotonic()
+        depth = self.huey.pending_count()
+        head = [t.id for t in self.huey.pending(limit=self.sample_size)] if depth else []
+        self.first_seen = {key: self.first_seen.get(key, now) for key in head}
+        age = now - min(self.first_seen.values()) if self.first_seen else 0.0
+        return depth, age
+
+    # Used to compute the number of consumer processes wanted for a depth and head age
+    def desired(self, depth: int, age: float) -> int:
+        current = len(self.processes)
+        wanted = math.ceil(depth / self.target_depth) if self.target_depth else current
+        if age > self.max_age:
+            wanted = max(wanted, current + 1)
+        elif depth > 0:
+            # Never give up capacity while tasks are still waiting
+            wanted = max(wanted, current)
+        return max(self.min, min(self.max, wanted))
+
+    def step(self) -> dict:
+        self.reap()
+        # Replace crashed consumers without waiting for the cooldown
+        while len(self.processes) < self.min:
+            self.spawn()
+        depth, age = self.sample()
+        current = len(self.processes)
+        wanted = self.desired(depth, age)
+        decision = QueueAutoscaler.hold
+        if wanted != current and time.monotonic() - self.last_change >= self.cooldown:
+            if wanted > current:
+                decision = QueueAutoscaler.up
+                for _ in range(wanted - current):
+                    self.spawn()
+            else:
+                # Scale down one process at a time
+                decision = QueueAutoscaler.down
+                self.drain()
+            self.last_change = time.monotonic()
+        metrics = {"queue": self.name,
+                   "decision": decision,
+                   "processes": len(self.processes),
+                   "draining": len(self.draining),
+                   "workers_per_process": settings.HUEY_QUEUES[self.name].get("consumer", {}).get("workers", 1),
+                   "depth": depth,
+                   "head_age": round(age, 3),
+                   "min": self.min,
+                   "max": self.max,
+                   "timestamp": timezone.now().isoformat()}
+        self.huey.put(METRICS_KEY, metrics)
+        return metrics
+
+    def shutdown(self):
+        while self.processes:
+            self.drain()
+        for process in self.draining:
+            process.wait()
+        self.draining = []
+
+    # Used to read the last decision published for a queue
+    def metrics(name: str) -> dict:
+        huey = get_queue(name)
+        metrics = huey.get(METRICS_KEY, peek=True) or {}
+        # Depth is always read live
+        metrics.update({"queue": name, "depth": huey.pending_count(), "scheduled": huey.scheduled_count()})
+        return metrics
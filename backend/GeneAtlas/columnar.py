@@ -0,0 +1,173 @@
+from django.conf import settings
+
+from .models import Gene, GeneAnnotation, GeneAnnotationStatus, Genome, Peptide
+
+# Arrow is optional, the columnar exports are disabled without it
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Columnar exports
+# The gene, peptide and annotation tables are read in chunks with values_list and written as Arrow record batches,
+# either as an Arrow IPC stream or as a Parquet file (one row group per batch),
+# so that memory holds a single batch whatever the size of the table.
+# Genome and status columns are dictionary-encoded, dataframes load them as categoricals.
+
+# Columns of each table: name -> (ORM lookup, Arrow type)
+# "genome" and "status" are dictionary-encoded strings, the other types are pyarrow type factories
+TABLES = {
+    "gene": {
+        "model": Gene,
+        "columns": {
+            "name": ("name", "string"),
+            "genome": ("genome", "genome"),
+            "start": ("start", "int64"),
+            "end": ("end", "int64"),
+            "length": ("length", "int64"),
+            "gc_content": ("gc_content", "float64"),
+            "annotated": ("annotated", "bool_"),
+            "status": ("geneannotationstatus__status", "status"),
+            "sequence": ("sequence", "large_string"),
+        },
+    },
+    "peptide": {
+        "model": Peptide,
+        "columns": {
+            "name": ("name", "string"),
+            "gene": ("gene", "string"),
+            "genome": ("gene__genome", "genome"),
+            "length": ("length", "int64"),
+            "transcript": ("peptideannotation__transcript", "string"),
+            "sequence": ("sequence", "large_string"),
+        },
+    },
+    "annotation": {
+        "model": GeneAnnotation,
+        "columns": {
+            "gene": ("gene_instance", "string"),
+            "genome": ("gene_instance__genome", "genome"),
+            "strand": ("strand", "int8"),
+            "gene_name": ("gene", "string"),
+            "gene_biotype": ("gene_biotype", "string"),
+            "transcript_biotype": ("transcript_biotype", "string"),
+            "gene_symbol": ("gene_symbol", "string"),
+            "description": ("description", "string"),
+            "is_current": ("is_current", "bool_"),
+            "status": ("status__status", "status"),
+        },
+    },
+}
+
+# Media type and file extension of each output
+OUTPUTS = {
+    "arrow": ("application/vnd.apache.arrow.stream", "arrow"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+class Sink:
+    """Write-only file collecting the bytes written by Arrow until they are drained"""
+
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    # Used to get the chunks written since the last drain
+    def drain(self) -> list:
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+# Used to know if the columnar exports are available
+def available() -> bool:
+    return pyarrow is not None
+
+# Used to check the requested columns of a table, all of them by default
+def columns(table: str, fields: list = None) -> list:
+    known = list(TABLES[table]["columns"])
+    if not fields:
+        return known
+    unknown = [field for field in fields if field not in known]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}.")
+    return fields
+
+# Used to build the Arrow schema of columns of a table
+def schema(table: str, fields: list):
+    types = []
+    for field in fields:
+        type_name = TABLES[table]["columns"][field][1]
+        if type_name in ("genome", "status"):
+            types.append(pyarrow.field(field, pyarrow.dictionary(pyarrow.int32(), pyarrow.string())))
+        else:
+            types.append(pyarrow.field(field, getattr(pyarrow, type_name)()))
+    return pyarrow.schema(types)
+
+# Used to read a table as record batches of COLUMNAR_EXPORTS["batch_size"] rows
+# Dictionaries only grow, the indices of a batch stay valid in the next ones
+def batches(table: str, fields: list, genome: str = None):
+    config = TABLES[table]
+    target = schema(table, fields)
+    lookups = [config["columns"][field][0] for field in fields]
+    dictionaries = {"genome": {name: i for i, name in enumerate(Genome.objects.order_by("name").values_list("name", flat=True))},
+                    "status": {status: i for i, (status, _) in enumerate(GeneAnnotationStatus.STATUS_CHOICES)}}
+    query = config["model"].objects.all()
+    if genome is not None:
+        query = query.filter(**{config["columns"]["genome"][0]: genome})
+    query = query.order_by("pk").values_list(*lookups)
+
+    def _batch(rows: list):
+        arrays = []
+        for field, values in zip(target, zip(*rows)):
+            type_name = config["columns"][field.name][1]
+            if type_name in dictionaries:
+                index = dictionaries[type_name]
+                indices = pyarrow.array([None if v is None else index.setdefault(v, len(index)) for v in values], pyarrow.int32())
+                arrays.append(pyarrow.DictionaryArray.from_arrays(indices, pyarrow.array(list(index), pyarrow.string())))
+            else:
+                arrays.append(pyarrow.array(values, field.type))
+        return pyarrow.RecordBatch.from_arrays(arrays, schema=target)
+
+    rows = []
+    for row in query.iterator(chunk_size=settings.COLUMNAR_EXPORTS["chunk_size"]):
+        rows.append(row)
+        if len(rows) == settings.COLUMNAR_EXPORTS["batch_size"]:
+            yield _batch(rows)
+            rows = []
+    if rows:
+        yield _batch(rows)
+
+# Used to write a table as an Arrow IPC stream or a Parquet file, yields the bytes as soon as a batch is written
+# An empty table gives a valid file with the schema only
+def stream(table: str, output: str, fields: list = None, genome: str = None):
+    fields = columns(table, fields)
+    target = schema(table, fields)
+    sink = Sink()
+    if output == "parquet":
+        writer = pyarrow.parquet.ParquetWriter(sink, target, compression=settings.COLUMNAR_EXPORTS["compression"])
+    else:
+        writer = pyarrow.ipc.new_stream(sink, target)
+    yield from sink.drain()
+    for batch in batches(table, fields, genome):
+        writer.write_batch(batch)
+        yield from sink.drain()
+    writer.close()
+    yield from sink.drain()
@@ -1,5 +1,9 @@
+from datetime import datetime
 from functools import wraps
+from hashlib import sha1
 
+from django.conf import settings
+from django.utils.http import http_date, parse_http_date_safe
 from rest_framework import status
 from rest_framework.response import Response
 
@@ -15,4 +19,44 @@ def validator_only():
             else:
                 return Response({'error': f'User with role {request.user.role} cannot perform this action'}, status=status.HTTP_403_FORBIDDEN)
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
+
+# Used to build the validators and the cache headers of a response
+def cache_headers(etag: str, modified: datetime) -> dict:
+    return {"ETag": f'"{etag}"',
+            "Last-Modified": http_date(modified.timestamp()),
+            "Cache-Control": f"public, max-age={settings.CONDITIONAL_GET['max_age']}"}
+
+# Used to know if the copy of the client is still valid, If-None-Match takes precedence over If-Modified-Since
+# ETags are compared weakly, compressed responses carry weak ETags
+def not_modified(request, headers: dict) -> bool:
+    match = request.headers.get("If-None-Match", None)
+    if match is not None:
+        return match.strip() == "*" or headers["ETag"] in [tag.strip().removeprefix("W/") for tag in match.split(",")]
+    since = parse_http_date_safe(request.headers.get("If-Modified-Since", None))
+    return since is not None and parse_http_date_safe(headers["Last-Modified"]) <= since
+
+def conditional_get(validator):
+    """Answers 304 Not Modified when the copy of the client is still valid
+    / adds the validators and the cache headers to the successful responses
+    / validator returns the ETag value and the modification date of the data served
+    / the query string is folded into the ETag, the tag is only sent with a successful response
+    so a matching one was served for the same (valid) parameters over the same data"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(obj, request, *args, **kwargs):
+            etag, modified = validator()
+            # Sorted so that the order of the parameters does not matter
+            query = "&".join(sorted(request.META.get("QUERY_STRING", "").split("&")))
+            if query:
+                etag = f"{etag}-{sha1(query.encode()).hexdigest()[:12]}"
+            headers = cache_headers(etag, modified)
+            if not_modified(request, headers):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+            response = func(obj, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                for header, value in headers.items():
+                    response[header] = value
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,180 @@
+import gzip
+import io
+import os
+from pathlib import Path
+
+from Bio import SeqIO
+from Bio.Seq import Seq
+from Bio.SeqFeature import SeqFeature, SimpleLocation
+from Bio.SeqRecord import SeqRecord
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from huey import crontab
+from huey.exceptions import TaskLockedException
+
+from .models import ExportArtifact, Gene, GeneAnnotation, Genome, Peptide, PeptideAnnotation
+from .queues import CPU_BOUND, db_periodic_task, db_task
+
+# Exports
+# Gzipped FASTA / GFF3 / GenBank files of the annotations of each genome, built in the background.
+# Files are keyed by the data version of their genome (see ExportArtifact.data_version),
+# a genome whose genes and annotations did not change is never rebuilt.
+# A file is written next to its final path and moved in place once complete,
+# so that a file being served is never modified.
+
+# Annotation fields written to the exports, in the order of the loaded FASTA headers
+ANNOTATION_FIELDS = ["gene", "gene_biotype", "transcript_biotype", "gene_symbol", "description"]
+
+# Placeholder values of the annotations, left out of the exports
+PLACEHOLDERS = {field: GeneAnnotation._meta.get_field(field).default for field in ANNOTATION_FIELDS}
+PLACEHOLDERS["transcript"] = PeptideAnnotation._meta.get_field("transcript").default
+
+
+# Used to read the genes of a genome with their annotation, in chunks and ordered by position
+def genes(genome: str):
+    columns = ["name", "header", "sequence", "start", "end", "geneannotation__strand", *(f"geneannotation__{field}" for field in ANNOTATION_FIELDS)]
+    query = Gene.objects.filter(genome=genome).order_by("start", "name").values_list(*columns)
+    for name, header, sequence, start, end, strand, *values in query.iterator(chunk_size=settings.EXPORTS["chunk_size"]):
+        yield {"name": name, "header": header.lstrip(">"), "sequence": sequence,
+               "start": min(start, end), "end": max(start, end), "strand": strand,
+               "annotation": {field: value for field, value in zip(ANNOTATION_FIELDS, values) if value and value != PLACEHOLDERS[field]}}
+
+# Used to read the peptides of a genome with their transcript, grouped by gene
+def peptides(genome: str) -> dict:
+    grouped = {}
+    query = Peptide.objects.filter(gene__genome=genome).order_by("name").values_list("gene", "name", "sequence", "peptideannotation__transcript")
+    for gene, name, sequence, transcript in query.iterator(chunk_size=settings.EXPORTS["chunk_size"]):
+        grouped.setdefault(gene, []).append({"name": name, "sequence": sequence,
+                                             "transcript": transcript if transcript and transcript != PLACEHOLDERS["transcript"] else None})
+    return grouped
+
+# FASTA: gene sequences, headers as loaded followed by the current annotation (key:value pairs)
+def write_fasta(handle, genome: str):
+    width = settings.DOWNLOADS["fasta_width"]
+    for gene in genes(genome):
+        header = gene["header"] if gene["header"].split(" ", 1)[0] == gene["name"] else f"{gene['name']} {gene['header']}"
+        handle.write(" ".join([f">{header}", *(f"{field}:{value}" for field, value in gene["annotation"].items())]) + "\n")
+        for start in range(0, len(gene["sequence"]), width):
+            handle.write(gene["sequence"][start:start + width] + "\n")
+
+# Used to escape the reserved characters of a GFF3 column
+def _escape(value) -> str:
+    return str(value).translate({ord(c): f"%{ord(c):02X}" for c in "%;=&,\t\n\r"})
+
+# GFF3: one gene feature per gene, one CDS feature per peptide
+def write_gff3(handle, genome: str):
+    length = Genome.objects.filter(pk=genome).values_list("length", flat=True).first()
+    seqid = _escape(genome)
+    handle.write(f"##gff-version 3\n##sequence-region {seqid} 1 {length}\n")
+    grouped = peptides(genome)
+    for gene in genes(genome):
+        strand = {1: "+", -1: "-"}.get(gene["strand"], ".")
+        attributes = [f"ID={_escape(gene['name'])}", *(f"{field}={_escape(value)}" for field, value in gene["annotation"].items())]
+        if "gene_symbol" in gene["annotation"]:
+            attributes.insert(1, f"Name={_escape(gene['annotation']['gene_symbol'])}")
+        handle.write(f"{seqid}\tGeneAtlas\tgene\t{gene['start']}\t{gene['end']}\t.\t{strand}\t.\t{';'.join(attributes)}\n")
+        for peptide in grouped.get(gene["name"], []):
+            attributes = [f"ID={_escape(peptide['name'])}", f"Parent={_escape(gene['name'])}"]
+            if peptide["transcript"]:
+                attributes.append(f"transcript={_escape(peptide['transcript'])}")
+            handle.write(f"{seqid}\tGeneAtlas\tCDS\t{gene['start']}\t{gene['end']}\t.\t{strand}\t0\t{';'.join(attributes)}\n")
+
+# GenBank qualifiers of the annotation fields, the other fields are written as notes
+GENBANK_QUALIFIERS = {"gene_symbol": "gene", "gene": "gene_synonym", "description": "product"}
+
+# GenBank: the genome sequence with a gene feature per gene and a CDS feature (with its translation) per peptide
+# The record is built in memory, Biopython writes a record at once
+def write_genbank(handle, genome: str):
+    genome_obj = Genome.objects.get(pk=genome)
+    record = SeqRecord(Seq(genome_obj.get_sequence()), id=genome, name=genome, description=genome_obj.header.lstrip(">"),
+                       annotations={"molecule_type": "DNA", "organism": genome_obj.species})
+    grouped = peptides(genome)
+    for gene in genes(genome):
+        location = SimpleLocation(gene["start"] - 1, gene["end"], strand=gene["strand"] if gene["strand"] in (1, -1) else None)
+        annotation = gene["annotation"]
+        qualifiers = {"locus_tag": [gene["name"]]}
+        qualifiers.update({qualifier: [annotation[field]] for field, qualifier in GENBANK_QUALIFIERS.items() if field in annotation})
+        notes = [f"{field}:{annotation[field]}" for field in ANNOTATION_FIELDS if field in annotation and field not in GENBANK_QUALIFIERS]
+        if notes:
+            qualifiers["note"] = notes
+        record.features.append(SeqFeature(location, type="gene", qualifiers=qualifiers))
+        for peptide in grouped.get(gene["name"], []):
+            qualifiers = {"locus_tag": [gene["name"]], "protein_id": [peptide["name"]], "translation": [peptide["sequence"]]}
+            if peptide["transcript"]:
+                qualifiers["transcript_id"] = [peptide["transcript"]]
+            record.features.append(SeqFeature(location, type="CDS", qualifiers=qualifiers))
+    SeqIO.write(record, handle, "genbank")
+
+WRITERS = {
+    ExportArtifact.FASTA: write_fasta,
+    ExportArtifact.GFF3: write_gff3,
+    ExportArtifact.GENBANK: write_genbank,
+}
+
+# Used to write the export of a genome in a format and point its artifact to the new file
+def build(genome: str, export_format: str, version: str) -> ExportArtifact:
+    path = f"{version}.{ExportArtifact.EXTENSIONS[export_format]}.gz"
+    target = Path(settings.EXPORTS["root"]) / path
+    target.parent.mkdir(parents=True, exist_ok=True)
+    partial = target.with_name(target.name + ".part")
+    # mtime is fixed so that the same data always gives the same file
+    with gzip.GzipFile(partial, mode="wb", compresslevel=settings.EXPORTS["level"], mtime=0) as compressed:
+        with io.TextIOWrapper(compressed, encoding="utf-8", newline="\n") as handle:
+            WRITERS[export_format](handle, genome)
+    os.replace(partial, target)
+    previous = ExportArtifact.objects.filter(genome=genome, format=export_format).values_list("path", flat=True).first()
+    artifact, _ = ExportArtifact.objects.update_or_create(genome_id=genome, format=export_format,
+                                                          defaults={"version": version, "path": path, "size": target.stat().st_size,
+                                                                    "created_at": timezone.now()})
+    if previous is not None and previous != path:
+        ExportArtifact.discard(previous)
+    return artifact
+
+# Used to know if the exports of a genome are missing or older than its data
+def stale(genome: str, version: str) -> bool:
+    built = ExportArtifact.objects.filter(genome=genome, version=version).values_list("format", flat=True)
+    return set(built) != set(WRITERS)
+
+# Used to queue the build of the exports of a genome once per data version
+# The flag is cleared when the build fails for good and expires in case the build is lost
+def queue_build(genome: str, version: str) -> bool:
+    if not cache.add(f"exports:{genome}:{version}", True, timeout=settings.EXPORTS["lock_timeout"]):
+        return False
+    build_exports(genome, version)
+    return True
+
+# Used to build the missing / outdated exports of a genome
+# Builds of the same genome are serialised by a lock expiring on its own if the worker dies,
+# a build finding the lock taken is retried later and then finds the exports up to date
+# Data changed while building is picked up by the next refresh, as the version is read first
+@db_task(CPU_BOUND, retries=settings.EXPORTS["retries"], retry_delay=settings.EXPORTS["retry_delay"], context=True)
+def build_exports(genome: str, queued: str = None, task=None) -> str:
+    lock = f"exports:lock:{genome}"
+    try:
+        if not cache.add(lock, True, timeout=settings.EXPORTS["lock_timeout"]):
+            raise TaskLockedException(f"unable to acquire lock {lock}")
+        try:
+            version = ExportArtifact.data_version(genome)
+            built = set(ExportArtifact.objects.filter(genome=genome, version=version).values_list("format", flat=True))
+            for export_format in WRITERS:
+                if export_format not in built:
+                    build(genome, export_format, version)
+            return version
+        finally:
+            cache.delete(lock)
+    except Exception:
+        # Last attempt, the next refresh may queue the build again
+        if queued is not None and (task is None or not task.retries):
+            cache.delete(f"exports:{genome}:{queued}")
+        raise
+
+# Used to queue the builds of the genomes whose data changed since their exports were built
+@db_periodic_task(CPU_BOUND, crontab(minute=settings.EXPORTS["refresh"]))
+def refresh_exports() -> int:
+    queued = 0
+    for genome in Genome.objects.order_by("name").values_list("name", flat=True):
+        version = ExportArtifact.data_version(genome)
+        if stale(genome, version) and queue_build(genome, version):
+            queued += 1
+    return queued
@@ -0,0 +1,40 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from GeneAtlas.autoscale import QueueAutoscaler
+from GeneAtlas.queues import QUEUES
+
+
+class Command(BaseCommand):
+    help = 'Run and autoscale the consumers of the named huey queues'
+
+    def add_arguments(self, parser):
+        parser.add_argument('queues', nargs='*', choices=list(QUEUES.keys()), help='Queues to manage (default: all)')
+        parser.add_argument('--interval', type=float, default=None, help='Seconds between two scaling decisions')
+        parser.add_argument('--cooldown', type=float, default=None, help='Minimum seconds between two changes of the same queue')
+
+    def handle(self, *args, **kwargs):
+
+        config = getattr(settings, 'HUEY_AUTOSCALE', {})
+        interval = kwargs['interval'] or config.get('interval', 10)
+        cooldown = kwargs['cooldown'] or config.get('cooldown', 60)
+
+        scalers = [QueueAutoscaler(name, cooldown=cooldown) for name in (kwargs['queues'] or QUEUES.keys())]
+
+        self.stdout.write(f"Autoscaling queues {', '.join(s.name for s in scalers)} every {interval}s...", ending="\n")
+
+        try:
+            while True:
+                for scaler in scalers:
+                    metrics = scaler.step()
+                    if metrics['decision'] != QueueAutoscaler.hold:
+                        self.stdout.write(json.dumps(metrics))
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            self.stdout.write("Draining consumers...")
+        finally:
+            for scaler in scalers:
+                scaler.shutdown()
@@ -0,0 +1,60 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from GenAnnot.middleware import Encoder
+from GenAnnot.renderers import ORJSONRenderer
+from GeneAtlas.models import Gene
+from GeneAtlas.serializers import GeneSerializer
+
+
+class Command(BaseCommand):
+    help = 'Measure the rendering and the compression of a gene listing payload'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--genes', type=int, default=10000, help='Number of genes in the payload')
+        parser.add_argument('--length', type=int, default=1000, help='Length of the gene sequences')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of runs, the best one is reported')
+
+    # Used to time a function, returns the best time (ms) and the last result
+    def best(self, function, repeat: int) -> tuple:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = function()
+            times.append((time.perf_counter() - start) * 1000)
+        return min(times), result
+
+    def handle(self, *args, **kwargs):
+
+        # Genes are built in memory, the database is not used
+        rng = random.Random(0)
+        genes = [Gene(name=f"BCH{i}", genome_id="benchmark", start=i * kwargs['length'], end=(i + 1) * kwargs['length'] - 1,
+                      header=f">BCH{i} benchmark", sequence="".join(rng.choice("ACGT") for _ in range(kwargs['length'])),
+                      length=kwargs['length'], gc_content=0.5, annotated=False)
+                 for i in range(kwargs['genes'])]
+
+        self.stdout.write(f"Payload: {kwargs['genes']} genes of {kwargs['length']} nt")
+
+        elapsed, data = self.best(lambda: GeneSerializer(genes, many=True).data, kwargs['repeat'])
+        self.stdout.write(f"  serializer      {elapsed:9.1f} ms")
+
+        rendered = {}
+        for name, renderer in [("json", JSONRenderer()), ("orjson", ORJSONRenderer())]:
+            elapsed, rendered[name] = self.best(lambda: renderer.render(data), kwargs['repeat'])
+            self.stdout.write(f"  render {name:<8} {elapsed:9.1f} ms  {len(rendered[name]):>12,} bytes")
+
+        self.stdout.write(f"  identical output: {rendered['json'] == rendered['orjson']}")
+
+        content = rendered["orjson"]
+        for name, level in settings.COMPRESSION['encodings'].items():
+            encoder = Encoder(name, level)
+            if not encoder.available():
+                self.stdout.write(f"  {name:<15} not installed")
+                continue
+            elapsed, compressed = self.best(lambda: encoder.compress(content), kwargs['repeat'])
+            self.stdout.write(f"  {name + ' ' + str(level):<15} {elapsed:9.1f} ms  {len(compressed):>12,} bytes"
+                              f"  ratio {len(content) / len(compressed):.1f}x")
@@ -0,0 +1,37 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from GeneAtlas.models import AnnotationRevision, Genome
+
+
+class Command(BaseCommand):
+    help = 'Export a snapshot of the annotations of a genome, as of a date'
+
+    def add_arguments(self, parser):
+        parser.add_argument('genome', help='Name of the genome')
+        parser.add_argument('--as-of', default=None, help='ISO date of the snapshot (default: now)')
+        parser.add_argument('--output', default=None, help='JSON file to write (default: stdout)')
+
+    def handle(self, *args, **kwargs):
+
+        if not Genome.objects.filter(name=kwargs['genome']).exists():
+            raise CommandError(f"Genome {kwargs['genome']} not found.")
+
+        as_of = None
+        if kwargs['as_of']:
+            as_of = parse_datetime(kwargs['as_of'])
+            if as_of is None:
+                raise CommandError(f"Invalid date {kwargs['as_of']}.")
+
+        snapshot = {"genome": kwargs['genome'],
+                    "as_of": as_of.isoformat() if as_of else None,
+                    "annotations": AnnotationRevision.as_of(kwargs['genome'], as_of)}
+
+        if kwargs['output']:
+            with open(kwargs['output'], 'w') as output:
+                json.dump(snapshot, output)
+            self.stdout.write(f"{len(snapshot['annotations'])} annotation(s) exported to {kwargs['output']}")
+        else:
+            self.stdout.write(json.dumps(snapshot))
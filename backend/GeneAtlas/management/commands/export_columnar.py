@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from GeneAtlas import columnar
+
+
+class Command(BaseCommand):
+    help = 'Export the gene, peptide or annotation table as an Arrow IPC stream or a Parquet file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', choices=list(columnar.TABLES), help='Table to export')
+        parser.add_argument('output', help='File to write')
+        parser.add_argument('--format', choices=list(columnar.OUTPUTS), default=None,
+                            help='Format of the file (default: from the extension of the output, arrow otherwise)')
+        parser.add_argument('--fields', default=None, help='Comma-separated columns to export (default: all)')
+        parser.add_argument('--genome', default=None, help='Only export the rows of this genome')
+
+    def handle(self, *args, **kwargs):
+
+        if not columnar.available():
+            raise CommandError("Columnar exports require pyarrow.")
+
+        output = kwargs['format'] or ("parquet" if kwargs['output'].endswith(".parquet") else "arrow")
+        try:
+            fields = columnar.columns(kwargs['table'], kwargs['fields'].split(",") if kwargs['fields'] else None)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        size = 0
+        with open(kwargs['output'], 'wb') as file:
+            for chunk in columnar.stream(kwargs['table'], output, fields, kwargs['genome']):
+                file.write(chunk)
+                size += len(chunk)
+
+        self.stdout.write(f"{kwargs['table']} exported to {kwargs['output']} ({output}, {size:,} bytes)")
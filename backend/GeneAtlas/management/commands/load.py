@@ -5,7 +5,7 @@ from pathlib import Path
 from Bio import SeqIO
 from django.core.management.base import BaseCommand
 from django.db import transaction
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 
 from AccessControl.models import CustomUser
 from GeneAtlas.models import (
@@ -15,8 +15,18 @@ from GeneAtlas.models import (
     Genome,
     Peptide,
     PeptideAnnotation,
+    StatsSnapshot,
+)
+from GeneAtlas.signals import (
+    create_gene_status,
+    record_throughput,
+    release_genome_status,
+    release_stats,
+    update_gene_stats,
+    update_genome_stats,
+    update_genome_status,
+    update_peptide_stats,
 )
-from GeneAtlas.signals import create_gene_status, update_genome_status
 
 
 class Command(BaseCommand):
@@ -81,12 +91,20 @@ class Command(BaseCommand):
         try:
             with transaction.atomic():
 
+                # Counters and statistics are recomputed once everything is loaded
+                post_delete.disconnect(release_genome_status, sender=GeneAnnotationStatus)
+                for model, receiver in [(Genome, update_genome_stats), (Gene, update_gene_stats), (Peptide, update_peptide_stats)]:
+                    post_save.disconnect(receiver, sender=model)
+                    post_delete.disconnect(release_stats, sender=model)
+
                 Genome.objects.all().delete()
                 Gene.objects.all().delete()
                 Peptide.objects.all().delete()
                 GeneAnnotation.objects.all().delete()
 
+                # Loaded annotations are not counted in the throughput rollups
                 post_save.disconnect(create_gene_status, sender=Gene)
+                post_save.disconnect(record_throughput, sender=GeneAnnotationStatus)
                 post_save.disconnect(update_genome_status, sender=GeneAnnotationStatus)
 
                 for genome_file in genomes_files:
@@ -130,8 +148,15 @@ class Command(BaseCommand):
                         if(len(kwargs_description[1]) > 0):
                             PeptideAnnotation(peptide = Peptide.objects.get(name = seq_record.id), annotation = GeneAnnotation.objects.get(gene_instance = gene_instance), transcript = (kwargs_description[1])["transcript"]).save()
 
+                StatsSnapshot.reconcile()
+
             post_save.connect(create_gene_status, sender=Gene)
+            post_save.connect(record_throughput, sender=GeneAnnotationStatus)
             post_save.connect(update_genome_status, sender=GeneAnnotationStatus)
+            post_delete.connect(release_genome_status, sender=GeneAnnotationStatus)
+            for model, receiver in [(Genome, update_genome_stats), (Gene, update_gene_stats), (Peptide, update_peptide_stats)]:
+                post_save.connect(receiver, sender=model)
+                post_delete.connect(release_stats, sender=model)
 
             self.stdout.write("Data loaded successfully...")
         
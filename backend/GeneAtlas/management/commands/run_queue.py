@@ -0,0 +1,49 @@
+import logging
+
+from django.core.management.base import CommandError
+from django.utils.module_loading import autodiscover_modules
+from huey.consumer_options import ConsumerConfig
+from huey.contrib.djhuey.management.commands.run_huey import Command as RunHueyCommand
+
+from GeneAtlas.queues import QUEUES, consumer_options, get_queue
+
+
+class Command(RunHueyCommand):
+    help = 'Run the consumer of a named huey queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('queue', choices=list(QUEUES.keys()), help='Name of the queue to consume')
+        super().add_arguments(parser)
+
+    def handle(self, *args, **options):
+
+        name = options.pop('queue')
+
+        try:
+            huey = get_queue(name)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        # Options from the command line take precedence over the settings
+        options_consumer = consumer_options(name)
+        for key, value in options.items():
+            if key in ConsumerConfig._fields and value is not None:
+                options_consumer[key] = value
+        if options.get('huey_verbose', None) is not None:
+            options_consumer['verbose'] = options['huey_verbose']
+
+        if not options.get('disable_autoload'):
+            autodiscover_modules("tasks")
+
+        logger = logging.getLogger('huey')
+
+        config = ConsumerConfig(**options_consumer)
+        config.validate()
+
+        if not logger.handlers:
+            config.setup_logger(logger)
+
+        self.stdout.write(f"Consuming queue {name} with {config.workers} {config.worker_type} worker(s)...")
+
+        consumer = huey.create_consumer(**config.values)
+        consumer.run()
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-19 14:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("GeneAtlas", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="asynctaskscache",
+            name="queue",
+            field=models.CharField(default="remote-io", max_length=50),
+        ),
+    ]
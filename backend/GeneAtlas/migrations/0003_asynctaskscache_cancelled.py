@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-19 14:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("GeneAtlas", "0002_asynctaskscache_queue"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="asynctaskscache",
+            name="state",
+            field=models.CharField(choices=[("PENDING", "Pending"), ("IN_PROGRESS", "In Progress"), ("COMPLETED", "Completed"), ("REJECTED", "Rejected"), ("CANCELLED", "Cancelled")], default="PENDING", max_length=20),
+        ),
+    ]
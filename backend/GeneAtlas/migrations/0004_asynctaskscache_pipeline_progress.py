@@ -0,0 +1,33 @@
+# Generated by Django 5.1.3 on 2026-10-19 15:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("GeneAtlas", "0003_asynctaskscache_cancelled"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="asynctaskscache",
+            name="items_done",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="asynctaskscache",
+            name="items_failed",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="asynctaskscache",
+            name="items_total",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="asynctaskscache",
+            name="next_batch",
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.1.3 on 2026-10-19 15:04
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_statuses(apps, schema_editor):
+    Genome = apps.get_model("GeneAtlas", "Genome")
+    GeneAnnotationStatus = apps.get_model("GeneAtlas", "GeneAnnotationStatus")
+    counters = {"RAW": "genes_raw", "ONGOING": "genes_ongoing", "PENDING": "genes_pending",
+                "APPROVED": "genes_approved", "REJECTED": "genes_rejected"}
+    counts = {}
+    for row in GeneAnnotationStatus.objects.values("gene__genome", "status").annotate(count=Count("pk")).order_by():
+        counts.setdefault(row["gene__genome"], {})[row["status"]] = row["count"]
+    for genome, genome_counts in counts.items():
+        values = {field: genome_counts.get(status, 0) for status, field in counters.items()}
+        Genome.objects.filter(pk=genome).update(genes_total=sum(genome_counts.values()), **values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("GeneAtlas", "0004_asynctaskscache_pipeline_progress"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="genome",
+            name="genes_approved",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="genome",
+            name="genes_ongoing",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="genome",
+            name="genes_pending",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="genome",
+            name="genes_raw",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="genome",
+            name="genes_rejected",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="genome",
+            name="genes_total",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_statuses, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.3 on 2026-10-19 15:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("GeneAtlas", "0005_genome_annotation_counters"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Notification",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("mail_type", models.CharField(max_length=20)),
+                ("status", models.CharField(choices=[("RAW", "Raw"), ("ONGOING", "Ongoing"), ("PENDING", "Pending"), ("APPROVED", "Approved"), ("REJECTED", "Rejected")], max_length=20)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("gene", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="GeneAtlas.gene")),
+                ("recipient", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "constraints": [models.UniqueConstraint(fields=("recipient", "gene", "mail_type"), name="unique_notification_event")],
+            },
+        ),
+    ]
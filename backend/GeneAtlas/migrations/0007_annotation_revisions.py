@@ -0,0 +1,56 @@
+# Generated by Django 5.1.3 on 2026-10-19 15:11
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+GENE_FIELDS = ["strand", "gene", "gene_biotype", "transcript_biotype", "gene_symbol", "description"]
+
+
+def record_current_annotations(apps, schema_editor):
+    """The current annotations become the first revisions of their genes"""
+    GeneAnnotation = apps.get_model("GeneAtlas", "GeneAnnotation")
+    PeptideAnnotation = apps.get_model("GeneAtlas", "PeptideAnnotation")
+    AnnotationRevision = apps.get_model("GeneAtlas", "AnnotationRevision")
+    now = django.utils.timezone.now()
+    revisions, last = [], {}
+    for annotation in GeneAnnotation.objects.select_related("gene_instance").iterator(chunk_size=2000):
+        last[annotation.gene_instance_id] = (annotation.gene_instance.genome_id, 1)
+        revisions.append(AnnotationRevision(gene_id=annotation.gene_instance_id, genome_id=annotation.gene_instance.genome_id, revision=1,
+                                            changes={field: getattr(annotation, field) for field in GENE_FIELDS}, created_at=now))
+    for peptide in PeptideAnnotation.objects.iterator(chunk_size=2000):
+        if peptide.annotation_id not in last:
+            continue
+        genome, revision = last[peptide.annotation_id]
+        last[peptide.annotation_id] = (genome, revision + 1)
+        revisions.append(AnnotationRevision(gene_id=peptide.annotation_id, genome_id=genome, revision=revision + 1, peptide=peptide.peptide_id,
+                                            changes={"transcript": peptide.transcript}, created_at=now))
+    AnnotationRevision.objects.bulk_create(revisions, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("GeneAtlas", "0006_notification_outbox"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AnnotationRevision",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("revision", models.IntegerField()),
+                ("peptide", models.CharField(blank=True, max_length=100, null=True)),
+                ("changes", models.JSONField(default=dict)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("gene", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="GeneAtlas.gene")),
+                ("genome", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="GeneAtlas.genome")),
+            ],
+            options={
+                "indexes": [models.Index(fields=["genome", "created_at"], name="revision_genome_date_idx")],
+                "constraints": [models.UniqueConstraint(fields=("gene", "revision"), name="unique_annotation_revision")],
+            },
+        ),
+        migrations.RunPython(record_current_annotations, migrations.RunPython.noop),
+    ]
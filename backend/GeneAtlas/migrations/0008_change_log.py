@@ -0,0 +1,25 @@
+# Generated by Django 5.1.3 on 2026-10-19 15:13
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("GeneAtlas", "0007_annotation_revisions"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChangeLog",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("model", models.CharField(choices=[("gene", "Gene"), ("annotation", "Gene annotation"), ("status", "Annotation status")], max_length=20)),
+                ("key", models.CharField(max_length=100)),
+                ("action", models.CharField(choices=[("CREATED", "Created"), ("UPDATED", "Updated"), ("DELETED", "Deleted")], max_length=10)),
+                ("fields", models.JSONField(default=list)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
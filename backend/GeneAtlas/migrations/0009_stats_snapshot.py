@@ -0,0 +1,44 @@
+# Generated by Django 5.1.3 on 2026-10-19 15:15
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def compute_snapshot(apps, schema_editor):
+    Genome = apps.get_model("GeneAtlas", "Genome")
+    Gene = apps.get_model("GeneAtlas", "Gene")
+    Peptide = apps.get_model("GeneAtlas", "Peptide")
+    StatsSnapshot = apps.get_model("GeneAtlas", "StatsSnapshot")
+    genome = Genome.objects.aggregate(count=Count("pk"), length=Sum("length"))
+    gene = Gene.objects.aggregate(count=Count("pk"), length=Sum("length"), gc_content=Sum("gc_content"))
+    peptide = Peptide.objects.aggregate(count=Count("pk"), length=Sum("length"))
+    StatsSnapshot.objects.create(pk=1, genome_count=genome["count"], genome_length=genome["length"] or 0,
+                                 gene_count=gene["count"], gene_length=gene["length"] or 0, gene_gc_content=gene["gc_content"] or 0.0,
+                                 peptide_count=peptide["count"], peptide_length=peptide["length"] or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("GeneAtlas", "0008_change_log"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StatsSnapshot",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("version", models.BigIntegerField(default=0)),
+                ("genome_count", models.IntegerField(default=0)),
+                ("genome_length", models.BigIntegerField(default=0)),
+                ("gene_count", models.IntegerField(default=0)),
+                ("gene_length", models.BigIntegerField(default=0)),
+                ("gene_gc_content", models.FloatField(default=0.0)),
+                ("peptide_count", models.IntegerField(default=0)),
+                ("peptide_length", models.BigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(compute_snapshot, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.3 on 2026-10-19 15:19
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def count_last_transitions(apps, schema_editor):
+    # Only the last transition of each status is known, earlier ones are lost
+    GeneAnnotationStatus = apps.get_model("GeneAtlas", "GeneAnnotationStatus")
+    ThroughputRollup = apps.get_model("GeneAtlas", "ThroughputRollup")
+    counters = {"PENDING": "submitted", "APPROVED": "approved", "REJECTED": "rejected"}
+    rows = {}
+    statuses = GeneAnnotationStatus.objects.filter(status__in=counters).values_list("gene__genome", "annotator", "status", "validated_at", "updated_at", "created_at")
+    for genome, annotator, status, validated_at, updated_at, created_at in statuses.iterator():
+        date = timezone.localtime((validated_at if status == "APPROVED" else None) or updated_at or created_at)
+        hour = date.replace(minute=0, second=0, microsecond=0)
+        for granularity, bucket in (("HOUR", hour), ("DAY", hour.replace(hour=0))):
+            row = rows.setdefault((granularity, bucket, genome, annotator), ThroughputRollup(granularity=granularity, bucket=bucket, genome_id=genome, annotator_id=annotator))
+            setattr(row, counters[status], getattr(row, counters[status]) + 1)
+    ThroughputRollup.objects.bulk_create(rows.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("GeneAtlas", "0009_stats_snapshot"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ThroughputRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("granularity", models.CharField(choices=[("HOUR", "Hour"), ("DAY", "Day")], max_length=10)),
+                ("bucket", models.DateTimeField()),
+                ("submitted", models.IntegerField(default=0)),
+                ("approved", models.IntegerField(default=0)),
+                ("rejected", models.IntegerField(default=0)),
+                ("annotator", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ("genome", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="GeneAtlas.genome")),
+            ],
+            options={
+                "indexes": [models.Index(fields=["granularity", "bucket"], name="GeneAtlas_t_granula_3b5818_idx")],
+                "constraints": [models.UniqueConstraint(models.F("granularity"), models.F("bucket"), models.F("genome"), django.db.models.functions.comparison.Coalesce("annotator", models.Value(0)), name="unique_throughput_bucket")],
+            },
+        ),
+        migrations.RunPython(count_last_transitions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-19 15:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("GeneAtlas", "0010_throughput_rollups"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="asynctaskscache",
+            name="created_at",
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
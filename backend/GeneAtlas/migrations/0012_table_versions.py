@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-19 15:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("GeneAtlas", "0011_asynctaskscache_created_at_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="statssnapshot",
+            name="gene_version",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="statssnapshot",
+            name="genome_version",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="statssnapshot",
+            name="peptide_version",
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.3 on 2026-10-19 15:34
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("GeneAtlas", "0012_table_versions"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExportArtifact",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("format", models.CharField(choices=[("FASTA", "FASTA"), ("GFF3", "GFF3"), ("GENBANK", "GenBank")], max_length=10)),
+                ("version", models.CharField(max_length=64)),
+                ("path", models.CharField(max_length=255)),
+                ("size", models.BigIntegerField(default=0)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="changelog",
+            index=models.Index(fields=["key", "id"], name="changelog_key_idx"),
+        ),
+        migrations.AddField(
+            model_name="exportartifact",
+            name="genome",
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="GeneAtlas.genome"),
+        ),
+        migrations.AddConstraint(
+            model_name="exportartifact",
+            constraint=models.UniqueConstraint(fields=("genome", "format"), name="unique_export_artifact"),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-19 15:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("GeneAtlas", "0013_export_artifacts"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="changelog",
+            index=models.Index(fields=["model", "id"], name="changelog_model_idx"),
+        ),
+    ]
@@ -2,14 +2,18 @@ import uuid
 from datetime import datetime, timedelta
 from hashlib import sha256
 from json import dumps
+from pathlib import Path
 from zlib import compress, decompress
 
+import numpy
 from Bio.Seq import Seq
 from Bio.SeqUtils import gc_fraction
+from django.core.cache import cache
 from django.core.validators import RegexValidator
 from django.db import models, transaction
+from django.db.models import Case, Count, F, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from huey.contrib.djhuey import HUEY
 from rest_framework import status
 from rest_framework.response import Response
 
@@ -17,9 +21,49 @@ from AccessControl.models import CustomUser
 from GenAnnot import settings
 
 from .decorators import validator_only
+from .queues import REMOTE_IO, get_queue
 
 
-class Genome(models.Model):
+class TrackedModel(models.Model):
+    """Keeps the field values loaded from the database
+    / exposes the fields changed in memory since then"""
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {name: value for name, value in zip(field_names, values) if value is not models.DEFERRED}
+        return instance
+
+    # Used to know if the loaded value of a field is known (not deferred, instance not new)
+    def is_tracked(self, field: str) -> bool:
+        return self._meta.get_field(field).attname in getattr(self, "_loaded_values", {})
+
+    # Used to get the value of a field as it was loaded from the database
+    def loaded_value(self, field: str):
+        return getattr(self, "_loaded_values", {}).get(self._meta.get_field(field).attname)
+
+    # Used to get the names of the tracked fields changed in memory
+    def changed_fields(self) -> set:
+        loaded = getattr(self, "_loaded_values", {})
+        return {f.name for f in self._meta.concrete_fields if f.attname in loaded and getattr(self, f.attname) != loaded[f.attname]}
+
+    def has_changed(self, field: str) -> bool:
+        return field in self.changed_fields()
+
+    # The saved values become the loaded ones once the post_save signals have run
+    # Saving is atomic so that the rows written by the signals share the transaction
+    # Like Django's own saves no savepoint is taken inside a transaction, a failed save rolls back the enclosing one
+    def save(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+        deferred = self.get_deferred_fields()
+        self._loaded_values = {f.attname: getattr(self, f.attname) for f in self._meta.concrete_fields if f.attname not in deferred}
+
+
+class Genome(TrackedModel):
     name = models.CharField(max_length=100, unique=True, primary_key=True)
     species = models.CharField(max_length=100)
     header = models.TextField(blank=False, null=False, default=">Genome")
@@ -28,11 +72,78 @@ class Genome(models.Model):
     gc_content = models.FloatField(editable=False, default=0.0)
     annotation = models.BooleanField(default=False)
 
+    # Annotation status counters of the genes of the genome
+    # Kept up to date by the GeneAnnotationStatus signals (see update_counters)
+    genes_total = models.IntegerField(editable=False, default=0)
+    genes_raw = models.IntegerField(editable=False, default=0)
+    genes_ongoing = models.IntegerField(editable=False, default=0)
+    genes_pending = models.IntegerField(editable=False, default=0)
+    genes_approved = models.IntegerField(editable=False, default=0)
+    genes_rejected = models.IntegerField(editable=False, default=0)
+
+    # Counter field of each annotation status
+    COUNTERS = {
+        "RAW": "genes_raw",
+        "ONGOING": "genes_ongoing",
+        "PENDING": "genes_pending",
+        "APPROVED": "genes_approved",
+        "REJECTED": "genes_rejected",
+    }
+
+    # Used to apply status transitions to the counters of a genome in a single UPDATE
+    # deltas maps a status to the change of its counter, e.g. {"PENDING": -1, "APPROVED": 1}
+    # The genome is annotated once all of its genes are approved
+    # genome is the name of the genome, or a subquery selecting it
+    def update_counters(genome: str, deltas: dict, total: int = 0) -> int:
+        approved = deltas.get("APPROVED", 0)
+        changes = {Genome.COUNTERS[k]: F(Genome.COUNTERS[k]) + v for k, v in deltas.items() if v}
+        if not changes and not total:
+            return 0
+        # Expressions are evaluated against the values before the update
+        fully_approved = Q(genes_approved=F("genes_total") + (total - approved)) & Q(genes_total__gt=-total)
+        # The dashboard statistics and the genome listings follow the counters through the status change feed (see StatsSnapshot.get),
+        # every transition records its status change, the snapshot row is not updated
+        return Genome.objects.filter(pk=genome).update(genes_total=F("genes_total") + total,
+                                                       annotation=Case(When(fully_approved, then=True), default=False),
+                                                       **changes)
+
+    # Used to recompute the counters from the statuses (after a bulk load for instance), returns True when some had drifted
+    # The genome rows are locked (in name order) before the statuses are counted,
+    # the transitions committed meanwhile wait and apply their deltas on top of the recount
+    # Only the drifted genomes are written, the genome listings stay valid otherwise
+    def refresh_counters(genomes: list = None, annotation: bool = True) -> bool:
+        with transaction.atomic():
+            manager = Genome.objects.all() if genomes is None else Genome.objects.filter(pk__in=genomes)
+            current = {row["name"]: row for row in
+                       manager.select_for_update().order_by("name").values("name", "annotation", "genes_total", *Genome.COUNTERS.values())}
+            query = GeneAnnotationStatus.objects.all() if genomes is None else GeneAnnotationStatus.objects.filter(gene__genome__in=genomes)
+            counts = {}
+            for row in query.values("gene__genome", "status").annotate(count=Count("pk")).order_by():
+                counts.setdefault(row["gene__genome"], {})[row["status"]] = row["count"]
+            drifted = False
+            for name, row in current.items():
+                genome_counts = counts.get(name, {})
+                values = {field: genome_counts.get(status, 0) for status, field in Genome.COUNTERS.items()}
+                values["genes_total"] = sum(genome_counts.values())
+                if annotation:
+                    values["annotation"] = values["genes_total"] > 0 and values["genes_approved"] == values["genes_total"]
+                if any(row[field] != value for field, value in values.items()):
+                    Genome.objects.filter(pk=name).update(**values)
+                    drifted = True
+            if drifted:
+                StatsSnapshot.apply(genome_version=1)
+        return drifted
+
     def save(self, *args, **kwargs):
         sequence_str = self.sequence.decode()
         self.length = len(sequence_str)
         self.gc_content = gc_fraction(Seq(sequence_str))
         self.sequence = compress(self.sequence)
+        # Counters (and the annotation flag derived from them) are only written through update_counters,
+        # a stale instance must not overwrite them
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            derived = ["annotation", "genes_total", *Genome.COUNTERS.values()]
+            kwargs["update_fields"] = [f.name for f in self._meta.concrete_fields if not f.primary_key and f.name not in derived]
         return super().save(*args, **kwargs)
     
     def get_sequence(self):
@@ -51,7 +162,7 @@ class Genome(models.Model):
     def __str__(self):
         return self.name
     
-class Gene(models.Model):
+class Gene(TrackedModel):
 
     name = models.CharField(max_length=100, primary_key=True, validators=[RegexValidator(regex=r"^[A-Z]{3}[0-9]+$", message="Invalid gene name")])
     genome = models.ForeignKey(Genome, on_delete=models.CASCADE)
@@ -67,6 +178,41 @@ class Gene(models.Model):
         self.length = len(self.sequence)
         self.gc_content = gc_fraction(Seq(self.sequence))
         return super().save(*args, **kwargs)
+
+    # Used to compute the lengths and GC contents of many sequences at once, on a single array of their residues
+    # Sequences are validated (CAGT only, not empty), the GC contents are those of gc_fraction
+    def composition(sequences: list) -> tuple:
+        if not sequences:
+            return [], []
+        lengths = numpy.fromiter(map(len, sequences), dtype=numpy.int64, count=len(sequences))
+        residues = numpy.frombuffer("".join(sequences).encode("ascii"), dtype=numpy.uint8)
+        gc = (residues == ord("G")) | (residues == ord("C"))
+        counts = numpy.add.reduceat(gc, numpy.concatenate(([0], numpy.cumsum(lengths)[:-1])), dtype=numpy.int64)
+        return lengths.tolist(), (counts / lengths).tolist()
+
+    # Used to create many genes with their status and annotation in a single transaction
+    # Bulk inserts bypass the signals, the change feed, the history, the genome counters and the statistics are updated here
+    def bulk_add(genes: list) -> list:
+        lengths, gc_contents = Gene.composition([gene.sequence for gene in genes])
+        for gene, length, gc_content in zip(genes, lengths, gc_contents):
+            gene.length, gene.gc_content = length, gc_content
+        statuses = [GeneAnnotationStatus(gene=gene) for gene in genes]
+        annotations = [GeneAnnotation(gene_instance=gene, status=status, is_current=True) for gene, status in zip(genes, statuses)]
+        with transaction.atomic():
+            Gene.objects.bulk_create(genes, batch_size=settings.BULK_CREATE["batch_size"])
+            GeneAnnotationStatus.objects.bulk_create(statuses, batch_size=settings.BULK_CREATE["batch_size"])
+            GeneAnnotation.objects.bulk_create(annotations, batch_size=settings.BULK_CREATE["batch_size"])
+            for model in (ChangeLog.gene, ChangeLog.status, ChangeLog.annotation):
+                ChangeLog.record(model, ChangeLog.created, [(gene.pk, []) for gene in genes])
+            AnnotationRevision.record([(annotation.gene_instance_id, None, AnnotationRevision.delta(annotation, AnnotationRevision.GENE_FIELDS, True))
+                                       for annotation in annotations])
+            added = {}
+            for gene in genes:
+                added[gene.genome_id] = added.get(gene.genome_id, 0) + 1
+            for genome, count in added.items():
+                Genome.update_counters(genome, {GeneAnnotationStatus.RAW: count}, total=count)
+            StatsSnapshot.apply(gene_count=len(genes), gene_length=sum(lengths), gene_gc_content=sum(gc_contents), gene_version=1)
+        return genes
     
     def query_motif(motif: str) -> str:
         if(motif):
@@ -84,7 +230,7 @@ class Gene(models.Model):
     def __str__(self):
         return self.name
     
-class Peptide(models.Model):
+class Peptide(TrackedModel):
     name = models.CharField(max_length=100, default="AAA0000", primary_key=True, validators=[RegexValidator(regex=r"^[A-Z]{3}[0-9]+$", message="Invalid gene name")])
     gene = models.ForeignKey(Gene, on_delete=models.CASCADE)
     header = models.TextField(blank=False, null=False, default=">Peptide")
@@ -94,6 +240,16 @@ class Peptide(models.Model):
     def save(self, *args, **kwargs):
         self.length = len(self.sequence)
         return super().save(*args, **kwargs)
+
+    # Used to create many peptides in a single transaction
+    # Bulk inserts bypass the signals, the statistics are updated here
+    def bulk_add(peptides: list) -> list:
+        for peptide in peptides:
+            peptide.length = len(peptide.sequence)
+        with transaction.atomic():
+            Peptide.objects.bulk_create(peptides, batch_size=settings.BULK_CREATE["batch_size"])
+            StatsSnapshot.apply(peptide_count=len(peptides), peptide_length=sum(peptide.length for peptide in peptides), peptide_version=1)
+        return peptides
     
     def query_motif(motif: str) -> str:
         if(motif):
@@ -111,7 +267,7 @@ class Peptide(models.Model):
     def __str__(self):
         return self.name
     
-class GeneAnnotation(models.Model):
+class GeneAnnotation(TrackedModel):
     gene_instance = models.OneToOneField(Gene, on_delete=models.CASCADE, primary_key=True)
     strand = models.IntegerField(blank=True, null=True, default=1)
     gene = models.TextField(blank=True, null=True, editable=True, default="No gene provided.")
@@ -123,13 +279,14 @@ class GeneAnnotation(models.Model):
     status = models.OneToOneField('GeneAnnotationStatus', blank=True, null=True, on_delete=models.CASCADE, related_name='annotations')
 
     def save(self, *args, **kwargs):
-        if self.is_current:
+        # Only a new or newly current annotation can replace the current one
+        if self.is_current and (self._state.adding or self.has_changed("is_current")):
             GeneAnnotation.objects.filter(
-                gene_instance=self.gene_instance,
+                gene_instance=self.gene_instance_id,
                 is_current=True
             ).update(is_current=False)
-        if not self.status:
-            self.status = GeneAnnotationStatus.objects.get(gene=self.gene_instance)
+        if self.status_id is None:
+            self.status = GeneAnnotationStatus.objects.get(gene=self.gene_instance_id)
         super().save(*args, **kwargs)
 
 
@@ -137,7 +294,7 @@ class GeneAnnotation(models.Model):
         return f"{str(self.gene_instance)}"
     
 
-class GeneAnnotationStatus(models.Model):
+class GeneAnnotationStatus(TrackedModel):
 
     def submit(self) -> Response:
         self.status = self.PENDING
@@ -175,6 +332,26 @@ class GeneAnnotationStatus(models.Model):
         self.updated_at = datetime.now()
         self.save()
         
+    # Used to get the cache key of the annotation counts of a user
+    def stats_key(user: int) -> str:
+        return f"stats:user:{user}"
+
+    # Used to count the annotations of a user per status with a single grouped query
+    # Counts are cached until one of the statuses of the user changes (see invalidate_stats)
+    def user_stats(user: int) -> dict:
+        key = GeneAnnotationStatus.stats_key(user)
+        counts = cache.get(key)
+        if counts is None:
+            counts = dict(GeneAnnotationStatus.objects.filter(annotator=user).values_list("status").annotate(count=Count("pk")).order_by())
+            cache.set(key, counts, timeout=86400)
+        return counts
+
+    # Used to drop the cached counts of users, once the current transaction is committed
+    def invalidate_stats(users):
+        keys = [GeneAnnotationStatus.stats_key(user) for user in set(users) if user is not None]
+        if keys:
+            transaction.on_commit(lambda: cache.delete_many(keys))
+
     @validator_only()
     def setuser(manager, request, *args, **kwargs) -> Response:
         if kwargs.get('user') is None:
@@ -184,7 +361,17 @@ class GeneAnnotationStatus(models.Model):
             )
         else:
             user = kwargs.get('user')
-            success = manager.update(status=GeneAnnotationStatus.ONGOING, annotator=user, updated_at=datetime.now())
+            with transaction.atomic():
+                # Bulk updates bypass the signals, the genome counters are updated here
+                transitions = list(manager.values("gene__genome", "status").annotate(count=Count("pk")).order_by())
+                rows = list(manager.values_list("gene", "annotator"))
+                genes = [gene for gene, _ in rows]
+                success = manager.update(status=GeneAnnotationStatus.ONGOING, annotator=user, updated_at=datetime.now())
+                GeneAnnotationStatus.invalidate_stats([user.pk, *(annotator for _, annotator in rows)])
+                for row in transitions:
+                    if row["status"] != GeneAnnotationStatus.ONGOING:
+                        Genome.update_counters(row["gene__genome"], {row["status"]: -row["count"], GeneAnnotationStatus.ONGOING: row["count"]})
+                ChangeLog.record(ChangeLog.status, ChangeLog.updated, [(gene, ["status", "annotator", "updated_at"]) for gene in genes])
             return Response({'status': f'{success} annotation(s) successfully assigned to {user}'}, status=status.HTTP_200_OK)
 
     RAW = 'RAW'
@@ -201,6 +388,38 @@ class GeneAnnotationStatus(models.Model):
         (REJECTED, 'Rejected'),
     ]
 
+    # Target status and allowed source statuses of each action
+    TRANSITIONS = {
+        'approve': (APPROVED, (PENDING, REJECTED)),
+        'reject': (REJECTED, (PENDING, APPROVED)),
+        'submit': (PENDING, (ONGOING,)),
+    }
+
+    # Used to move many statuses from the source statuses to the target one with a single UPDATE
+    # Bulk updates bypass the signals, Gene.annotated and the genome counters are updated here
+    # Returns the genes whose status changed
+    def transition(manager, target: str, sources: tuple, **values) -> list:
+        with transaction.atomic():
+            rows = list(manager.filter(status__in=sources).select_for_update().values_list("gene", "gene__genome", "status", "annotator"))
+            if not rows:
+                return []
+            genes = [gene for gene, _, _, _ in rows]
+            GeneAnnotationStatus.invalidate_stats([annotator for _, _, _, annotator in rows])
+            GeneAnnotationStatus.objects.filter(gene__in=genes, status__in=sources).update(status=target, updated_at=datetime.now(), **values)
+            ChangeLog.record(ChangeLog.status, ChangeLog.updated, [(gene, ["status", "updated_at", *values]) for gene in genes])
+            if target in (GeneAnnotationStatus.APPROVED, GeneAnnotationStatus.REJECTED):
+                Gene.objects.filter(name__in=genes).update(annotated=(target == GeneAnnotationStatus.APPROVED))
+                ChangeLog.record(ChangeLog.gene, ChangeLog.updated, [(gene, ["annotated"]) for gene in genes])
+            deltas = {}
+            for _, genome, source, _ in rows:
+                genome_deltas = deltas.setdefault(genome, {target: 0})
+                genome_deltas[source] = genome_deltas.get(source, 0) - 1
+                genome_deltas[target] += 1
+            for genome, genome_deltas in deltas.items():
+                Genome.update_counters(genome, genome_deltas)
+            ThroughputRollup.record([(genome, annotator, target) for _, genome, _, annotator in rows])
+        return genes
+
     gene = models.OneToOneField(Gene, on_delete=models.CASCADE, primary_key=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=RAW)
     annotator = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True)
@@ -215,7 +434,7 @@ class GeneAnnotationStatus(models.Model):
     def __str__(self):
         return f"{self.gene} - {self.status} - {self.annotator}"
 
-class PeptideAnnotation(models.Model):
+class PeptideAnnotation(TrackedModel):
     peptide = models.OneToOneField(Peptide, on_delete=models.CASCADE, primary_key=True)
     annotation = models.OneToOneField(GeneAnnotation,blank=False, null=False, editable=True, on_delete=models.CASCADE, default="No annotation provided.")
     transcript = models.TextField(blank=False, null=False, editable=True, default="No transcript provided.")
@@ -223,6 +442,403 @@ class PeptideAnnotation(models.Model):
     def __str__(self):
         return f"{str(self.peptide)}"
     
+class AnnotationRevision(models.Model):
+    """Append-only history of the gene / peptide annotations
+    / each revision stores only the fields changed since the previous one"""
+
+    # Annotation fields kept in the history
+    GENE_FIELDS = ["strand", "gene", "gene_biotype", "transcript_biotype", "gene_symbol", "description"]
+    PEPTIDE_FIELDS = ["transcript"]
+
+    gene = models.ForeignKey(Gene, on_delete=models.CASCADE)
+    genome = models.ForeignKey(Genome, on_delete=models.CASCADE)
+    revision = models.IntegerField()
+    # Set for the revisions of a peptide annotation of the gene
+    peptide = models.CharField(max_length=100, null=True, blank=True)
+    changes = models.JSONField(default=dict)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["gene", "revision"], name="unique_annotation_revision"),
+        ]
+        indexes = [
+            models.Index(fields=["genome", "created_at"], name="revision_genome_date_idx"),
+        ]
+
+    # Used to get the changes of an annotation to record, None when nothing tracked changed
+    def delta(instance, fields: list, created: bool):
+        changed = set(fields) if created else instance.changed_fields() & set(fields)
+        if not changed:
+            return None
+        return {field: getattr(instance, field) for field in fields if field in changed}
+
+    # Used to append revisions given as (gene, peptide, changes) tuples
+    # The gene rows are locked (in name order) until the transaction ends, so that concurrent saves of a gene number their revisions one after the other
+    # Revision numbers are read once the locks are held, in a statement of their own so that a revision committed while waiting is seen
+    def record(entries: list) -> int:
+        if not entries:
+            return 0
+        genes = {gene for gene, _, _ in entries}
+        with transaction.atomic(savepoint=False):
+            last = {name: (genome, 0) for name, genome in Gene.objects.filter(name__in=genes).select_for_update().order_by("name").values_list("name", "genome")}
+            for gene, revision in (AnnotationRevision.objects.filter(gene__in=genes).values("gene").annotate(last=models.Max("revision"))
+                                   .order_by().values_list("gene", "last")):
+                last[gene] = (last[gene][0], revision)
+            now = timezone.now()
+            revisions = []
+            for gene, peptide, changes in entries:
+                genome, revision = last[gene]
+                last[gene] = (genome, revision + 1)
+                revisions.append(AnnotationRevision(gene_id=gene, genome_id=genome, revision=revision + 1,
+                                                    peptide=peptide, changes=changes, created_at=now))
+            AnnotationRevision.objects.bulk_create(revisions, batch_size=500)
+        return len(revisions)
+
+    # Used to rebuild the annotations of a genome as they were at a date (now by default)
+    # Revisions are read in a single query and replayed gene by gene
+    def as_of(genome: str, date: datetime = None) -> dict:
+        query = AnnotationRevision.objects.filter(genome=genome)
+        if date is not None:
+            query = query.filter(created_at__lte=date)
+        snapshot = {}
+        for gene, peptide, changes in query.order_by("gene", "revision").values_list("gene", "peptide", "changes").iterator(chunk_size=2000):
+            entry = snapshot.setdefault(gene, {"annotation": {}, "peptides": {}})
+            (entry["annotation"] if peptide is None else entry["peptides"].setdefault(peptide, {})).update(changes)
+        return snapshot
+
+    def __str__(self):
+        return f"{self.gene} - {self.revision}"
+
+class ChangeLog(models.Model):
+    """Change feed of the genes, gene annotations and annotation statuses
+    / rows are written in the transaction of the change, ids only ever increase and serve as cursors"""
+
+    # Models in the feed
+    gene = "gene"
+    annotation = "annotation"
+    status = "status"
+
+    # Actions
+    created = "CREATED"
+    updated = "UPDATED"
+    deleted = "DELETED"
+
+    MODEL_CHOICES = [
+        (gene, 'Gene'),
+        (annotation, 'Gene annotation'),
+        (status, 'Annotation status'),
+    ]
+
+    ACTION_CHOICES = [
+        (created, 'Created'),
+        (updated, 'Updated'),
+        (deleted, 'Deleted'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=20, choices=MODEL_CHOICES)
+    # Primary key of the changed row (the gene name for the three models)
+    key = models.CharField(max_length=100)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    # Changed fields, empty when unknown
+    fields = models.JSONField(default=list)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Used to find the last change of a set of rows (see ExportArtifact.data_version)
+            models.Index(fields=["key", "id"], name="changelog_key_idx"),
+            # Used to find the last change of a model (see StatsSnapshot.get)
+            models.Index(fields=["model", "id"], name="changelog_model_idx"),
+        ]
+
+    # Used to record changes of a model given as (key, fields) tuples, in a single INSERT
+    def record(model: str, action: str, entries: list) -> int:
+        now = timezone.now()
+        ChangeLog.objects.bulk_create([ChangeLog(model=model, key=key, action=action, fields=sorted(fields), created_at=now)
+                                       for key, fields in entries], batch_size=500)
+        return len(entries)
+
+    # Used to delete the changes recorded before a date, returns the number of rows deleted
+    # The last change of every row is kept, the data versions of the exports and the validators
+    # of the listings are read from it (see ExportArtifact.data_version and StatsSnapshot.get)
+    def prune(before) -> int:
+        last = ChangeLog.objects.values("model", "key").annotate(last=models.Max("id")).order_by().values("last")
+        deleted, _ = ChangeLog.objects.filter(created_at__lt=before).exclude(id__in=last).delete()
+        return deleted
+
+    def __str__(self):
+        return f"{self.id} - {self.model} {self.key} {self.action}"
+
+class StatsSnapshot(models.Model):
+    """Single row holding the aggregates of the dashboard statistics
+    / kept up to date by the model signals, reconciled periodically (see reconcile)
+    / version changes with every update and identifies the cached statistics, with the last status change
+    / the table versions change with the genomes / genes / peptides and validate their listings, with the last changes of the feed"""
+
+    version = models.BigIntegerField(default=0)
+    genome_version = models.BigIntegerField(default=0)
+    gene_version = models.BigIntegerField(default=0)
+    peptide_version = models.BigIntegerField(default=0)
+    genome_count = models.IntegerField(default=0)
+    genome_length = models.BigIntegerField(default=0)
+    gene_count = models.IntegerField(default=0)
+    gene_length = models.BigIntegerField(default=0)
+    gene_gc_content = models.FloatField(default=0.0)
+    peptide_count = models.IntegerField(default=0)
+    peptide_length = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    # Primary key of the single row
+    SINGLETON = 1
+
+    # Used to apply deltas to the aggregates in a single UPDATE, the version is always bumped
+    def apply(**deltas) -> int:
+        changes = {field: F(field) + value for field, value in deltas.items() if value}
+        return StatsSnapshot.objects.filter(pk=StatsSnapshot.SINGLETON).update(version=F("version") + 1,
+                                                                              updated_at=timezone.now(),
+                                                                              **changes)
+
+    # Used to read the snapshot with the last status and gene changes of the change feed (id and date), in a single query
+    # Status transitions only update the genome counters, Gene.annotated follows the approvals and rejections,
+    # the feed tells when they last changed (see tag)
+    def get() -> "StatsSnapshot":
+        feed = {}
+        for model in (ChangeLog.status, ChangeLog.gene):
+            last = ChangeLog.objects.filter(model=model).order_by("-id")
+            feed[f"{model}_feed"] = Subquery(last.values("id")[:1])
+            feed[f"{model}_changed_at"] = Subquery(last.values("created_at")[:1])
+        query = StatsSnapshot.objects.annotate(**feed).filter(pk=StatsSnapshot.SINGLETON)
+        snapshot = query.first()
+        if snapshot is None:
+            StatsSnapshot.objects.get_or_create(pk=StatsSnapshot.SINGLETON)
+            snapshot = query.get()
+        return snapshot
+
+    # Used to recompute the aggregates from the tables, returns True when they had drifted
+    # The genome rows then the snapshot are locked before counting (the order of the signals),
+    # the deltas applied meanwhile wait and apply on top of the recount
+    # Nothing is written when nothing drifted, so that the tags and the cached statistics stay valid,
+    # otherwise only the versions of the drifted tables are bumped
+    def reconcile() -> bool:
+        with transaction.atomic():
+            # Annotation flags are left as they are, they may have been set by a data load
+            counters = Genome.refresh_counters(annotation=False)
+            snapshot = StatsSnapshot.objects.select_for_update().get_or_create(pk=StatsSnapshot.SINGLETON)[0]
+            genome = Genome.objects.aggregate(count=Count("pk"), length=models.Sum("length"))
+            gene = Gene.objects.aggregate(count=Count("pk"), length=models.Sum("length"), gc_content=models.Sum("gc_content"))
+            peptide = Peptide.objects.aggregate(count=Count("pk"), length=models.Sum("length"))
+            values = {"genome_count": genome["count"], "genome_length": genome["length"] or 0,
+                      "gene_count": gene["count"], "gene_length": gene["length"] or 0, "gene_gc_content": gene["gc_content"] or 0.0,
+                      "peptide_count": peptide["count"], "peptide_length": peptide["length"] or 0}
+            # Sums of floats drift slightly with incremental updates, fields are prefixed with their table
+            tables = {field.split("_")[0] for field, value in values.items() if abs(getattr(snapshot, field) - value) > 1e-6}
+            if tables:
+                StatsSnapshot.objects.filter(pk=StatsSnapshot.SINGLETON).update(version=F("version") + 1, updated_at=timezone.now(),
+                                                                               **{f"{table}_version": F(f"{table}_version") + 1 for table in tables},
+                                                                               **values)
+        return counters or bool(tables)
+
+    # Used to get the ETag value and the modification date of the data served by a read endpoint
+    # Genome listings and statistics are built from the genome counters, they follow the status changes too
+    # Peptides are filtered on the annotated flag of their gene, their tag follows the genes too
+    def tag(self, name: str) -> tuple:
+        genes = f"{self.gene_version}.{self.gene_feed or 0}"
+        tags = {"genome": (f"{self.genome_version}.{self.status_feed or 0}", self.status_changed_at),
+                "gene": (genes, self.gene_changed_at),
+                "peptide": (f"{self.peptide_version}.{genes}", self.gene_changed_at),
+                "stats": (f"{self.version}.{self.status_feed or 0}", self.status_changed_at)}
+        value, changed_at = tags[name]
+        return f"{name}-{value}", max(self.updated_at, changed_at or self.updated_at)
+
+    def validator(name: str) -> tuple:
+        return StatsSnapshot.get().tag(name)
+
+    # Used to build the statistics served by the dashboard
+    # Genome and annotation figures come from the genome counters
+    def payload(self) -> dict:
+        average = lambda total, count: total / count if count else None
+        overview, annotation = [], {}
+        for row in Genome.objects.filter(genes_total__gt=0).order_by("name").values("name", "genes_total", *Genome.COUNTERS.values()):
+            overview.append({"genome": row["name"], "total": row["genes_total"], "annotated": row["genes_approved"],
+                             "ratio": row["genes_approved"] / row["genes_total"] * 100.0})
+            for key, field in Genome.COUNTERS.items():
+                annotation[key] = annotation.get(key, 0) + row[field]
+        return {"genome": {"count": self.genome_count,
+                           "average_length": average(self.genome_length, self.genome_count),
+                           "total_nt": self.genome_length if self.genome_count else None,
+                           "fully_annotated": sum(1 for g in overview if g["annotated"] == g["total"]),
+                           "in_progress": sum(1 for g in overview if g["annotated"] == 0),
+                           "new": sum(1 for g in overview if 0 < g["annotated"] < g["total"]),
+                           "overview": overview},
+                "gene": {"count": self.gene_count,
+                         "average_length": average(self.gene_length, self.gene_count),
+                         "average_gc_content": average(self.gene_gc_content, self.gene_count)},
+                "peptide": {"count": self.peptide_count,
+                            "average_length": average(self.peptide_length, self.peptide_count)},
+                "annotation": [{"status": key, "count": count, "ratio": count / self.gene_count * 100.0 if self.gene_count else None}
+                               for key, count in annotation.items() if count]}
+
+class ThroughputRollup(models.Model):
+    """Number of annotations submitted / approved / rejected per hour and per day, for each genome and annotator
+    / filled incrementally by the status transitions, so that trends never scan the statuses"""
+
+    HOUR = 'HOUR'
+    DAY = 'DAY'
+
+    GRANULARITY_CHOICES = [
+        (HOUR, 'Hour'),
+        (DAY, 'Day'),
+    ]
+
+    # Counter incremented by a transition to each status
+    COUNTERS = {
+        GeneAnnotationStatus.PENDING: "submitted",
+        GeneAnnotationStatus.APPROVED: "approved",
+        GeneAnnotationStatus.REJECTED: "rejected",
+    }
+
+    granularity = models.CharField(max_length=10, choices=GRANULARITY_CHOICES)
+    # Start of the hour / day
+    bucket = models.DateTimeField()
+    genome = models.ForeignKey(Genome, on_delete=models.CASCADE)
+    # Annotator of the status at the time of the transition
+    annotator = models.ForeignKey(CustomUser, on_delete=models.CASCADE, null=True, blank=True)
+    submitted = models.IntegerField(default=0)
+    approved = models.IntegerField(default=0)
+    rejected = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Transitions of unassigned statuses share a single row per bucket
+            models.UniqueConstraint("granularity", "bucket", "genome", Coalesce("annotator", Value(0)), name="unique_throughput_bucket"),
+        ]
+        indexes = [
+            models.Index(fields=["granularity", "bucket"]),
+        ]
+
+    # Used to get the start of the hour / day of a date
+    def truncate(date: datetime, granularity: str) -> datetime:
+        date = timezone.localtime(date).replace(minute=0, second=0, microsecond=0)
+        return date.replace(hour=0) if granularity == ThroughputRollup.DAY else date
+
+    # Used to count transitions given as (genome, annotator, status) tuples, in both granularities
+    # Missing rows are created in a single INSERT, then each row is incremented with a single UPDATE
+    def record(events: list, date: datetime = None) -> int:
+        date = date or timezone.now()
+        increments = {}
+        for genome, annotator, target in events:
+            field = ThroughputRollup.COUNTERS.get(target, None)
+            if field is None:
+                continue
+            for granularity in (ThroughputRollup.HOUR, ThroughputRollup.DAY):
+                counters = increments.setdefault((granularity, ThroughputRollup.truncate(date, granularity), genome, annotator), {})
+                counters[field] = counters.get(field, 0) + 1
+        if not increments:
+            return 0
+        ThroughputRollup.objects.bulk_create([ThroughputRollup(granularity=granularity, bucket=bucket, genome_id=genome, annotator_id=annotator)
+                                              for granularity, bucket, genome, annotator in increments], ignore_conflicts=True)
+        for (granularity, bucket, genome, annotator), counters in increments.items():
+            ThroughputRollup.objects.filter(granularity=granularity, bucket=bucket, genome=genome, annotator=annotator).update(
+                **{field: F(field) + count for field, count in counters.items()})
+        return len(increments)
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket} - {self.genome} - {self.annotator}"
+
+class Notification(models.Model):
+    """Outbox of the annotation notifications, sent to each recipient as a periodic digest
+    / the pending events of a recipient on the same gene are coalesced into the latest one"""
+
+    recipient = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    gene = models.ForeignKey(Gene, on_delete=models.CASCADE)
+    mail_type = models.CharField(max_length=20)
+    status = models.CharField(max_length=20, choices=GeneAnnotationStatus.STATUS_CHOICES)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["recipient", "gene", "mail_type"], name="unique_notification_event"),
+        ]
+
+    # Used to queue events given as (gene, recipient, status) tuples, in a single INSERT
+    def queue(events: list, mail_type: str) -> int:
+        now = timezone.now()
+        rows = [Notification(gene_id=gene, recipient_id=recipient, mail_type=mail_type, status=status, created_at=now)
+                for gene, recipient, status in events if recipient is not None]
+        Notification.objects.bulk_create(rows, batch_size=500, update_conflicts=True,
+                                         unique_fields=["recipient", "gene", "mail_type"],
+                                         update_fields=["status", "created_at"])
+        return len(rows)
+
+    def __str__(self):
+        return f"{self.recipient} - {self.gene} - {self.status}"
+
+class ExportArtifact(models.Model):
+    """Compressed FASTA / GFF3 / GenBank export of the annotations of a genome, built by the cpu-bound queue
+    / version hashes the data the file was built from, an export is only rebuilt once it changes
+    / files live under EXPORTS["root"], the row points to the last complete one"""
+
+    FASTA = 'FASTA'
+    GFF3 = 'GFF3'
+    GENBANK = 'GENBANK'
+
+    FORMAT_CHOICES = [
+        (FASTA, 'FASTA'),
+        (GFF3, 'GFF3'),
+        (GENBANK, 'GenBank'),
+    ]
+
+    # File extension of each format
+    EXTENSIONS = {
+        FASTA: "fasta",
+        GFF3: "gff3",
+        GENBANK: "gbk",
+    }
+
+    # Bumped when the content of the files changes, so that every export is rebuilt
+    LAYOUT = 1
+
+    genome = models.ForeignKey(Genome, on_delete=models.CASCADE)
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    version = models.CharField(max_length=64)
+    # Path of the gzipped file, relative to EXPORTS["root"]
+    path = models.CharField(max_length=255)
+    size = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["genome", "format"], name="unique_export_artifact"),
+        ]
+
+    # Used to hash the data the exports of a genome are built from
+    # Gene and annotation changes come from the change feed, peptide annotations from their history,
+    # the counts and lengths catch the rows added / deleted / edited without a trace (bulk loads, peptides)
+    def data_version(genome: str) -> str:
+        genes = Gene.objects.filter(genome=genome)
+        values = {"layout": ExportArtifact.LAYOUT,
+                  "genome": Genome.objects.filter(pk=genome).values("name", "species", "header", "length").first(),
+                  "genes": genes.aggregate(count=Count("pk"), length=models.Sum("length")),
+                  "peptides": Peptide.objects.filter(gene__genome=genome).aggregate(count=Count("pk"), length=models.Sum("length")),
+                  "changes": ChangeLog.objects.filter(model__in=[ChangeLog.gene, ChangeLog.annotation], key__in=genes.values("name"))
+                                              .aggregate(last=models.Max("id"))["last"],
+                  "revisions": AnnotationRevision.objects.filter(genome=genome).aggregate(last=models.Max("id"))["last"]}
+        return sha256(dumps(obj=values, ensure_ascii=True, default=str, sort_keys=True).encode()).hexdigest()
+
+    # Used to get the absolute path of the file
+    def file(self) -> Path:
+        return Path(settings.EXPORTS["root"]) / self.path
+
+    # Used to remove a replaced / deleted file once the transaction is committed
+    # Downloads in progress keep reading the unlinked file
+    def discard(path: str):
+        transaction.on_commit(lambda: (Path(settings.EXPORTS["root"]) / path).unlink(missing_ok=True))
+
+    def __str__(self):
+        return f"{self.genome} - {self.format} - {self.version[:12]}"
+
 class AsyncTasksCache(models.Model):
 
     # States of the async cached task
@@ -230,12 +846,14 @@ class AsyncTasksCache(models.Model):
     in_progress = "IN_PROGRESS"
     completed = "COMPLETED"
     rejected = "REJECTED"
+    cancelled = "CANCELLED"
 
     STATUS_CHOICES = [
         (pending, 'Pending'),
         (in_progress, 'In Progress'),
         (completed, 'Completed'),
         (rejected, 'Rejected'),
+        (cancelled, 'Cancelled'),
     ]
 
     # Used to retrieve the task and return the result if available
@@ -247,10 +865,12 @@ class AsyncTasksCache(models.Model):
                 if(task_obj.state == AsyncTasksCache.completed):
                     return Response({"task": task_obj.key, "state": task_obj.state, "user": task_obj.user.username, 
                                     "params": task_obj.params, 
-                                    "result": HUEY.result(task_obj.storage, preserve=True)},
+                                    "result": get_queue(task_obj.queue).result(task_obj.storage, preserve=True)},
                                     status=status.HTTP_200_OK)
                 elif(task_obj.state == AsyncTasksCache.pending or task_obj.state == AsyncTasksCache.in_progress):
                     return Response({"state": task_obj.state, "message": "Task is still in progress."}, status=status.HTTP_202_ACCEPTED)
+                elif(task_obj.state == AsyncTasksCache.cancelled):
+                    return Response({"state": task_obj.state, "error": "Task was cancelled."}, status=status.HTTP_400_BAD_REQUEST)
                 else:
                     return Response({"error": "Task failed."}, status=status.HTTP_400_BAD_REQUEST)
             else:
@@ -263,9 +883,9 @@ class AsyncTasksCache(models.Model):
         return sha256(dumps(obj=params, ensure_ascii=True, default=str, sort_keys=True).encode()).hexdigest()
     
     # Used to cache the task
-    def cache_task(key: str, task: str, user: CustomUser, params: dict):
+    def cache_task(key: str, task: str, user: CustomUser, params: dict, queue: str):
         params_hash = AsyncTasksCache.hash_params(params)
-        return AsyncTasksCache.objects.create(key=key, task=task, user=user, params_hash=params_hash, params=params, 
+        return AsyncTasksCache.objects.create(key=key, task=task, user=user, params_hash=params_hash, params=params, queue=queue, 
                                               state=AsyncTasksCache.completed if settings.HUEY["immediate"] else AsyncTasksCache.pending)
     
     # Used to query the cache
@@ -278,10 +898,73 @@ class AsyncTasksCache(models.Model):
         }
         return AsyncTasksCache.objects.filter(**{k: v for k, v in query_params.items() if v is not None})
     
+    # Used to read a completed result from the cache, None if it is not cached
+    def cached_result(task_type: str, params: dict):
+        cached_obj = AsyncTasksCache.query_cache(params=params).filter(task=task_type, state=AsyncTasksCache.completed).first()
+        if cached_obj is None or cached_obj.storage is None:
+            return None
+        return get_queue(cached_obj.queue).result(cached_obj.storage, preserve=True)
+
+    # Used to cache a result computed outside of the queues (e.g. by a pipeline)
+    def store_result(task_type: str, params: dict, queue: str, user: CustomUser, result) -> object:
+        storage = str(uuid.uuid4())
+        get_queue(queue).put_result(storage, result)
+        return AsyncTasksCache.objects.create(key=uuid.uuid4(), task=task_type, user=user, params_hash=AsyncTasksCache.hash_params(params),
+                                              params=params, queue=queue, storage=storage, state=AsyncTasksCache.completed)
+
+    # Used to cancel a task
+    # Queued tasks are revoked, running tasks abort at their next check (see tasks.TaskGuard)
+    def cancel_task(key: str, user: CustomUser) -> Response:
+        try:
+            task_obj = AsyncTasksCache.objects.get(key=key)
+        except AsyncTasksCache.DoesNotExist:
+            return Response({"error": "Task not found."}, status=status.HTTP_404_NOT_FOUND)
+        if task_obj.user != user and not user.is_staff:
+            return Response({"error": "Only the user who submitted the task can cancel it."}, status=status.HTTP_403_FORBIDDEN)
+        if task_obj.state not in [AsyncTasksCache.pending, AsyncTasksCache.in_progress]:
+            return Response({"error": f"Task with state {task_obj.state} cannot be cancelled."}, status=status.HTTP_400_BAD_REQUEST)
+        if task_obj.storage:
+            get_queue(task_obj.queue).revoke_by_id(task_obj.storage, revoke_once=True)
+        AsyncTasksCache.objects.filter(key=key, state__in=[AsyncTasksCache.pending, AsyncTasksCache.in_progress]).update(
+            state=AsyncTasksCache.cancelled, error_message=f"Cancelled by {user.username}.", updated_at=timezone.now())
+        return Response({"task": key, "state": AsyncTasksCache.cancelled}, status=status.HTTP_200_OK)
+
+    # Used to reject the tasks left pending or in progress by a dead worker
+    # A task is orphaned once it outlived its queue expiry and its hard timeout,
+    # a pipeline once none of its batches made progress within the deadline of a batch
+    def reconcile() -> int:
+        orphaned = 0
+        now = timezone.now()
+        for task_type, timeouts in settings.HUEY_TASK_TIMEOUTS.items():
+            grace = timedelta(seconds=timeouts.get("grace", 60))
+            hard = timedelta(seconds=timeouts.get("hard", None) or 0)
+            expires = timedelta(seconds=timeouts.get("expires", None) or 0)
+            running = AsyncTasksCache.objects.filter(task=task_type, state=AsyncTasksCache.in_progress, updated_at__lt=now - hard - grace)
+            queued = AsyncTasksCache.objects.filter(task=task_type, state=AsyncTasksCache.pending, updated_at__lt=now - expires - hard - grace)
+            for task_obj in (running | queued).exclude(storage=None):
+                get_queue(task_obj.queue).revoke_by_id(task_obj.storage, revoke_once=True)
+            orphaned += (running | queued).update(state=AsyncTasksCache.rejected, error_message="Task was lost by its worker.", updated_at=now)
+        return orphaned
+
     # Used to clean the cache by deleting old tasks
     def clean_cache():
         AsyncTasksCache.objects.filter(updated_at__lt=timezone.now() - timedelta(hours=24)).delete()
     
+    # Used to cache a new task and enqueue it once the cache entry is committed
+    # A priority can be given to run the task before / after the others of its queue
+    def submit_task(task_type: str, task_params: dict, task_funct, user: CustomUser, priority: int = None) -> object:
+        with transaction.atomic():
+            key = uuid.uuid4()
+            cached_obj: AsyncTasksCache = AsyncTasksCache.cache_task(key=key, task=task_type, user=user, params=task_params, queue=task_funct.queue)
+            # Enqueue the task
+            def _enqueue():
+                task = task_funct(**task_params, priority=priority)
+                cached_obj.storage = task.id
+                cached_obj.save(update_fields=["storage"])
+            # Enqueue the task on commit
+            transaction.on_commit(_enqueue)
+        return cached_obj
+
     # Used to get or create a task by working with the cache
     def get_or_create_task(task_type: str, task_params: dict, task_funct, user: CustomUser) -> Response:
         # Check if same task already in the cache
@@ -295,7 +978,7 @@ class AsyncTasksCache(models.Model):
                 # Get the Redis key of the result
                 result_key = cached_obj.storage
                 # Get the result from the Redis cache
-                cached_result = HUEY.result(result_key, preserve=True)
+                cached_result = get_queue(cached_obj.queue).result(result_key, preserve=True)
                 # If the result is found, return it
                 if(cached_result is not None):
                     return Response(cached_result, status=status.HTTP_200_OK)
@@ -312,19 +995,8 @@ class AsyncTasksCache(models.Model):
                 # Follow with the task submission
         try:
             # Create a new task in the cache
-            with transaction.atomic():
-                key = uuid.uuid4()
-                cached_obj: AsyncTasksCache = AsyncTasksCache.cache_task(key=key, task=task_type, user=user, params=task_params)
-                # Enqueue the task
-                def _enqueue():
-                    task = task_funct(**task_params)
-                    cached_obj.storage = task.id
-                    cached_obj.save(update_fields=["storage"])
-                # Enqueue the task on commit
-                transaction.on_commit(_enqueue)
-                return Response({"key": f"{key}"}, status=status.HTTP_202_ACCEPTED)
-
-            return Response({"error": f"{task_type} job failed to submit."}, status=status.HTTP_400_BAD_REQUEST)
+            cached_obj = AsyncTasksCache.submit_task(task_type=task_type, task_params=task_params, task_funct=task_funct, user=user)
+            return Response({"key": f"{cached_obj.key}"}, status=status.HTTP_202_ACCEPTED)
         except Exception as e:
             return Response({"error": f"{task_type} job failed to submit.", "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -337,6 +1009,9 @@ class AsyncTasksCache(models.Model):
     # The task field is used to store the task name
     task = models.CharField(max_length=100)
 
+    # The queue field is used to store the huey queue the task was routed to
+    queue = models.CharField(max_length=50, default=REMOTE_IO)
+
     # The params_hash field is used to store the hash of the params field
     params_hash = models.CharField(max_length=100, db_index=True)
 
@@ -349,11 +1024,20 @@ class AsyncTasksCache(models.Model):
     # The state field is used to store the task state
     state = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
 
+    # The items fields are used by pipelines to aggregate the progress of their batches
+    items_total = models.IntegerField(default=0)
+    items_done = models.IntegerField(default=0)
+    items_failed = models.IntegerField(default=0)
+
+    # The next_batch field is used by pipelines to store the index of the next batch to enqueue
+    next_batch = models.IntegerField(default=0)
+
     # The error_message field is used to store the error message if the task fails
     error_message = models.TextField(null=True, blank=True)
 
     # The created_at field is used to store the task creation date
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Indexed as the sort key of the task listing
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     # The updated_at field is used to store the task last update date
     updated_at = models.DateTimeField(auto_now=True)
@@ -26,14 +26,15 @@ class IsAnnotatorUser(BasePermission):
         if request.user.is_staff:
             return True
         # Check if the user is the owner of the object
+        # Annotators are compared by id, so that they are never fetched
         if isinstance(obj,GeneAnnotation):
-            return obj.status.annotator == request.user
+            return obj.status.annotator_id == request.user.pk
         elif isinstance(obj,GeneAnnotationStatus):
-            return obj.annotator == request.user
+            return obj.annotator_id == request.user.pk
         elif isinstance(obj,Peptide):
-            return GeneAnnotation.objects.get(gene_instance=obj.gene).status.annotator == request.user
+            return GeneAnnotationStatus.objects.filter(gene=obj.gene_id, annotator=request.user.pk).exists()
         elif isinstance(obj,Gene):
-            return GeneAnnotation.objects.get(gene_instance=obj).status.annotator == request.user
+            return GeneAnnotationStatus.objects.filter(gene=obj.pk, annotator=request.user.pk).exists()
         
 # Check if the user is a validator
 class IsValidatorUser(BasePermission):
@@ -0,0 +1,230 @@
+import time
+import uuid
+
+from Bio.Seq import Seq
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from huey.exceptions import RetryTask
+
+from AccessControl.models import CustomUser
+
+from .models import AsyncTasksCache, Gene
+from .queues import CPU_BOUND, PIPELINE_BATCH, db_task, get_queue
+from .tasks import BLAST_DEFAULTS, PFAM_DEFAULTS, pfamscan, remaining_budget, run_blast
+
+# Pipelines
+# A pipeline runs a DAG of stages on every gene of a genome.
+# Genes are fanned out in batches: only max_in_flight batches are queued at any time,
+# each finished batch enqueues the next one, and the last one enqueues the join task.
+# Progress is aggregated on a single parent AsyncTasksCache row.
+# Batches run on their own pipeline-batch queue, the remote-io workers stay free for the requests of the annotators.
+# A batch gives its worker back past its soft timeout or once the hourly budget of a remote service
+# is used up (see HUEY_TASK_TIMEOUTS["PIPELINE"]), it runs again later and reuses the analyses already cached.
+
+
+class Stage:
+    """Step of a pipeline run on a single gene.
+    The function receives the gene, the outputs of the previous stages and the user"""
+
+    def __init__(self, name: str, function, requires: tuple = ()):
+        self.name = name
+        self.function = function
+        self.requires = tuple(requires)
+
+
+class Pipeline:
+    """DAG of stages fanned out per gene, joined by a summary function"""
+
+    def __init__(self, name: str, stages: list, join, batch_size: int = 50, max_in_flight: int = 2, priority: int = 0):
+        self.name = name
+        self.stages = Pipeline.sort(stages)
+        self.join = join
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.priority = priority
+
+    # Used to order the stages so that every stage runs after the ones it requires
+    def sort(stages: list) -> list:
+        by_name = {stage.name: stage for stage in stages}
+        ordered, visiting, done = [], set(), set()
+        def _visit(stage):
+            if stage.name in done:
+                return
+            if stage.name in visiting:
+                raise ValueError(f"Pipeline stage {stage.name} is part of a cycle.")
+            visiting.add(stage.name)
+            for name in stage.requires:
+                if name not in by_name:
+                    raise ValueError(f"Pipeline stage {stage.name} requires unknown stage {name}.")
+                _visit(by_name[name])
+            visiting.discard(stage.name)
+            done.add(stage.name)
+            ordered.append(stage)
+        for stage in stages:
+            _visit(stage)
+        return ordered
+
+    # Used to run every stage on a gene, a failing stage fails the gene
+    def run_item(self, gene: Gene, user: CustomUser) -> dict:
+        outputs = {}
+        for stage in self.stages:
+            outputs[stage.name] = stage.function(gene, outputs, user)
+        return outputs
+
+    def batches(self, total: int) -> int:
+        return -(-total // self.batch_size)
+
+    # Used to get the genes of a batch, genes are always walked in name order
+    def genes(self, genome: str, index: int):
+        start = index * self.batch_size
+        return Gene.objects.filter(genome=genome).prefetch_related("peptide_set").order_by("name")[start:start + self.batch_size]
+
+class BudgetExhausted(Exception):
+    pass
+
+# Stages of the pre-annotation pipeline
+
+# Used to reuse a cached analysis, or run it in the batch worker and cache it for the annotators
+# Analyses run here count in the hourly budget of the remote service
+def _analysis(task_type: str, task_funct, params: dict, user: CustomUser):
+    result = AsyncTasksCache.cached_result(task_type, params)
+    if result is None:
+        if remaining_budget(task_type) <= 0:
+            raise BudgetExhausted(f"Hourly budget of {task_type} used up.")
+        result = task_funct.call_local(**params)
+        AsyncTasksCache.store_result(task_type, params, task_funct.queue, user, result)
+    return result
+
+def translate(gene: Gene, outputs: dict, user: CustomUser) -> str:
+    peptides = list(gene.peptide_set.all())
+    if peptides:
+        return peptides[0].sequence
+    # Bacterial genetic code, trailing partial codon dropped
+    coding = gene.sequence[:len(gene.sequence) - len(gene.sequence) % 3]
+    return str(Seq(coding).translate(table=11, to_stop=True))
+
+def pfam(gene: Gene, outputs: dict, user: CustomUser):
+    return _analysis("PFAMScan", pfamscan, {"sequence": outputs["translate"], **PFAM_DEFAULTS, "user": user.id}, user)
+
+def blast(gene: Gene, outputs: dict, user: CustomUser):
+    return _analysis("BLAST", run_blast, {"sequence": gene.sequence, **BLAST_DEFAULTS}, user)
+
+def summarise(gene: Gene, outputs: dict, user: CustomUser) -> dict:
+    domains = outputs["pfam"] if isinstance(outputs["pfam"], list) else []
+    try:
+        hits = outputs["blast"]["BlastOutput2"][0]["report"]["results"]["search"]["hits"]
+    except (KeyError, IndexError, TypeError):
+        hits = []
+    return {"gene": gene.name,
+            "protein_length": len(outputs["translate"]),
+            "pfam_hits": len(domains),
+            "pfam_top": domains[0].get("name") if domains else None,
+            "blast_hits": len(hits),
+            "blast_top": hits[0]["description"][0].get("title") if hits and hits[0].get("description") else None}
+
+def join_summaries(genome: str, items: list) -> dict:
+    genes = [item for item in items if "error" not in item]
+    return {"genome": genome,
+            "genes": len(items),
+            "failed": len(items) - len(genes),
+            "with_pfam_hits": sum(1 for item in genes if item["pfam_hits"] > 0),
+            "with_blast_hits": sum(1 for item in genes if item["blast_hits"] > 0),
+            "summary": items}
+
+PIPELINES = {
+    "preannotation": Pipeline("preannotation",
+                              stages=[Stage("translate", translate),
+                                      Stage("pfam", pfam, requires=("translate",)),
+                                      Stage("blast", blast),
+                                      Stage("summarise", summarise, requires=("translate", "pfam", "blast"))],
+                              join=join_summaries),
+}
+
+# Used to get the storage key of the outputs of a batch
+def _batch_key(key: str, index: int) -> str:
+    return f"pipeline.{key}.{index}"
+
+# Used to claim the index of the next batch to enqueue, None once every batch has been claimed
+def _claim_batch(key: str, count: int):
+    while True:
+        index = AsyncTasksCache.objects.filter(key=key).values_list("next_batch", flat=True).first()
+        if index is None or index >= count:
+            return None
+        if AsyncTasksCache.objects.filter(key=key, next_batch=index).update(next_batch=index + 1):
+            return index
+
+# Used to enqueue the join task once, when every gene has been processed
+def _join_if_complete(key: str):
+    parent = AsyncTasksCache.objects.get(key=key)
+    if parent.items_done + parent.items_failed < parent.items_total:
+        return
+    join = join_pipeline.s(key)
+    if AsyncTasksCache.objects.filter(key=key, state=AsyncTasksCache.in_progress, storage=None).update(storage=join.id):
+        join_pipeline.huey.enqueue(join)
+
+def _enqueue_next(key: str, pipeline: Pipeline, count: int):
+    index = _claim_batch(key, count)
+    if index is not None:
+        run_pipeline_batch(key, index, priority=pipeline.priority)
+
+# Used to run a batch again later, the parent is touched so that the batch is not taken for lost
+def _defer(key: str, delay: int):
+    AsyncTasksCache.objects.filter(key=key).update(updated_at=timezone.now())
+    raise RetryTask(delay=delay)
+
+@db_task(PIPELINE_BATCH, retries=1)
+def run_pipeline_batch(key: str, index: int):
+    parent = AsyncTasksCache.objects.select_related("user").get(key=key)
+    # Stop fanning out when the pipeline was cancelled or rejected
+    if parent.state != AsyncTasksCache.in_progress:
+        return
+    pipeline = PIPELINES[parent.params["pipeline"]]
+    genome = parent.params["genome"]
+    timeouts = settings.HUEY_TASK_TIMEOUTS["PIPELINE"]
+    started = time.monotonic()
+    outputs, failed = [], 0
+    for gene in pipeline.genes(genome, index):
+        if timeouts["soft"] is not None and time.monotonic() - started > timeouts["soft"]:
+            _defer(key, 0)
+        try:
+            outputs.append(pipeline.run_item(gene, parent.user)["summarise"])
+        except BudgetExhausted:
+            _defer(key, timeouts["defer"])
+        except Exception as e:
+            failed += 1
+            outputs.append({"gene": gene.name, "error": str(e)})
+    # A batch is counted once, a retry of a batch whose outputs were stored only moves the pipeline on
+    if get_queue(PIPELINE_BATCH).put_if_empty(_batch_key(key, index), outputs):
+        AsyncTasksCache.objects.filter(key=key).update(items_done=F("items_done") + len(outputs) - failed,
+                                                       items_failed=F("items_failed") + failed,
+                                                       updated_at=timezone.now())
+    _enqueue_next(key, pipeline, pipeline.batches(parent.items_total))
+    _join_if_complete(key)
+
+@db_task(CPU_BOUND)
+def join_pipeline(key: str) -> dict:
+    parent = AsyncTasksCache.objects.get(key=key)
+    pipeline = PIPELINES[parent.params["pipeline"]]
+    items = []
+    for index in range(pipeline.batches(parent.items_total)):
+        items.extend(get_queue(PIPELINE_BATCH).get(_batch_key(key, index)) or [])
+    return pipeline.join(parent.params["genome"], items)
+
+# Used to start a pipeline on a genome, returns the parent cache row
+def start_pipeline(name: str, genome: str, user: CustomUser) -> AsyncTasksCache:
+    pipeline = PIPELINES[name]
+    params = {"pipeline": name, "genome": genome}
+    total = Gene.objects.filter(genome=genome).count()
+    with transaction.atomic():
+        parent = AsyncTasksCache.objects.create(key=uuid.uuid4(), task="PIPELINE", user=user, params=params,
+                                                params_hash=AsyncTasksCache.hash_params(params), queue=CPU_BOUND,
+                                                state=AsyncTasksCache.in_progress, items_total=total)
+        def _fan_out():
+            if total == 0:
+                _join_if_complete(parent.key)
+            for _ in range(min(pipeline.max_in_flight, pipeline.batches(total))):
+                _enqueue_next(parent.key, pipeline, pipeline.batches(total))
+        transaction.on_commit(_fan_out)
+    return parent
@@ -0,0 +1,71 @@
+from django.conf import settings
+from huey.contrib.djhuey import close_db, get_backend
+
+# Named huey queues
+# Each queue gets its own Redis list and its own consumer (see supervisord.conf),
+# so a slow remote job can never hold back latency-sensitive work.
+# Queues share the connection and options of settings.HUEY, tasks are routed
+# to a queue where they are defined with the decorators below.
+
+INTERACTIVE = "interactive"
+REMOTE_IO = "remote-io"
+CPU_BOUND = "cpu-bound"
+PIPELINE_BATCH = "pipeline-batch"
+
+
+def _build_queue(name: str, config: dict):
+    huey_config = {k: v for k, v in settings.HUEY.items() if k not in ["name", "huey_class", "connection", "consumer"]}
+    huey_config.update(settings.HUEY.get("connection", {}))
+    huey_class = get_backend(config.get("huey_class", settings.HUEY.get("huey_class", "huey.RedisHuey")))
+    return huey_class(f"{settings.HUEY['name']}-{name}", **huey_config)
+
+QUEUES = {name: _build_queue(name, config) for name, config in settings.HUEY_QUEUES.items()}
+
+# Used to get the huey instance of a queue
+def get_queue(name: str):
+    try:
+        return QUEUES[name]
+    except KeyError:
+        raise ValueError(f"Unknown huey queue {name}.")
+
+# Used to get the consumer options of a queue
+# Queue options are layered on top of settings.HUEY['consumer']
+def consumer_options(name: str) -> dict:
+    get_queue(name)
+    options = dict(settings.HUEY.get("consumer", {}))
+    options.update(settings.HUEY_QUEUES[name].get("consumer", {}))
+    return options
+
+# Task decorators
+# They mirror huey.contrib.djhuey but take the name of the queue first
+
+def task(queue: str, *args, **kwargs):
+    def decorator(fn):
+        ret = get_queue(queue).task(*args, **kwargs)(fn)
+        ret.queue = queue
+        return ret
+    return decorator
+
+def db_task(queue: str, *args, **kwargs):
+    def decorator(fn):
+        ret = get_queue(queue).task(*args, **kwargs)(close_db(fn))
+        ret.call_local = fn
+        ret.queue = queue
+        return ret
+    return decorator
+
+def db_periodic_task(queue: str, *args, **kwargs):
+    def decorator(fn):
+        ret = get_queue(queue).periodic_task(*args, **kwargs)(close_db(fn))
+        ret.call_local = fn
+        ret.queue = queue
+        return ret
+    return decorator
+
+# Signal handlers are connected to every queue
+def signal(*signals):
+    def decorator(fn):
+        for huey in QUEUES.values():
+            huey.signal(*signals)(fn)
+        return fn
+    return decorator
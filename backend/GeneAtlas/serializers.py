@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.core.validators import RegexValidator
@@ -6,7 +7,9 @@ from rest_framework import serializers
 from AccessControl.models import CustomUser
 
 from .models import (
+    AnnotationRevision,
     AsyncTasksCache,
+    ChangeLog,
     Gene,
     GeneAnnotation,
     GeneAnnotationStatus,
@@ -14,6 +17,7 @@ from .models import (
     Peptide,
     PeptideAnnotation,
 )
+from .pipelines import PIPELINES
 
 
 class GenomeSerializer(serializers.ModelSerializer):
@@ -48,9 +52,54 @@ class GenomeQuerySerializer(serializers.Serializer):
     gc_content = serializers.FloatField(required=False, allow_null=True)
     annotation = serializers.BooleanField(required=False, allow_null=True)
 
-class GeneSerializer(serializers.ModelSerializer):
+class SparseFieldsetSerializer(serializers.ModelSerializer):
+    """Model serializer restricted to the fields requested with ?fields= / ?exclude=
+    / the same fields are loaded from the database (see restrict)"""
+
+    # Fields of the compact list shape, requested with fields=compact
+    COMPACT_FIELDS = ()
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    # Used to get the fields requested with ?fields= / ?exclude=, None for every field
+    @classmethod
+    def fieldset(cls, request, compact: bool = False):
+        split = lambda value: [name.strip() for name in value.split(",") if name.strip()]
+        return cls.select(split(request.GET.get("fields", "")), split(request.GET.get("exclude", "")), compact)
+
+    # Used to resolve lists of fields, None for every field
+    # Without fields the compact shape is used when compact is True, excluded removes fields from it
+    @classmethod
+    def select(cls, fields: list, excluded: list, compact: bool = False):
+        every = list(cls().fields)
+        if fields:
+            fields = [field for name in fields for field in {"compact": cls.COMPACT_FIELDS, "all": every}.get(name, [name])]
+        else:
+            fields = list(cls.COMPACT_FIELDS) if compact else every
+        unknown = sorted(set(fields + excluded) - set(every))
+        if unknown:
+            raise serializers.ValidationError({"fields": [f"Unknown field(s): {', '.join(unknown)}."]})
+        fields = [name for name in dict.fromkeys(fields) if name not in excluded]
+        return None if fields == every else fields
+
+    # Used to load only the requested fields, the primary key is always loaded
+    @classmethod
+    def restrict(cls, queryset, fields):
+        if fields is None:
+            return queryset
+        model = cls.Meta.model
+        return queryset.only(model._meta.pk.name, *(name for name in fields if name in {f.name for f in model._meta.concrete_fields}))
+
+class GeneSerializer(SparseFieldsetSerializer):
     """Formats gene data for API responses 
     / validates gene data from user before saving"""
+
+    COMPACT_FIELDS = ("name", "genome", "start", "end", "length", "gc_content", "annotated")
+
     class Meta:
         model = Gene
         fields = '__all__'
@@ -63,14 +112,18 @@ class GeneQuerySerializer(serializers.Serializer):
     gc_content = serializers.FloatField(required=False, allow_null=True) 
     annotated = serializers.BooleanField(required=False, allow_null=True) 
     limit = serializers.IntegerField(required=False, allow_null=True)
+    page_size = serializers.IntegerField(required=False, allow_null=True, min_value=1)
     sequence__icontains = serializers.CharField(required=False, allow_null=True, max_length=100, validators=[RegexValidator(regex=r"^[CAGTcagt]+$", message="Invalid motif")])
     sequence__endswith = serializers.CharField(required=False, allow_null=True, max_length=100, validators=[RegexValidator(regex=r"^[CAGTcagt]+$", message="Invalid motif")])
     sequence__startswith = serializers.CharField(required=False, allow_null=True, max_length=100, validators=[RegexValidator(regex=r"^[CAGTcagt]+$", message="Invalid motif")])
     sequence__iexact = serializers.CharField(required=False, allow_null=True, max_length=100, validators=[RegexValidator(regex=r"^[CAGTcagt]+$", message="Invalid motif")])
 
-class PeptideSerializer(serializers.ModelSerializer):
+class PeptideSerializer(SparseFieldsetSerializer):
     """Formats peptide data for API responses 
     / validates peptide data from user before saving"""
+
+    COMPACT_FIELDS = ("name", "gene", "length")
+
     class Meta:
         model = Peptide
         fields = '__all__'
@@ -82,6 +135,7 @@ class PeptideQuerySerializer(serializers.Serializer):
     length = serializers.IntegerField(required=False, allow_null=True)
     gene__annotated = serializers.BooleanField(required=False, allow_null=True)
     limit = serializers.IntegerField(required=False, allow_null=True)
+    page_size = serializers.IntegerField(required=False, allow_null=True, min_value=1)
     sequence__icontains = serializers.CharField(required=False, allow_null=True, max_length=100, validators=[RegexValidator(regex=r"^[ACDEFGHIKLMNPQRSTVWY]+$", message="Invalid motif")])
     sequence__endswith = serializers.CharField(required=False, allow_null=True, max_length=100, validators=[RegexValidator(regex=r"^[ACDEFGHIKLMNPQRSTVWY]+$", message="Invalid motif")])
     sequence__startswith = serializers.CharField(required=False, allow_null=True, max_length=100, validators=[RegexValidator(regex=r"^[ACDEFGHIKLMNPQRSTVWY]+$", message="Invalid motif")])
@@ -106,9 +160,10 @@ class GeneAnnotationStatusSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ('status',)
 
+    # The annotator is read from the instance, lists select it with the statuses (select_related("annotator"))
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        if instance.annotator:
+        if instance.annotator_id is not None:
             representation["annotator"] = instance.annotator.username
         return representation
 
@@ -122,15 +177,76 @@ class PeptideAnnotationSerializer(serializers.ModelSerializer):
         representation = super().to_representation(instance)
         return representation
     
+class BatchLookupInputSerializer(serializers.Serializer):
+    """Validates batch lookup parameters from user"""
+    model = serializers.ChoiceField(choices=["gene", "peptide", "annotation"])
+    names = serializers.ListField(child=serializers.CharField(max_length=100), allow_empty=False,
+                                  max_length=settings.BATCH_LOOKUP["max_items"])
+    fields = serializers.ListField(child=serializers.CharField(max_length=100), required=False, default=list)
+    exclude = serializers.ListField(child=serializers.CharField(max_length=100), required=False, default=list)
+
+class GeneBulkItemSerializer(serializers.Serializer):
+    """Validates one gene of a bulk creation / length and GC content are computed"""
+    name = serializers.CharField(max_length=100, validators=[RegexValidator(regex=r"^[A-Z]{3}[0-9]+$", message="Invalid gene name")])
+    genome = serializers.CharField(max_length=100)
+    start = serializers.IntegerField()
+    end = serializers.IntegerField()
+    header = serializers.CharField(required=False)
+    sequence = serializers.CharField(validators=[RegexValidator(regex=r"^[CAGT]+$", message="Invalid gene sequence")])
+
+class PeptideBulkItemSerializer(serializers.Serializer):
+    """Validates one peptide of a bulk creation / length is computed"""
+    name = serializers.CharField(max_length=100, validators=[RegexValidator(regex=r"^[A-Z]{3}[0-9]+$", message="Invalid peptide name")])
+    gene = serializers.CharField(max_length=100)
+    header = serializers.CharField(required=False)
+    sequence = serializers.CharField(validators=[RegexValidator(regex=r"^[ACDEFGHIKLMNPQRSTVWY]+$", message="Invalid peptide sequence")])
+
+class AnnotationBulkItemSerializer(serializers.Serializer):
+    """Validates one gene / peptide annotation of a bulk annotation update"""
+    gene_instance = serializers.CharField(max_length=100)
+    strand = serializers.IntegerField(required=False, allow_null=True)
+    gene = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    gene_biotype = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    transcript_biotype = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    gene_symbol = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    description = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    peptide = serializers.CharField(required=False, allow_null=True, max_length=100)
+    transcript = serializers.CharField(required=False, allow_blank=True)
+
+class AnnotationRevisionSerializer(serializers.ModelSerializer):
+    """Formats annotation revisions for API responses"""
+    class Meta:
+        model = AnnotationRevision
+        fields = ["gene", "revision", "peptide", "changes", "created_at"]
+
+class AnnotationHistoryInputSerializer(serializers.Serializer):
+    """Validates annotation history parameters from user"""
+    gene = serializers.CharField(required=False, allow_null=True, max_length=100)
+    genome = serializers.CharField(required=False, allow_null=True, max_length=100)
+    as_of = serializers.DateTimeField(required=False, allow_null=True)
+
+class ChangeLogSerializer(serializers.ModelSerializer):
+    """Formats change feed entries for API responses"""
+    class Meta:
+        model = ChangeLog
+        fields = ["id", "model", "key", "action", "fields", "created_at"]
+
+class ChangeFeedInputSerializer(serializers.Serializer):
+    """Validates change feed parameters from user"""
+    after = serializers.IntegerField(required=False, min_value=0, default=0)
+    limit = serializers.IntegerField(required=False, min_value=1, allow_null=True)
+    model = serializers.ChoiceField(required=False, choices=ChangeLog.MODEL_CHOICES, allow_null=True)
+
 class TaskSerializer(serializers.ModelSerializer):
     """Formats task data for API responses"""
     class Meta:
         model = AsyncTasksCache
-        fields = ["key", "task", "user", "state", "error_message", "created_at", "updated_at"]
+        fields = ["key", "task", "user", "state", "items_total", "items_done", "items_failed", "error_message", "created_at", "updated_at"]
 
+    # The user is read from the instance, lists select it with the tasks (select_related("user"))
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        if instance.user:
+        if instance.user_id is not None:
             representation["user"] = instance.user.username
         return representation
 
@@ -139,7 +255,7 @@ class TaskInputSerializer(serializers.Serializer):
     key = serializers.UUIDField(required=False, allow_null=True)
     state = serializers.ChoiceField(required=False, choices=AsyncTasksCache.STATUS_CHOICES, allow_blank=True, allow_null=True)
     user = serializers.CharField(required=False, max_length=150, validators=[UnicodeUsernameValidator()], allow_null=True)
-    task = serializers.ChoiceField(required=False, choices=["BLAST","PFAMScan"], allow_blank=True, allow_null=True)
+    task = serializers.ChoiceField(required=False, choices=["BLAST","PFAMScan","PIPELINE"], allow_blank=True, allow_null=True)
 
 class BlastQueryInputSerializer(serializers.Serializer):
     """Validates BLAST query parameters from user"""
@@ -155,10 +271,38 @@ class BlastRunInputSerializer(serializers.Serializer):
 class StatsInputSerializer(serializers.Serializer):
     """Validates parameters from user"""
     user = serializers.CharField(required=False, max_length=150, validators=[UnicodeUsernameValidator()], allow_null=True)
+    list = serializers.ChoiceField(required=False, choices=["ongoing", "pending", "approved", "rejected"], allow_null=True)
+
+class ThroughputInputSerializer(serializers.Serializer):
+    """Validates throughput time series parameters from user"""
+    start = serializers.DateTimeField(required=False, allow_null=True)
+    end = serializers.DateTimeField(required=False, allow_null=True)
+    granularity = serializers.ChoiceField(required=False, choices=["hour", "day"], default="day")
+    group = serializers.ChoiceField(required=False, choices=["annotator", "genome"], allow_null=True)
+    genome = serializers.CharField(required=False, max_length=100, allow_null=True)
+    annotator = serializers.CharField(required=False, max_length=150, validators=[UnicodeUsernameValidator()], allow_null=True)
+
+class ExportInputSerializer(serializers.Serializer):
+    """Validates genome export parameters from user"""
+    genome = serializers.CharField(required=True, max_length=100)
+    # Not named format, which DRF reserves to pick the renderer
+    output = serializers.ChoiceField(required=False, choices=["fasta", "gff3", "genbank"], default="fasta")
+
+class ColumnarExportInputSerializer(serializers.Serializer):
+    """Validates columnar export parameters from user"""
+    table = serializers.ChoiceField(required=True, choices=["gene", "peptide", "annotation"])
+    output = serializers.ChoiceField(required=False, choices=["arrow", "parquet"], default="arrow")
+    fields = serializers.CharField(required=False, allow_null=True)
+    genome = serializers.CharField(required=False, max_length=100, allow_null=True)
 
 class PFAMRunInputSerializer(serializers.Serializer):
     """Validates PFAM run parameters from user"""
     peptide = serializers.CharField(required=True, max_length=150, validators=[RegexValidator(regex=r"^[A-Z]{3}[0-9]+$", message="Invalid peptide name")])
     evalue = serializers.FloatField(required=False, allow_null=True)
     asp = serializers.BooleanField(required=False, allow_null=True)
-    # user = serializers.PrimaryKeyRelatedField(queryset=CustomUser.objects.all(), required=True)
\ No newline at end of file
+    # user = serializers.PrimaryKeyRelatedField(queryset=CustomUser.objects.all(), required=True)
+
+class PipelineRunInputSerializer(serializers.Serializer):
+    """Validates pipeline run parameters from user"""
+    genome = serializers.CharField(required=True, max_length=100)
+    pipeline = serializers.ChoiceField(required=False, choices=list(PIPELINES.keys()), allow_null=True)
@@ -1,11 +1,30 @@
-from django.db.models import Count
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 
-from .models import Gene, GeneAnnotation, GeneAnnotationStatus, Genome
-from .tasks import send_annotation_mail
+from .models import (
+    AnnotationRevision,
+    ChangeLog,
+    ExportArtifact,
+    Gene,
+    GeneAnnotation,
+    GeneAnnotationStatus,
+    Genome,
+    Peptide,
+    PeptideAnnotation,
+    StatsSnapshot,
+    ThroughputRollup,
+)
+from .tasks import notify_annotators
 
 
+@receiver(post_save, sender=Gene)
+def record_gene_change(sender, instance, created, **kwargs):
+    """Add a saved gene to the change feed"""
+    if created:
+        ChangeLog.record(ChangeLog.gene, ChangeLog.created, [(instance.pk, [])])
+    elif instance.changed_fields():
+        ChangeLog.record(ChangeLog.gene, ChangeLog.updated, [(instance.pk, instance.changed_fields())])
+
 @receiver(post_save, sender=Gene)
 def create_gene_status(sender, instance, created, **kwargs):
     """Create initial pending status when new gene is created /
@@ -17,44 +36,70 @@ def create_gene_status(sender, instance, created, **kwargs):
 @receiver(pre_save, sender=GeneAnnotationStatus)
 def handle_status_change(sender, instance, **kwargs):
     """Handle status updates before saving"""
-    try:
-        original = GeneAnnotationStatus.objects.get(pk=instance.pk)
-        if original.status != instance.status:
-            
-            if instance.status == GeneAnnotationStatus.REJECTED:
-                Gene.objects.filter(pk=instance.gene.pk).update(annotated=False)
-                send_annotation_mail(obj=instance, mail_type='update')
-            elif instance.status == GeneAnnotationStatus.APPROVED:
-                Gene.objects.filter(pk=instance.gene.pk).update(annotated=True)
-                send_annotation_mail(obj=instance, mail_type='update')   
-    except GeneAnnotationStatus.DoesNotExist:
-        pass
+    if instance._state.adding:
+        instance._original_status = None
+        return
+    # The status loaded with the instance avoids fetching the row again
+    if instance.is_tracked("status"):
+        original = instance.loaded_value("status")
+    else:
+        original = GeneAnnotationStatus.objects.filter(pk=instance.pk).values_list("status", flat=True).first()
+    # Kept for the genome counters updated after saving
+    instance._original_status = original
+    if original is not None and original != instance.status:
+
+        if instance.status == GeneAnnotationStatus.REJECTED:
+            Gene.objects.filter(pk=instance.gene_id).update(annotated=False)
+            ChangeLog.record(ChangeLog.gene, ChangeLog.updated, [(instance.gene_id, ["annotated"])])
+        elif instance.status == GeneAnnotationStatus.APPROVED:
+            Gene.objects.filter(pk=instance.gene_id).update(annotated=True)
+            ChangeLog.record(ChangeLog.gene, ChangeLog.updated, [(instance.gene_id, ["annotated"])])
+
+# Used to get the genome of a status without fetching its gene when it is not loaded
+def _genome_of(instance):
+    if GeneAnnotationStatus.gene.is_cached(instance):
+        return instance.gene.genome_id
+    return Gene.objects.filter(pk=instance.gene_id).values("genome")[:1]
+
+@receiver(post_save, sender=GeneAnnotationStatus)
+def record_throughput(sender, instance, created, **kwargs):
+    """Count a submission / approval / rejection in the throughput rollups"""
+    # Connected before update_genome_status, which resets the original status
+    if instance.status in ThroughputRollup.COUNTERS and getattr(instance, "_original_status", None) != instance.status:
+        if GeneAnnotationStatus.gene.is_cached(instance):
+            genome = instance.gene.genome_id
+        else:
+            genome = Gene.objects.filter(pk=instance.gene_id).values_list("genome", flat=True).first()
+        ThroughputRollup.record([(genome, instance.annotator_id, instance.status)])
 
 @receiver(post_save, sender=GeneAnnotationStatus)
 def update_genome_status(sender, instance, created, **kwargs):
-    """Check if genome is fully annotated"""
+    """Update the annotation counters of the genome / 
+    the genome is annotated once all of its genes are approved /
+    notify the annotator of an approval or a rejection"""
+    original = getattr(instance, "_original_status", None)
+    if created or original is None:
+        Genome.update_counters(_genome_of(instance), {instance.status: 1}, total=1)
+    elif original != instance.status:
+        Genome.update_counters(_genome_of(instance), {original: -1, instance.status: 1})
+        if instance.status in [GeneAnnotationStatus.APPROVED, GeneAnnotationStatus.REJECTED]:
+            notify_annotators([(instance.gene_id, instance.annotator_id, instance.status)], 'update')
+    instance._original_status = instance.status
+
+@receiver(post_save, sender=GeneAnnotationStatus)
+def invalidate_user_stats(sender, instance, created, **kwargs):
+    """Drop the cached annotation counts of the annotators of a changed status"""
+    if created or instance.has_changed("status") or instance.has_changed("annotator"):
+        GeneAnnotationStatus.invalidate_stats([instance.annotator_id, instance.loaded_value("annotator")])
+
+@receiver(post_delete, sender=GeneAnnotationStatus)
+def release_genome_status(sender, instance, **kwargs):
+    """Remove a deleted status from the counters of its genome / 
+    drop the cached annotation counts of its annotator"""
+    GeneAnnotationStatus.invalidate_stats([instance.annotator_id])
     try:
-        if isinstance(instance, GeneAnnotationStatus):
-            manager = Genome.objects.filter(pk=instance.gene.genome.pk)
-            if(manager.count() == 1):
-                genome = manager.first()
-                if not created:
-                    if instance.status == GeneAnnotationStatus.REJECTED or instance.status == GeneAnnotationStatus.APPROVED:
-                        status_counts = GeneAnnotationStatus.objects.values(
-                            'gene__genome', 
-                            'status'
-                        ).filter(gene__genome=genome).annotate(
-                            count=Count('status')
-                        )
-                        if len(status_counts) == 1 and status_counts[0]['status'] == GeneAnnotationStatus.APPROVED:
-                            manager.update(annotation=True)
-                        else:
-                            manager.update(annotation=False)
-                elif created:
-                    manager.update(annotation=False)
-            else:
-                pass
-    except Genome.DoesNotExist:
+        Genome.update_counters(_genome_of(instance), {instance.status: -1}, total=-1)
+    except Gene.DoesNotExist:
         pass
     
 
@@ -64,11 +109,95 @@ def reset_rejected_status_if_updated(sender, instance, created, **kwargs):
     """
     If an annotation is added/updated and its status was REJECTED / SUBMITTED, reset it to ONGOING.
     """
+    # Saving an unchanged annotation is not an update
+    if not created and not instance.changed_fields():
+        return
     try:
-        existing_status = GeneAnnotationStatus.objects.get(gene=instance.gene_instance)
+        existing_status = instance.status
 
         if existing_status.status == GeneAnnotationStatus.REJECTED or existing_status.status == GeneAnnotationStatus.PENDING:
             existing_status.reset()
 
     except GeneAnnotationStatus.DoesNotExist:
-        pass
\ No newline at end of file
+        pass
+
+@receiver(post_save, sender=GeneAnnotation)
+def record_gene_annotation_revision(sender, instance, created, **kwargs):
+    """Append the changed fields of a gene annotation to its history"""
+    changes = AnnotationRevision.delta(instance, AnnotationRevision.GENE_FIELDS, created)
+    if changes is not None:
+        AnnotationRevision.record([(instance.gene_instance_id, None, changes)])
+
+@receiver(post_save, sender=PeptideAnnotation)
+def record_peptide_annotation_revision(sender, instance, created, **kwargs):
+    """Append the changed fields of a peptide annotation to the history of its gene"""
+    changes = AnnotationRevision.delta(instance, AnnotationRevision.PEPTIDE_FIELDS, created)
+    if changes is not None:
+        AnnotationRevision.record([(instance.annotation_id, instance.peptide_id, changes)])
+
+# Change feed
+# The models save in a transaction, the change rows are committed with the change
+# (record_gene_change is connected first so that a gene is listed before its status and annotation)
+
+@receiver(post_save, sender=GeneAnnotation)
+@receiver(post_save, sender=GeneAnnotationStatus)
+def record_annotation_change(sender, instance, created, **kwargs):
+    """Add a saved gene annotation / annotation status to the change feed, unless nothing changed"""
+    model = ChangeLog.annotation if sender is GeneAnnotation else ChangeLog.status
+    if created:
+        ChangeLog.record(model, ChangeLog.created, [(instance.pk, [])])
+    elif instance.changed_fields():
+        ChangeLog.record(model, ChangeLog.updated, [(instance.pk, instance.changed_fields())])
+
+@receiver(post_delete, sender=Gene)
+@receiver(post_delete, sender=GeneAnnotation)
+@receiver(post_delete, sender=GeneAnnotationStatus)
+def record_deletion(sender, instance, **kwargs):
+    """Add a deleted gene / gene annotation / annotation status to the change feed"""
+    model = {Gene: ChangeLog.gene, GeneAnnotation: ChangeLog.annotation, GeneAnnotationStatus: ChangeLog.status}[sender]
+    ChangeLog.record(model, ChangeLog.deleted, [(instance.pk, [])])
+
+# Dashboard statistics
+# Each save / delete applies its delta to the snapshot and bumps the version of its table,
+# see StatsSnapshot.reconcile for the full recount
+
+# Used to get the change of a numeric field since the instance was loaded
+def _delta(instance, field: str, created: bool):
+    if created:
+        return getattr(instance, field)
+    if instance.is_tracked(field):
+        return getattr(instance, field) - instance.loaded_value(field)
+    return 0
+
+@receiver(post_save, sender=Genome)
+def update_genome_stats(sender, instance, created, **kwargs):
+    """Add a saved genome to the dashboard statistics"""
+    StatsSnapshot.apply(genome_count=int(created), genome_length=_delta(instance, "length", created), genome_version=1)
+
+@receiver(post_save, sender=Gene)
+def update_gene_stats(sender, instance, created, **kwargs):
+    """Add a saved gene to the dashboard statistics"""
+    StatsSnapshot.apply(gene_count=int(created), gene_length=_delta(instance, "length", created),
+                        gene_gc_content=_delta(instance, "gc_content", created), gene_version=1)
+
+@receiver(post_save, sender=Peptide)
+def update_peptide_stats(sender, instance, created, **kwargs):
+    """Add a saved peptide to the dashboard statistics"""
+    StatsSnapshot.apply(peptide_count=int(created), peptide_length=_delta(instance, "length", created), peptide_version=1)
+
+@receiver(post_delete, sender=Genome)
+@receiver(post_delete, sender=Gene)
+@receiver(post_delete, sender=Peptide)
+def release_stats(sender, instance, **kwargs):
+    """Remove a deleted genome / gene / peptide from the dashboard statistics"""
+    if sender is Genome:
+        StatsSnapshot.apply(genome_count=-1, genome_length=-instance.length, genome_version=1)
+    elif sender is Gene:
+        StatsSnapshot.apply(gene_count=-1, gene_length=-instance.length, gene_gc_content=-instance.gc_content, gene_version=1)
+    else:
+        StatsSnapshot.apply(peptide_count=-1, peptide_length=-instance.length, peptide_version=1)
+
+@receiver(post_delete, sender=ExportArtifact)
+def remove_export_file(sender, instance, **kwargs):
+    """Remove the file of a deleted export (e.g. with its genome)"""
+    ExportArtifact.discard(instance.path)
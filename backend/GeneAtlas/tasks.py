@@ -1,47 +1,147 @@
 import io
 import json
+import threading
+import time
 from datetime import timedelta
-from time import sleep
+from functools import reduce
+from itertools import groupby
+from operator import or_
 from zipfile import ZipFile
 
 import huey.signals as signals
 import requests
 from Bio import Blast, SeqIO
-from django.core.mail import EmailMultiAlternatives
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Q
 from django.template.loader import render_to_string
 from django.utils import timezone
 from huey import crontab
-from huey.contrib.djhuey import db_periodic_task, signal, task
 
 from AccessControl.models import CustomUser
 
-from .models import AsyncTasksCache, GeneAnnotationStatus
+from .models import (
+    AsyncTasksCache,
+    ChangeLog,
+    GeneAnnotationStatus,
+    Notification,
+    Peptide,
+    StatsSnapshot,
+)
+from .queues import INTERACTIVE, REMOTE_IO, db_periodic_task, db_task, get_queue, signal, task
+
+# Default parameters of the analyses
+# Shared by the API views and the pre-computation so that both hit the same cache entries
+BLAST_DEFAULTS = {"program": "blastn", "database": "nt", "evalue": 0.001}
+PFAM_DEFAULTS = {"evalue": 0.001, "asp": True}
 
 # Signals for the async tasks
+# A cancelled task keeps its state whatever the outcome of the run
 
 @signal(signals.SIGNAL_COMPLETE)
 def task_success(signal, task):
-    if(task.name in ["run_blast","pfamscan"]):
-        AsyncTasksCache.objects.filter(storage=task.id).update(state=AsyncTasksCache.completed)
+    if(task.name in ["run_blast","pfamscan","join_pipeline"]):
+        AsyncTasksCache.objects.filter(storage=task.id).exclude(state=AsyncTasksCache.cancelled).update(state=AsyncTasksCache.completed, updated_at=timezone.now())
     else:
         pass
 
 @signal(signals.SIGNAL_ERROR)
 def task_failure(signal, task, exc):
+    if(task.name in ["run_blast","pfamscan","join_pipeline"]):
+        AsyncTasksCache.objects.filter(storage=task.id).exclude(state=AsyncTasksCache.cancelled).update(state=AsyncTasksCache.rejected, error_message = str(exc), updated_at=timezone.now())
+    else:
+        pass
+
+@signal(signals.SIGNAL_REVOKED)
+def task_revoked(signal, task):
     if(task.name in ["run_blast","pfamscan"]):
-        AsyncTasksCache.objects.filter(storage=task.id).update(state=AsyncTasksCache.rejected, error_message = str(exc))
+        AsyncTasksCache.objects.filter(storage=task.id).update(state=AsyncTasksCache.cancelled, updated_at=timezone.now())
+    else:
+        pass
+
+@signal(signals.SIGNAL_EXPIRED)
+def task_expired(signal, task):
+    if(task.name in ["run_blast","pfamscan"]):
+        AsyncTasksCache.objects.filter(storage=task.id).update(state=AsyncTasksCache.rejected, error_message="Task expired in the queue.", updated_at=timezone.now())
     else:
         pass
 
 @signal(signals.SIGNAL_EXECUTING)
 def task_start(signal, task):
     if(task.name in ["run_blast","pfamscan"]):
-        AsyncTasksCache.objects.filter(storage=task.id).update(state=AsyncTasksCache.in_progress)
+        AsyncTasksCache.objects.filter(storage=task.id).update(state=AsyncTasksCache.in_progress, updated_at=timezone.now())
     else: 
         pass
 
-@task()
-def send_annotation_mail(obj: GeneAnnotationStatus, mail_type: str) -> int:
+# Timeouts of the async tasks
+
+class TaskCancelled(Exception):
+    pass
+
+class TaskTimeout(Exception):
+    pass
+
+class TaskGuard:
+    """Enforces the soft / hard timeouts of a running task and aborts it when
+    it has been cancelled (revoked) while running"""
+
+    # Seconds between two checks while waiting
+    interval = 1.0
+
+    def __init__(self, task_type: str, queue: str, task):
+        timeouts = settings.HUEY_TASK_TIMEOUTS.get(task_type, {})
+        self.task_type = task_type
+        self.huey = get_queue(queue)
+        self.task = task
+        self.soft = timeouts.get("soft", None)
+        self.hard = timeouts.get("hard", None)
+        self.started = time.monotonic()
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    # Soft timeout: the task is expected to wrap up by itself
+    def soft_expired(self) -> bool:
+        return self.soft is not None and self.elapsed() > self.soft
+
+    # Hard timeout and cancellation: the task is aborted
+    def check(self):
+        if self.task is not None and self.huey.is_revoked(self.task):
+            self.huey.restore(self.task)
+            raise TaskCancelled(f"{self.task_type} task cancelled.")
+        if self.hard is not None and self.elapsed() > self.hard:
+            raise TaskTimeout(f"{self.task_type} task exceeded its hard timeout of {self.hard}s.")
+
+    # Used to wait without holding the worker past a cancellation or the hard timeout
+    def sleep(self, seconds: float):
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            self.check()
+            time.sleep(min(self.interval, max(end - time.monotonic(), 0)))
+        self.check()
+
+    # Used to run a blocking call (e.g. qblast) in a daemon thread
+    # The worker is given back as soon as the task is cancelled or times out,
+    # the abandoned call finishes in the background
+    def call(self, fn, *args, **kwargs):
+        outcome = {}
+        def _run():
+            try:
+                outcome["result"] = fn(*args, **kwargs)
+            except Exception as e:
+                outcome["error"] = e
+        thread = threading.Thread(target=_run, daemon=True)
+        thread.start()
+        while thread.is_alive():
+            self.check()
+            thread.join(self.interval)
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["result"]
+
+# Used to build the email sent to the annotator of a status
+def _annotation_message(obj: GeneAnnotationStatus, mail_type: str) -> EmailMultiAlternatives:
 
     # Define the template based on the mail type
     if mail_type == "assigned":
@@ -73,15 +173,68 @@ def send_annotation_mail(obj: GeneAnnotationStatus, mail_type: str) -> int:
         to=[obj.annotator.email],
     )
 
-    # Attach the HTML content to the email instance and send.
+    # Attach the HTML content to the email instance.
     msg.attach_alternative(html_content, "text/html")
-    return msg.send()
-
-@task()
-def run_blast(sequence, program, database, evalue):
+    return msg
+
+# Used to notify the annotators of many statuses at once, over a single SMTP connection
+@db_task(INTERACTIVE)
+def send_annotation_mails(genes: list, mail_type: str) -> int:
+    statuses = GeneAnnotationStatus.objects.filter(gene__in=genes, annotator__isnull=False).select_related("annotator", "gene")
+    messages = [_annotation_message(obj, mail_type) for obj in statuses]
+    if not messages:
+        return 0
+    with get_connection() as connection:
+        return connection.send_messages(messages)
+
+# Used to notify the annotators of status changes given as (gene, annotator, status) tuples
+# Events go to the outbox unless immediate mails are enabled, in both cases once the transaction is committed
+def notify_annotators(events: list, mail_type: str):
+    events = [event for event in events if event[1] is not None]
+    if not events:
+        return
+    if settings.NOTIFICATIONS["immediate"]:
+        transaction.on_commit(lambda: send_annotation_mails([gene for gene, _, _ in events], mail_type))
+    else:
+        transaction.on_commit(lambda: Notification.queue(events, mail_type))
+
+# Used to send the pending notifications as one digest per recipient, over a single SMTP connection
+@db_periodic_task(INTERACTIVE, crontab(minute=settings.NOTIFICATIONS["digest"]))
+def send_notification_digests() -> int:
+    pending = Notification.objects.select_related("recipient").order_by("recipient", "created_at")
+    digests = []
+    for recipient, events in groupby(pending, key=lambda n: n.recipient):
+        events = list(events)
+        context = {"user": recipient, "events": events}
+        msg = EmailMultiAlternatives(
+            subject="Annotation Updates",
+            body=render_to_string(template_name="emails/email_annotation_digest.txt", context=context),
+            to=[recipient.email],
+        )
+        msg.attach_alternative(render_to_string(template_name="emails/email_annotation_digest.html", context=context), "text/html")
+        digests.append((msg, [(event.pk, event.created_at) for event in events]))
+    sent = []
+    try:
+        with get_connection() as connection:
+            for msg, ids in digests:
+                if connection.send_messages([msg]):
+                    sent.extend(ids)
+    finally:
+        # Only the events as they were rendered are removed, an event coalesced since then has a new created_at and stays in the outbox
+        rendered = {}
+        for pk, created_at in sent:
+            rendered.setdefault(created_at, []).append(pk)
+        if rendered:
+            Notification.objects.filter(reduce(or_, (Q(created_at=created_at, pk__in=pks) for created_at, pks in rendered.items()))).delete()
+    return len(sent)
+
+@task(REMOTE_IO, priority=10, context=True, expires=settings.HUEY_TASK_TIMEOUTS["BLAST"]["expires"])
+def run_blast(sequence, program, database, evalue, task=None):
+
+    guard = TaskGuard("BLAST", REMOTE_IO, task)
     
     # Call the BLAST service with the provided parameters
-    blast_result = Blast.qblast(program=program, database=database, sequence=sequence, expect=evalue, format_type="JSON2")
+    blast_result = guard.call(Blast.qblast, program=program, database=database, sequence=sequence, expect=evalue, format_type="JSON2")
     raw_bytes = blast_result.read()
 
     try:
@@ -99,14 +252,23 @@ def run_blast(sequence, program, database, evalue):
     except Exception as e:
         return {"error": str(e)}
     
-@db_periodic_task(crontab(minute='*/60'))
+@db_periodic_task(INTERACTIVE, crontab(minute='*/60'))
 def check_task_sync():
 
     # Check if tasks has been in the database for more than time limit
     AsyncTasksCache.objects.filter(updated_at__lt=timezone.now() - timedelta(hours=24)).delete()
 
-@task()
-def pfamscan(sequence: str, evalue: float, asp: bool, user) -> dict:
+@db_periodic_task(INTERACTIVE, crontab(minute='*/5'))
+def reconcile_tasks():
+
+    # Reject the tasks whose worker died or that outlived their timeouts
+    # so that they are resubmitted on the next request
+    AsyncTasksCache.reconcile()
+
+@task(REMOTE_IO, priority=10, context=True, expires=settings.HUEY_TASK_TIMEOUTS["PFAMScan"]["expires"])
+def pfamscan(sequence: str, evalue: float, asp: bool, user, task=None) -> dict:
+
+    guard = TaskGuard("PFAMScan", REMOTE_IO, task)
 
     # Endpoints of the API
     RUN_URL = "https://www.ebi.ac.uk/Tools/services/rest/pfamscan/run/"
@@ -126,7 +288,7 @@ def pfamscan(sequence: str, evalue: float, asp: bool, user) -> dict:
                 "format": "json"}
 
     # Run the job
-    req = requests.post(RUN_URL, data=run_data)
+    req = guard.call(requests.post, RUN_URL, data=run_data, timeout=60)
 
     # Handle the request status code
     try:
@@ -139,34 +301,18 @@ def pfamscan(sequence: str, evalue: float, asp: bool, user) -> dict:
     except requests.exceptions.HTTPError as e:
         return {"error": str(e)}
 
-    # Number of call made to the API to check the status of the job
-    attempts = 0
-
-    # Attempt threshold to avoid infinite loop
-    attempts_threshold = 10
-
-    # Check the status of the job
-    if requests.get(STATUS_URL + job).text != "FINISHED":
-        
-        attempts += 1
+    # Check the status of the job every 1 minute
+    # until the soft timeout is reached
+    while guard.call(requests.get, STATUS_URL + job, timeout=60).text != "FINISHED":
 
-        # Wait for the job to finish
-        sleep(61)
+        if guard.soft_expired():
+            return {"error": "The job has been running for too long"}
 
-        # Make further calls to the API to check the status of the job
-        # Check the status of the job every 1 minute
-        while requests.get(STATUS_URL + job).text != "FINISHED":
-
-            attempts += 1
-
-            sleep(61)
-
-            if attempts > attempts_threshold:
-                return {"error": "The job has been running for too long"}
+        guard.sleep(61)
 
     # If code reaches this point, the job is finished
     # Retrieve the result of the job
-    result = requests.get(RESULT_URL + job + "/out")
+    result = guard.call(requests.get, RESULT_URL + job + "/out", timeout=60)
 
     # Handle the result
     try:
@@ -176,4 +322,73 @@ def pfamscan(sequence: str, evalue: float, asp: bool, user) -> dict:
         else:
             return {"status": str(result.status_code) + " - " + result.reason}
     except requests.exceptions.HTTPError as e:
-        return {"error": str(e)}
\ No newline at end of file
+        return {"error": str(e)}
+
+# Used to get the submissions left in the hourly budget of a remote service
+# Every cached analysis counts, user requests and pipelines included
+def remaining_budget(task_type: str) -> int:
+    used = AsyncTasksCache.objects.filter(task=task_type, created_at__gte=timezone.now() - timedelta(hours=1)).count()
+    return settings.ANALYSIS_PRECOMPUTE["budget"][task_type] - used
+
+@db_periodic_task(INTERACTIVE, crontab(minute='*/10'))
+def precompute_analyses() -> int:
+
+    config = settings.ANALYSIS_PRECOMPUTE
+    now = timezone.now()
+
+    # Only run within the configured window (UTC hours, may wrap around midnight)
+    start, end = config["window"]
+    if not config.get("enabled", True):
+        return 0
+    if not ((start <= now.hour < end) if start < end else (now.hour >= start or now.hour < end)):
+        return 0
+
+    # Tasks of unassigned genes are cached on behalf of the service user
+    service_user = CustomUser.objects.filter(username=config.get("user", None)).first() \
+        or CustomUser.objects.filter(is_superuser=True).order_by("pk").first()
+
+    # Assigned (ONGOING) genes come first
+    statuses = [GeneAnnotationStatus.ONGOING, GeneAnnotationStatus.RAW]
+    genes = GeneAnnotationStatus.objects.filter(status__in=statuses).select_related("gene", "annotator").order_by("status", "gene")
+    peptides = Peptide.objects.filter(gene__geneannotationstatus__status__in=statuses).select_related("gene__geneannotationstatus__annotator") \
+        .order_by("gene__geneannotationstatus__status", "name")
+
+    # Parameters of every analysis to be cached, with the user it is cached for
+    def _blast():
+        for obj in genes.iterator(chunk_size=500):
+            yield {"sequence": obj.gene.sequence, **BLAST_DEFAULTS}, obj.annotator or service_user
+    def _pfam():
+        for obj in peptides.iterator(chunk_size=500):
+            user = obj.gene.geneannotationstatus.annotator or service_user
+            if user is not None:
+                yield {"sequence": obj.sequence, **PFAM_DEFAULTS, "user": user.id}, user
+
+    submitted = 0
+    for task_type, task_funct, candidates in [("BLAST", run_blast, _blast()), ("PFAMScan", pfamscan, _pfam())]:
+        remaining = min(config["batch_size"], remaining_budget(task_type))
+        if remaining <= 0:
+            continue
+        cached = set(AsyncTasksCache.objects.filter(task=task_type).exclude(state__in=[AsyncTasksCache.rejected, AsyncTasksCache.cancelled])
+                     .values_list("params_hash", flat=True))
+        for params, user in candidates:
+            params_hash = AsyncTasksCache.hash_params(params)
+            if user is None or params_hash in cached:
+                continue
+            AsyncTasksCache.submit_task(task_type=task_type, task_params=params, task_funct=task_funct, user=user, priority=config.get("priority", 0))
+            cached.add(params_hash)
+            submitted += 1
+            remaining -= 1
+            if remaining == 0:
+                break
+
+    return submitted
+
+# Used to recount the dashboard statistics, incremental updates can drift (failed transactions, raw SQL, ...)
+@db_periodic_task(INTERACTIVE, crontab(minute='15'))
+def reconcile_stats() -> bool:
+    return StatsSnapshot.reconcile()
+
+# Used to delete the changes older than the retention of the change feed
+@db_periodic_task(INTERACTIVE, crontab(minute='30', hour='3'))
+def prune_changes() -> int:
+    return ChangeLog.prune(timezone.now() - timedelta(days=settings.CHANGE_FEED["retention"]))
@@ -1,3 +1,113 @@
-from django.test import TestCase
+import random
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.urls import resolve, reverse
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from AccessControl.models import CustomUser
+from GeneAtlas.models import (
+    AnnotationRevision,
+    AsyncTasksCache,
+    ChangeLog,
+    Gene,
+    GeneAnnotation,
+    GeneAnnotationStatus,
+    Genome,
+    Peptide,
+    PeptideAnnotation,
+    ThroughputRollup,
+)
+
+
+# Nothing is cached, every request does its whole work
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}})
+class QueryBudgetTests(TestCase):
+    """Number of queries of the list endpoints, at two volumes of data above every page size
+    / an endpoint whose count grows with the data fails at the second volume"""
+
+    # Genes seeded at the first volume, doubled for the second one
+    GENES = 150
+
+    # Endpoints checked: (url name, method, parameters, queries)
+    ENDPOINTS = [
+        ("genome_api", "get", {"all": "true", "limit": 50}, 3),
+        ("gene_api", "get", {"genome": "QBGENOME0", "limit": 100}, 3),
+        ("gene_api", "get", {"genome": "QBGENOME0", "page_size": 100}, 2),
+        ("peptide_api", "get", {"annotated": "False", "limit": 100}, 4),
+        ("peptide_api", "get", {"annotated": "False", "page_size": 100}, 3),
+        ("annotation_api", "get", {"gene_instance": "QBG0"}, 2),
+        ("status_api", "get", {"limit": 100}, 2),
+        ("status_api", "get", {"annotator": "qb_annotator0", "page_size": 100}, 2),
+        ("task_api", "get", {"page_size": 100}, 1),
+        ("task_api", "get", {"state": AsyncTasksCache.completed}, 1),
+        ("changes_api", "get", {"limit": 100}, 1),
+        ("stats_api", "get", {"user": "qb_annotator0", "list": "ongoing"}, 3),
+        ("stats_api", "get", {}, 2),
+        ("throughput_api", "get", {"granularity": "day", "group": "annotator"}, 1),
+        ("annotation_history_api", "get", {"genome": "QBGENOME0"}, 2),
+        ("batch_api", "post", {"model": "gene", "names": [f"QBG{i}" for i in range(200)]}, 1),
+        ("batch_api", "post", {"model": "annotation", "names": [f"QBG{i}" for i in range(200)]}, 1),
+        ("user_api_stats", "get", {"page_size": 100}, 1),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="qb_validator", email="qb_validator@example.com", role=CustomUser.validator, is_staff=True)
+        cls.annotators = [CustomUser.objects.create(username=f"qb_annotator{i}", email=f"qb_annotator{i}@example.com", role=CustomUser.annotator)
+                          for i in range(5)]
+        cls.genomes = []
+        for i in range(2):
+            genome = Genome(name=f"QBGENOME{i}", species="Query budget", sequence=b"ACGT" * 1000)
+            genome.save()
+            cls.genomes.append(genome)
+        cls.seed(0, cls.GENES)
+
+    # Used to add count genes (with their status, annotation, peptide, history and change rows) after the first ones
+    @classmethod
+    def seed(cls, start: int, count: int):
+        rng = random.Random(start)
+        now = timezone.now()
+        statuses = [status for status, _ in GeneAnnotationStatus.STATUS_CHOICES]
+        genes, rows = [], []
+        for i in range(start, start + count):
+            sequence = "".join(rng.choice("ACGT") for _ in range(300))
+            genes.append(Gene(name=f"QBG{i}", genome=cls.genomes[i % len(cls.genomes)], start=i * 300 + 1, end=(i + 1) * 300,
+                              header=f"QBG{i} cds", sequence=sequence, length=len(sequence), gc_content=0.5))
+            rows.append((f"QBG{i}", statuses[i % len(statuses)], cls.annotators[i % len(cls.annotators)]))
+        Gene.objects.bulk_create(genes)
+        GeneAnnotationStatus.objects.bulk_create([GeneAnnotationStatus(gene_id=gene, status=status, annotator=annotator, updated_at=now)
+                                                  for gene, status, annotator in rows])
+        GeneAnnotation.objects.bulk_create([GeneAnnotation(gene_instance_id=gene, status_id=gene, gene_symbol=f"sym{gene}")
+                                            for gene, _, _ in rows])
+        Peptide.objects.bulk_create([Peptide(name=f"QBP{gene[3:]}", gene_id=gene, header=f"QBP{gene[3:]} pep", sequence="MKV" * 30, length=90)
+                                     for gene, _, _ in rows])
+        PeptideAnnotation.objects.bulk_create([PeptideAnnotation(peptide_id=f"QBP{gene[3:]}", annotation_id=gene, transcript=f"T{gene}")
+                                               for gene, _, _ in rows])
+        AnnotationRevision.record([(gene, None, {"gene_symbol": f"sym{gene}"}) for gene, _, _ in rows])
+        ChangeLog.record(ChangeLog.gene, ChangeLog.created, [(gene, []) for gene, _, _ in rows])
+        ThroughputRollup.record([(cls.genomes[i % len(cls.genomes)].pk, annotator.pk, status) for i, (_, status, annotator) in enumerate(rows, start)])
+        AsyncTasksCache.objects.bulk_create([AsyncTasksCache(key=f"qb-{gene}", task="BLAST", user=annotator, params_hash=gene, params={},
+                                                             state=AsyncTasksCache.completed)
+                                             for gene, _, annotator in rows[::10]])
+
+    # Used to check the queries of every endpoint, responses are rendered so that lazy serialisation is counted
+    def check_budgets(self):
+        factory = APIRequestFactory(SERVER_NAME="localhost")
+        for name, method, params, queries in QueryBudgetTests.ENDPOINTS:
+            with self.subTest(endpoint=name, method=method, params=",".join(sorted(params))):
+                path = reverse(name)
+                request = factory.get(path, params) if method == "get" else factory.post(path, params, format="json")
+                force_authenticate(request, user=self.user)
+                with self.assertNumQueries(queries):
+                    response = resolve(path).func(request)
+                    if hasattr(response, "render"):
+                        response.render()
+                self.assertLess(response.status_code, 400)
+
+    def test_query_budgets(self):
+        self.check_budgets()
+
+    def test_query_budgets_do_not_grow(self):
+        QueryBudgetTests.seed(self.GENES, self.GENES)
+        self.check_budgets()
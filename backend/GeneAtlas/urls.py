@@ -3,16 +3,24 @@ from django.views.generic.base import TemplateView
 
 from .views import (
     AnnotationAPIView,
+    AnnotationHistoryAPIView,
     AnnotationStatusAPIView,
+    BatchLookupAPIView,
     BlastAPIView,
+    ChangeFeedAPIView,
+    ColumnarExportAPIView,
     DownloadAPIView,
+    ExportAPIView,
     GeneAPIView,
     GenomeAPIView,
     HomeView,
     PeptideAPIView,
     PFAMAPIView,
+    PipelineAPIView,
+    QueueAPIView,
     StatsAPIView,
     TaskAPIView,
+    ThroughputAPIView,
 )
 
 urlpatterns = [
@@ -21,11 +29,19 @@ urlpatterns = [
     path("api/gene/", GeneAPIView.as_view(), name="gene_api"),
     path("api/peptide/", PeptideAPIView.as_view(), name="peptide_api"),
     path("api/annotation/", AnnotationAPIView.as_view(), name="annotation_api"),
+    path("api/annotation/history/", AnnotationHistoryAPIView.as_view(), name="annotation_history_api"),
     path("api/annotation/<str:gene>", AnnotationAPIView.as_view(), name="annotation_api_set"),
+    path("api/batch/", BatchLookupAPIView.as_view(), name="batch_api"),
     path("api/stats/", StatsAPIView.as_view(), name="stats_api"),
+    path("api/stats/throughput/", ThroughputAPIView.as_view(), name="throughput_api"),
     path("api/download/", DownloadAPIView.as_view(), name="download_api"),
+    path("api/export/", ExportAPIView.as_view(), name="export_api"),
+    path("api/columnar/", ColumnarExportAPIView.as_view(), name="columnar_api"),
     path("api/status/", AnnotationStatusAPIView.as_view(), name="status_api"),
+    path("api/changes/", ChangeFeedAPIView.as_view(), name="changes_api"),
     path("api/tasks/", TaskAPIView.as_view(), name="task_api"),
+    path("api/queues/", QueueAPIView.as_view(), name="queue_api"),
     path("api/blast/", BlastAPIView.as_view(), name="blast_api"),
     path("api/pfamscan/", PFAMAPIView.as_view(), name="pfamscan_api"),
+    path("api/pipeline/", PipelineAPIView.as_view(), name="pipeline_api"),
 ]
\ No newline at end of file
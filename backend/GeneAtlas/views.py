@@ -1,17 +1,22 @@
 import csv
+import os
 import uuid
-from datetime import timedelta
+from datetime import datetime, timedelta
+from zlib import decompress
 
 import requests
-from django.db import models as db_models
+from django.conf import settings
+from django.core.cache import cache
 from django.db import transaction
-from django.http import HttpResponse
+from django.db.models import Sum
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.urls import reverse
 from django.utils import timezone
 from django.views.generic import CreateView
 from huey.contrib.djhuey import HUEY
 from rest_framework import request, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
@@ -19,36 +24,66 @@ from rest_framework.views import APIView
 
 from AccessControl.models import CustomUser
 from AccessControl.permissions import ReadOnly
+from GenAnnot.pagination import KeysetPagination
 from GeneAtlas import urls
 
+from . import columnar
+from .autoscale import QueueAutoscaler
 from .models import (
+    AnnotationRevision,
     AsyncTasksCache,
+    ChangeLog,
+    ExportArtifact,
     Gene,
     GeneAnnotation,
     GeneAnnotationStatus,
     Genome,
     Peptide,
     PeptideAnnotation,
+    StatsSnapshot,
+    ThroughputRollup,
 )
+from .decorators import cache_headers, conditional_get, not_modified
 from .permissions import IsAnnotatorUser, IsValidatorUser
+from .exports import queue_build, stale
+from .pipelines import start_pipeline
 from .serializers import (
+    AnnotationBulkItemSerializer,
+    AnnotationHistoryInputSerializer,
+    AnnotationRevisionSerializer,
+    BatchLookupInputSerializer,
+    ChangeFeedInputSerializer,
+    ChangeLogSerializer,
+    ColumnarExportInputSerializer,
+    ExportInputSerializer,
     BlastQueryInputSerializer,
     BlastRunInputSerializer,
     GeneAnnotationSerializer,
     GeneAnnotationStatusSerializer,
+    GeneBulkItemSerializer,
     GeneQuerySerializer,
     GeneSerializer,
     GenomeQuerySerializer,
     GenomeSerializer,
     PeptideAnnotationSerializer,
+    PeptideBulkItemSerializer,
     PeptideQuerySerializer,
     PeptideSerializer,
     PFAMRunInputSerializer,
+    PipelineRunInputSerializer,
     StatsInputSerializer,
     TaskInputSerializer,
     TaskSerializer,
+    ThroughputInputSerializer,
+)
+from .queues import QUEUES
+from .tasks import (
+    BLAST_DEFAULTS,
+    PFAM_DEFAULTS,
+    notify_annotators,
+    pfamscan,
+    run_blast,
 )
-from .tasks import pfamscan, run_blast
 
 
 class HomeView(CreateView):
@@ -57,6 +92,7 @@ class HomeView(CreateView):
         return render(request, "home.html")
 
 class GenomeAPIView(APIView):
+    @conditional_get(lambda: StatsSnapshot.validator("genome"))
     def get(self, request) -> Response:
         inf = Genome.objects.all()
         if(request.GET.get('all', None) == 'true'):
@@ -94,6 +130,7 @@ class GenomeAPIView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
 class GeneAPIView(APIView):
+    @conditional_get(lambda: StatsSnapshot.validator("gene"))
     def get(self, request) -> Response:
         inf = Gene.objects.all()
         motif = request.GET.get('motif', None)
@@ -102,7 +139,8 @@ class GeneAPIView(APIView):
                 "length": request.GET.get('length', None),
                 "gc_content": request.GET.get('gc_content', None), 
                 "annotated": request.GET.get('annotated', None), # Annotated status of the gene
-                "limit": request.GET.get('limit', None)} # Should the result be paginated
+                "limit": request.GET.get('limit', None), # Should the result be paginated
+                "page_size": request.GET.get('page_size', None)} # Should the result be paginated by cursor (on the name)
         if(motif): 
             if(len(motif) < 3):
                 return Response({"error": "Motif must be at least 3 characters long."}, status=status.HTTP_400_BAD_REQUEST)
@@ -116,25 +154,82 @@ class GeneAPIView(APIView):
                 GeneQuerySerializer(data=params).is_valid(raise_exception=True)
             except Exception as e:
                 return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-            query_results = inf.filter(**{k: v for k, v in params.items() if v is not None and k not in ["limit"]})
+            query_results = inf.filter(**{k: v for k, v in params.items() if v is not None and k not in ["limit", "page_size"]})
+
+        # Fields of the response, loaded alone from the database / cursor pages default to the compact shape
+        try:
+            fields = GeneSerializer.fieldset(request, compact=KeysetPagination.requested(request))
+        except ValidationError as e:
+            return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+        query_results = GeneSerializer.restrict(query_results, fields)
 
-        if(params["limit"] is not None):
+        if(KeysetPagination.requested(request)):
+            paginator = KeysetPagination(ordering="name")
+            query_results = paginator.paginate_queryset(query_results, request)
+            serializer = GeneSerializer(query_results, many=True, fields=fields)
+            return paginator.get_paginated_response(serializer.data)
+        elif(params["limit"] is not None):
             paginator = LimitOffsetPagination()
             query_results = paginator.paginate_queryset(query_results, request)
-            serializer = GeneSerializer(query_results, many=True)
+            serializer = GeneSerializer(query_results, many=True, fields=fields)
             return paginator.get_paginated_response(serializer.data)
         else:
-            serializer = GeneSerializer(query_results, many=True)
+            serializer = GeneSerializer(query_results, many=True, fields=fields)
             return Response(serializer.data)
 
     def post(self, request) -> Response:
+        # A list of genes is created in bulk
+        if isinstance(request.data, list):
+            return self.bulk_post(request, request.data)
         serializer = GeneSerializer(data=request.data)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    # Used to create many genes (with their status and annotation) in one transaction
+    # The number of queries does not depend on the number of genes, invalid genes are reported and the others created
+    def bulk_post(self, request, items: list) -> Response:
+        if len(items) > settings.BULK_CREATE["max_items"]:
+            return Response({"error": f"At most {settings.BULK_CREATE['max_items']} genes can be created at once."}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = [None] * len(items)
+        valid = {}
+        for index, item in enumerate(items):
+            serializer = GeneBulkItemSerializer(data=item)
+            if not serializer.is_valid():
+                results[index] = {"status": "error", "error": serializer.errors}
+            elif serializer.validated_data["name"] in valid:
+                results[index] = {"name": serializer.validated_data["name"], "status": "error", "error": "Duplicate gene"}
+            else:
+                valid[serializer.validated_data["name"]] = (index, serializer.validated_data)
+
+        genomes = set(Genome.objects.filter(name__in={data["genome"] for _, data in valid.values()}).values_list("name", flat=True))
+        existing = set(Gene.objects.filter(name__in=valid.keys()).values_list("name", flat=True))
+
+        genes = []
+        for name, (index, data) in valid.items():
+            result = {"name": name}
+            results[index] = result
+            if name in existing:
+                result.update({"status": "error", "error": "Gene already exists"})
+            elif data["genome"] not in genomes:
+                result.update({"status": "error", "error": "Genome not found"})
+            else:
+                genes.append(Gene(genome_id=data.pop("genome"), **data))
+                result["status"] = "created"
+
+        try:
+            Gene.bulk_add(genes)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({"created": len(genes),
+                         "failed": len(items) - len(genes),
+                         "results": results}, status=status.HTTP_201_CREATED if genes else status.HTTP_400_BAD_REQUEST)
     
 class PeptideAPIView(APIView):
+    @conditional_get(lambda: StatsSnapshot.validator("peptide"))
     def get(self, request) -> Response:
         try:
             inf = Peptide.objects.all()
@@ -143,7 +238,8 @@ class PeptideAPIView(APIView):
                     "gene": request.GET.get('gene', None),  # Gene to which the peptide belongs
                     "length": request.GET.get('length', None), # Length of the peptide
                     "gene__annotated": request.GET.get('annotated', None), # Annotated status of the gene to which the peptide belongs
-                    "limit": request.GET.get('limit', None)} # Should the result be paginated
+                    "limit": request.GET.get('limit', None), # Should the result be paginated
+                    "page_size": request.GET.get('page_size', None)} # Should the result be paginated by cursor (on the name)
             if(motif):
                 if(len(motif) < 3):
                     return Response({"error": "Motif must be at least 3 characters long."}, status=status.HTTP_400_BAD_REQUEST)
@@ -157,27 +253,83 @@ class PeptideAPIView(APIView):
                     PeptideQuerySerializer(data=params).is_valid(raise_exception=True)
                 except Exception as e:
                     return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-                query_results = inf.filter(**{k: v for k, v in params.items() if v is not None and k not in ["limit"]})
-                if(query_results.count() == 0):
+                query_results = inf.filter(**{k: v for k, v in params.items() if v is not None and k not in ["limit", "page_size"]})
+                if(not query_results.exists()):
                     return Response({"error": "Peptide(s) not found."}, status=status.HTTP_404_NOT_FOUND)
-                                    
-            if(params["limit"] is not None):
+
+            # Fields of the response, loaded alone from the database / cursor pages default to the compact shape
+            try:
+                fields = PeptideSerializer.fieldset(request, compact=KeysetPagination.requested(request))
+            except ValidationError as e:
+                return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+            query_results = PeptideSerializer.restrict(query_results, fields)
+
+            if(KeysetPagination.requested(request)):
+                paginator = KeysetPagination(ordering="name")
+                query_results = paginator.paginate_queryset(query_results, request)
+                serializer = PeptideSerializer(query_results, many=True, fields=fields)
+                return paginator.get_paginated_response(serializer.data)
+            elif(params["limit"] is not None):
                 paginator = LimitOffsetPagination()
                 query_results = paginator.paginate_queryset(query_results, request)
-                serializer = PeptideSerializer(query_results, many=True)
+                serializer = PeptideSerializer(query_results, many=True, fields=fields)
                 return paginator.get_paginated_response(serializer.data)
             else:
-                serializer = PeptideSerializer(query_results, many=True)
+                serializer = PeptideSerializer(query_results, many=True, fields=fields)
                 return Response(serializer.data)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
     def post(self, request) -> Response:
+        # A list of peptides is created in bulk
+        if isinstance(request.data, list):
+            return self.bulk_post(request, request.data)
         serializer = PeptideSerializer(data=request.data)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    # Used to create many peptides in one transaction
+    # The number of queries does not depend on the number of peptides, invalid peptides are reported and the others created
+    def bulk_post(self, request, items: list) -> Response:
+        if len(items) > settings.BULK_CREATE["max_items"]:
+            return Response({"error": f"At most {settings.BULK_CREATE['max_items']} peptides can be created at once."}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = [None] * len(items)
+        valid = {}
+        for index, item in enumerate(items):
+            serializer = PeptideBulkItemSerializer(data=item)
+            if not serializer.is_valid():
+                results[index] = {"status": "error", "error": serializer.errors}
+            elif serializer.validated_data["name"] in valid:
+                results[index] = {"name": serializer.validated_data["name"], "status": "error", "error": "Duplicate peptide"}
+            else:
+                valid[serializer.validated_data["name"]] = (index, serializer.validated_data)
+
+        genes = set(Gene.objects.filter(name__in={data["gene"] for _, data in valid.values()}).values_list("name", flat=True))
+        existing = set(Peptide.objects.filter(name__in=valid.keys()).values_list("name", flat=True))
+
+        peptides = []
+        for name, (index, data) in valid.items():
+            result = {"name": name}
+            results[index] = result
+            if name in existing:
+                result.update({"status": "error", "error": "Peptide already exists"})
+            elif data["gene"] not in genes:
+                result.update({"status": "error", "error": "Gene not found"})
+            else:
+                peptides.append(Peptide(gene_id=data.pop("gene"), **data))
+                result["status"] = "created"
+
+        try:
+            Peptide.bulk_add(peptides)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({"created": len(peptides),
+                         "failed": len(items) - len(peptides),
+                         "results": results}, status=status.HTTP_201_CREATED if peptides else status.HTTP_400_BAD_REQUEST)
     
 class AnnotationAPIView(APIView):
 
@@ -190,15 +342,21 @@ class AnnotationAPIView(APIView):
         if(all(v is None for v in params.values())):
             return Response({"error": "No query parameters provided."}, status=status.HTTP_400_BAD_REQUEST)
         else:
-            query_results_gene_annotation = inf_annotation_gene.filter(**{k: v for k, v in params.items() if v is not None})
+            query_results_gene_annotation = inf_annotation_gene.filter(**{k: v for k, v in params.items() if v is not None}).order_by("gene_instance")
             gene_serializer = GeneAnnotationSerializer(query_results_gene_annotation, many=True)
-            query_results_peptide_annotation = inf_annotation_peptide.filter(annotation__in=[g["gene_instance"] for g in gene_serializer.data])
+            # Peptide annotations are filtered with a subquery, in the same order as the gene annotations
+            query_results_peptide_annotation = inf_annotation_peptide.filter(annotation__in=query_results_gene_annotation.values("gene_instance")).order_by("annotation", "peptide")
             peptide_serializer = PeptideAnnotationSerializer(query_results_peptide_annotation, many=True)
         
-        return Response({"gene": sorted(gene_serializer.data, key=lambda x: x['gene_instance']), "peptide": sorted(peptide_serializer.data, key=lambda x: x['annotation'])})
+        return Response({"gene": gene_serializer.data, "peptide": peptide_serializer.data})
 
 
     def put(self, request, gene = None) -> Response:
+
+        # A list of annotations is written in bulk
+        if gene is None and isinstance(request.data, list):
+            return self.bulk_put(request, request.data)
+
         try:
 
             with transaction.atomic():
@@ -207,23 +365,22 @@ class AnnotationAPIView(APIView):
 
                 if gene is None:
                     return Response({'error': 'No gene instance provided'}, status=status.HTTP_400_BAD_REQUEST)
-                try:
-                    if Gene.objects.get(name=gene).annotated:
-                        return Response({'error': 'Gene already annotated with APPROVED status'}, status=status.HTTP_400_BAD_REQUEST)
-                except Gene.DoesNotExist:
-                    return Response({'error': 'Gene not found'}, status=status.HTTP_404_NOT_FOUND)
-
-                current_annotation = GeneAnnotation.objects.filter(gene_instance=gene).first()
+                # The gene and the status are loaded with the annotation, the permission check and the save reuse them
+                current_annotation = GeneAnnotation.objects.select_related("gene_instance", "status").filter(gene_instance=gene).first()
 
                 if(current_annotation is None):
+                    if not Gene.objects.filter(name=gene).exists():
+                        return Response({'error': 'Gene not found'}, status=status.HTTP_404_NOT_FOUND)
                     return Response({'error': 'Gene annotation not found'}, status=status.HTTP_404_NOT_FOUND)
+
+                if current_annotation.gene_instance.annotated:
+                    return Response({'error': 'Gene already annotated with APPROVED status'}, status=status.HTTP_400_BAD_REQUEST)
                 
                 # Allow only the annotator assigned to the gene annotation to update the data
                 self.check_object_permissions(request, current_annotation)
 
-                # Update gene annotation data
+                # Update gene annotation data, the gene instance is left as it is (partial update)
                 new_data = {
-                    'gene_instance': gene,
                     'strand': request.data.get('strand',current_annotation.strand),
                     'gene': request.data.get('gene', current_annotation.gene),
                     'gene_biotype': request.data.get('gene_biotype', current_annotation.gene_biotype),
@@ -232,7 +389,7 @@ class AnnotationAPIView(APIView):
                     'description': request.data.get('description', current_annotation.description),
                 }
                 
-                gene_serializer = GeneAnnotationSerializer(instance=current_annotation, data=new_data)
+                gene_serializer = GeneAnnotationSerializer(instance=current_annotation, data=new_data, partial=True)
 
                 if not gene_serializer.is_valid():
                     return Response(gene_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -269,6 +426,105 @@ class AnnotationAPIView(APIView):
     
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Used to update the annotations of many genes in one transaction
+    # The number of queries does not depend on the number of annotations
+    def bulk_put(self, request, items: list) -> Response:
+        if len(items) > settings.BULK_UPDATE["max_items"]:
+            return Response({"error": f"At most {settings.BULK_UPDATE['max_items']} annotations can be updated at once."}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = [None] * len(items)
+        valid = {}
+        for index, item in enumerate(items):
+            serializer = AnnotationBulkItemSerializer(data=item)
+            if not serializer.is_valid():
+                results[index] = {"status": "error", "error": serializer.errors}
+            elif serializer.validated_data["gene_instance"] in valid:
+                results[index] = {"gene_instance": serializer.validated_data["gene_instance"], "status": "error", "error": "Duplicate gene instance"}
+            else:
+                valid[serializer.validated_data["gene_instance"]] = (index, serializer.validated_data)
+
+        genes = {g["name"]: g for g in Gene.objects.filter(name__in=valid.keys()).values("name", "genome", "annotated")}
+        annotations = {a.gene_instance_id: a for a in GeneAnnotation.objects.filter(gene_instance__in=valid.keys()).select_related("status__annotator")}
+        peptide_names = [data["peptide"] for _, data in valid.values() if data.get("peptide")]
+        peptides = set(Peptide.objects.filter(name__in=peptide_names).values_list("name", flat=True))
+        peptide_annotations = {p.peptide_id: p for p in PeptideAnnotation.objects.filter(peptide__in=peptide_names)}
+
+        # Allow only the annotators assigned to all of the gene annotations to update the data
+        denied = []
+        for name, annotation in annotations.items():
+            try:
+                self.check_object_permissions(request, annotation)
+            except Exception:
+                denied.append(name)
+        if denied:
+            return Response({"error": "You do not have permission to update these annotations", "genes": sorted(denied)}, status=status.HTTP_403_FORBIDDEN)
+
+        fields = ["strand", "gene", "gene_biotype", "transcript_biotype", "gene_symbol", "description"]
+        updated, created_peptides, updated_peptides, revisions = [], [], [], []
+        for name, (index, data) in valid.items():
+            result = {"gene_instance": name}
+            results[index] = result
+            if name not in genes:
+                result.update({"status": "error", "error": "Gene not found"})
+                continue
+            if genes[name]["annotated"]:
+                result.update({"status": "error", "error": "Gene already annotated with APPROVED status"})
+                continue
+            if name not in annotations:
+                result.update({"status": "error", "error": "Gene annotation not found"})
+                continue
+            if data.get("peptide") and data["peptide"] not in peptides:
+                result.update({"status": "error", "error": "Peptide not found"})
+                continue
+            annotation = annotations[name]
+            for field in fields:
+                if field in data:
+                    setattr(annotation, field, data[field])
+            if annotation.changed_fields():
+                updated.append(annotation)
+            result["status"] = "updated" if annotation.changed_fields() else "unchanged"
+            changes = AnnotationRevision.delta(annotation, AnnotationRevision.GENE_FIELDS, False)
+            if changes is not None:
+                revisions.append((name, None, changes))
+            if data.get("peptide"):
+                peptide_annotation = peptide_annotations.get(data["peptide"])
+                created = peptide_annotation is None
+                if created:
+                    peptide_annotation = PeptideAnnotation(peptide_id=data["peptide"], annotation=annotation,
+                                                           transcript=data.get("transcript", "No transcript"))
+                    created_peptides.append(peptide_annotation)
+                    result["peptide"] = "created"
+                else:
+                    peptide_annotation.annotation = annotation
+                    if "transcript" in data:
+                        peptide_annotation.transcript = data["transcript"]
+                    if peptide_annotation.changed_fields():
+                        updated_peptides.append(peptide_annotation)
+                    result["peptide"] = "updated" if peptide_annotation.changed_fields() else "unchanged"
+                changes = AnnotationRevision.delta(peptide_annotation, AnnotationRevision.PEPTIDE_FIELDS, created)
+                if changes is not None:
+                    revisions.append((name, data["peptide"], changes))
+
+        try:
+            with transaction.atomic():
+                GeneAnnotation.objects.bulk_update(updated, fields, batch_size=500)
+                PeptideAnnotation.objects.bulk_update(updated_peptides, ["annotation", "transcript"], batch_size=500)
+                PeptideAnnotation.objects.bulk_create(created_peptides, batch_size=500)
+                # Bulk writes bypass the signals, the history and the change feed are appended here
+                AnnotationRevision.record(revisions)
+                ChangeLog.record(ChangeLog.annotation, ChangeLog.updated, [(a.gene_instance_id, a.changed_fields()) for a in updated])
+                # Updated annotations that were REJECTED / SUBMITTED go back to ONGOING
+                GeneAnnotationStatus.transition(GeneAnnotationStatus.objects.filter(gene__in=[a.gene_instance_id for a in updated]),
+                                                GeneAnnotationStatus.ONGOING,
+                                                (GeneAnnotationStatus.REJECTED, GeneAnnotationStatus.PENDING),
+                                                validated_at=None, rejection_reason=None)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({"updated": len(updated),
+                         "failed": sum(1 for r in results if r["status"] == "error"),
+                         "results": results}, status=status.HTTP_200_OK)
         
     def post(self, request) -> Response:
         return Response({"error": "POST request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
@@ -276,12 +532,121 @@ class AnnotationAPIView(APIView):
     def delete(self, request) -> Response:
         return Response({"error": "DELETE request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
+class BatchLookupAPIView(APIView):
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request) -> Response:
+        return Response({"error": "GET request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    # Used to fetch many genes / peptides / annotations by name in a single request
+    # Results follow the order of the names, names not found are reported as missing
+    def post(self, request) -> Response:
+        serializer = BatchLookupInputSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = serializer.validated_data
+        names = list(dict.fromkeys(params["names"]))
+        if params["model"] == "annotation":
+            if params["fields"] or params["exclude"]:
+                return Response({"error": "Field selection is only available for genes and peptides."}, status=status.HTTP_400_BAD_REQUEST)
+            # Peptide annotations are joined to their gene annotation
+            found = GeneAnnotation.objects.select_related("peptideannotation").in_bulk(names)
+            results = []
+            for annotation in (found[name] for name in names if name in found):
+                try:
+                    peptide = PeptideAnnotationSerializer(annotation.peptideannotation).data
+                except PeptideAnnotation.DoesNotExist:
+                    peptide = None
+                results.append({"gene": GeneAnnotationSerializer(annotation).data, "peptide": peptide})
+        else:
+            model, serializer_class = {"gene": (Gene, GeneSerializer), "peptide": (Peptide, PeptideSerializer)}[params["model"]]
+            try:
+                fields = serializer_class.select(params["fields"], params["exclude"])
+            except ValidationError as e:
+                return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+            found = serializer_class.restrict(model.objects.all(), fields).in_bulk(names)
+            results = serializer_class([found[name] for name in names if name in found], many=True, fields=fields).data
+        return Response({"results": results, "missing": [name for name in names if name not in found]}, status=status.HTTP_200_OK)
+
+    def put(self, request) -> Response:
+        return Response({"error": "PUT request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def delete(self, request) -> Response:
+        return Response({"error": "DELETE request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+class AnnotationHistoryAPIView(APIView):
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request) -> Response:
+        serializer = AnnotationHistoryInputSerializer(data=request.GET)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = serializer.validated_data
+        as_of = params.get("as_of", None) # Date at which the annotations are read (default: now)
+        if params.get("gene", None):
+            # Revisions of a gene, oldest first
+            revisions = AnnotationRevision.objects.filter(gene=params["gene"]).order_by("revision")
+            if as_of is not None:
+                revisions = revisions.filter(created_at__lte=as_of)
+            return Response(AnnotationRevisionSerializer(revisions, many=True).data, status=status.HTTP_200_OK)
+        elif params.get("genome", None):
+            # Snapshot of the annotations of a whole genome
+            if not Genome.objects.filter(name=params["genome"]).exists():
+                return Response({"error": "Genome not found."}, status=status.HTTP_404_NOT_FOUND)
+            return Response({"genome": params["genome"],
+                             "as_of": as_of or timezone.now(),
+                             "annotations": AnnotationRevision.as_of(params["genome"], as_of)}, status=status.HTTP_200_OK)
+        return Response({"error": "No query parameters provided."}, status=status.HTTP_400_BAD_REQUEST)
+
+    def post(self, request) -> Response:
+        return Response({"error": "POST request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def put(self, request) -> Response:
+        return Response({"error": "PUT request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def delete(self, request) -> Response:
+        return Response({"error": "DELETE request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+class ChangeFeedAPIView(APIView):
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request) -> Response:
+        serializer = ChangeFeedInputSerializer(data=request.GET)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = serializer.validated_data
+        config = settings.CHANGE_FEED
+        limit = min(params.get("limit", None) or config["page_size"], config["max_page_size"])
+        # Changes after the cursor, oldest first / the settle window is only sound on SQLite (see settings.CHANGE_FEED)
+        query = ChangeLog.objects.filter(id__gt=params["after"], created_at__lte=timezone.now() - timedelta(seconds=config["settle"]))
+        if params.get("model", None):
+            query = query.filter(model=params["model"])
+        changes = list(query.order_by("id")[:limit + 1])
+        more = len(changes) > limit
+        changes = changes[:limit]
+        return Response({"changes": ChangeLogSerializer(changes, many=True).data,
+                         "cursor": changes[-1].id if changes else params["after"],
+                         "more": more}, status=status.HTTP_200_OK)
+
+    def post(self, request) -> Response:
+        return Response({"error": "POST request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def put(self, request) -> Response:
+        return Response({"error": "PUT request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def delete(self, request) -> Response:
+        return Response({"error": "DELETE request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
 class AnnotationStatusAPIView(APIView):
 
     permission_classes = [IsAuthenticated&(IsAnnotatorUser|IsValidatorUser|IsAdminUser|ReadOnly)]
 
     def get(self, request) -> Response:
-        inf = GeneAnnotationStatus.objects.all()
+        # Annotators are serialised by username
+        inf = GeneAnnotationStatus.objects.select_related("annotator")
         params = {"gene": request.GET.get('gene', None),  # Gene(s) for which the status is to be retrieved
                 "status": request.GET.get('status', None), # Status of the gene annotation
                 "annotator": request.GET.get('annotator', None)} # Annotator assigned to the gene annotation
@@ -290,7 +655,13 @@ class AnnotationStatusAPIView(APIView):
         except CustomUser.DoesNotExist:
             return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
         query_results = inf.filter(**{k: v for k, v in params.items() if v is not None})
-        if(request.GET.get("limit",None)):
+        if(KeysetPagination.requested(request)):
+            # Keyed on the gene id, the position is read without loading the gene / updated_at is null until the first change
+            paginator = KeysetPagination(ordering="gene_id")
+            query_results = paginator.paginate_queryset(query_results, request)
+            serializer = GeneAnnotationStatusSerializer(query_results, many=True)
+            return paginator.get_paginated_response(serializer.data)
+        elif(request.GET.get("limit",None)):
             paginator = LimitOffsetPagination()
             query_results = paginator.paginate_queryset(query_results, request)
             serializer = GeneAnnotationStatusSerializer(query_results, many=True)
@@ -309,8 +680,8 @@ class AnnotationStatusAPIView(APIView):
         if(not params["gene"] is None):
             if(isinstance(params["gene"], list)):
                 status_obj = GeneAnnotationStatus.objects.filter(gene__in=params["gene"])
-                if(params["action"] != 'setuser'):
-                    return Response({'error': 'Bulk actions not supported for approve, reject or submit'}, status=status.HTTP_400_BAD_REQUEST)
+                if(str(params["action"]).lower() in GeneAnnotationStatus.TRANSITIONS):
+                    return self.bulk_transition(request, params["action"].lower(), params["gene"])
             elif(isinstance(params["gene"], str)):
                 try:
                     if(params["action"] == 'setuser'):
@@ -379,6 +750,50 @@ class AnnotationStatusAPIView(APIView):
             status=status.HTTP_400_BAD_REQUEST
         )
     
+    # Used to approve, reject or submit a list of annotations in one transaction
+    # The whole list is refused if any of the annotations cannot be moved
+    def bulk_transition(self, request, action: str, genes: list) -> Response:
+        target, sources = GeneAnnotationStatus.TRANSITIONS[action]
+        values = {}
+        if action in ['approve', 'reject']:
+            if request.user.role != CustomUser.validator:
+                return Response({'error': f'User with role {request.user.role} cannot perform this action'}, status=status.HTTP_403_FORBIDDEN)
+            if action == 'approve':
+                values = {'validated_at': datetime.now(), 'rejection_reason': None}
+            else:
+                reason = request.data.get('reason', None)
+                if not reason:
+                    return Response({'error': 'Rejection reason required'}, status=status.HTTP_400_BAD_REQUEST)
+                values = {'rejection_reason': reason}
+
+        status_objs = list(GeneAnnotationStatus.objects.filter(gene__in=genes).select_related('annotator'))
+
+        missing = set(genes) - {s.gene_id for s in status_objs}
+        if missing:
+            return Response({'error': 'Annotation(s) not found', 'genes': sorted(missing)}, status=status.HTTP_404_NOT_FOUND)
+        invalid = [s.gene_id for s in status_objs if s.status not in sources]
+        if invalid:
+            return Response({'error': f'Annotation(s) cannot be moved from their current status to {target}', 'genes': invalid}, status=status.HTTP_400_BAD_REQUEST)
+        if action in ['approve', 'reject']:
+            own = [s.gene_id for s in status_objs if s.annotator_id == request.user.pk]
+            if own:
+                return Response({'error': f'Annotator cannot {action} their own annotation', 'genes': own}, status=status.HTTP_403_FORBIDDEN)
+        else:
+            try:
+                for status_obj in status_objs:
+                    self.check_object_permissions(request, status_obj)
+            except Exception as e:
+                return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+
+        updated = GeneAnnotationStatus.transition(GeneAnnotationStatus.objects.filter(gene__in=genes), target, sources, **values)
+
+        # Annotators are notified in batch once the transition is committed
+        if target in [GeneAnnotationStatus.APPROVED, GeneAnnotationStatus.REJECTED] and updated:
+            updated_set = set(updated)
+            notify_annotators([(s.gene_id, s.annotator_id, target) for s in status_objs if s.gene_id in updated_set], 'update')
+
+        return Response({'status': f'{len(updated)} annotation(s) successfully moved to {target}'}, status=status.HTTP_200_OK)
+    
     def post(self, request) -> Response:
         return Response({"error": "POST request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
     
@@ -391,62 +806,39 @@ class StatsAPIView(APIView):
         try:
             user = request.GET.get("user", None)
             if(user is not None):
-                if StatsInputSerializer(data={"user": user}).is_valid(raise_exception=False):
+                listed = request.GET.get("list", None) # Status of which the genes are listed, paged with limit / offset
+                if StatsInputSerializer(data={"user": user, "list": listed}).is_valid(raise_exception=False):
                     try:
                         user_pk = CustomUser.objects.get(username=user).id
                     except CustomUser.DoesNotExist:
                         return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-                    annotations = GeneAnnotationStatus.objects.filter(annotator=user_pk)
-                    annotations_ongoing = annotations.filter(status=GeneAnnotationStatus.ONGOING)
-                    annotations_pending = annotations.filter(status=GeneAnnotationStatus.PENDING)
-                    annotations_approved = annotations.filter(status=GeneAnnotationStatus.APPROVED)
-                    annotations_rejected = annotations.filter(status=GeneAnnotationStatus.REJECTED)
-                    return Response({"annotations": annotations.count(),
-                                    "ongoing": {"count": annotations_ongoing.count(), 
-                                                "annotation": annotations_ongoing.values_list('gene', flat=True)},
-                                    "pending": {"count": annotations_pending.count(), 
-                                                "annotation": annotations_pending.values_list('gene', flat=True)},
-                                    "approved": {"count": annotations_approved.count(), 
-                                                "annotation": annotations_approved.values_list('gene', flat=True)},
-                                    "rejected": {"count": annotations_rejected.count(), 
-                                                "annotation": annotations_rejected.values_list('gene', flat=True)}})
+                    counts = GeneAnnotationStatus.user_stats(user_pk)
+                    stats = {"annotations": sum(counts.values())}
+                    for name in ["ongoing", "pending", "approved", "rejected"]:
+                        stats[name] = {"count": counts.get(name.upper(), 0)}
+                    if listed is not None:
+                        paginator = LimitOffsetPagination()
+                        paginator.default_limit, paginator.max_limit = 100, 1000
+                        genes = GeneAnnotationStatus.objects.filter(annotator=user_pk, status=listed.upper()).order_by("gene").values_list("gene", flat=True)
+                        stats[listed].update({"annotation": paginator.paginate_queryset(genes, request),
+                                              "next": paginator.get_next_link(),
+                                              "previous": paginator.get_previous_link()})
+                    return Response(stats)
                 else:
-                    return Response({"error": "Invalid user parameter."}, status=status.HTTP_400_BAD_REQUEST)
+                    return Response({"error": "Invalid user or list parameter."}, status=status.HTTP_400_BAD_REQUEST)
             else:
-                # Genome statistics
-                genome_count = Genome.objects.count()
-                genome_avg_length = Genome.objects.aggregate(db_models.Avg('length'))["length__avg"]
-                genome_total_nt = Genome.objects.aggregate(db_models.Sum('length'))["length__sum"]
-                stats_by_genome = Gene.objects.values('genome').annotate(total=db_models.Count('genome'), 
-                                                                         annotated=db_models.Sum('annotated', output_field=db_models.IntegerField()), 
-                                                                         ratio=(db_models.F('annotated')/db_models.F('total'))*100.0)
-                genome_completed = stats_by_genome.filter(annotated=db_models.F('total')).count()
-                genome_in_progress = stats_by_genome.filter(annotated=0).count()
-                genome_unannotated = stats_by_genome.filter(annotated__lt=db_models.F('total'), annotated__gt=0).count()
-                # Gene statistics
-                gene_count = Gene.objects.count()
-                gene_avg_length = Gene.objects.aggregate(db_models.Avg('length'))["length__avg"]
-                gene_avg_gc_content = Gene.objects.aggregate(db_models.Avg('gc_content'))["gc_content__avg"]
-                # Peptide statistics
-                peptide_count = Peptide.objects.count()
-                peptide_avg_length = Peptide.objects.aggregate(db_models.Avg('length'))["length__avg"]
-                # Annotation statistics
-                annotation = GeneAnnotationStatus.objects.values('status').annotate(count=db_models.Count('status'),
-                                                                                    ratio=((db_models.F('count'))/float(gene_count))*100.0)
-                return Response({"genome": {"count": genome_count,
-                                            "average_length": genome_avg_length,
-                                            "total_nt": genome_total_nt,
-                                            "fully_annotated": genome_completed,
-                                            "in_progress": genome_in_progress,
-                                            "new": genome_unannotated,
-                                            "overview": stats_by_genome}, 
-                                "gene": {"count": gene_count,
-                                         "average_length": gene_avg_length,
-                                         "average_gc_content": gene_avg_gc_content}, 
-                                "peptide": {"count": peptide_count,
-                                            "average_length": peptide_avg_length}, 
-                                "annotation": annotation, 
-                                })
+                # Statistics are built from the snapshot once per version
+                snapshot = StatsSnapshot.get()
+                etag, modified = snapshot.tag("stats")
+                headers = cache_headers(etag, modified)
+                if not_modified(request, headers):
+                    return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+                key = f"stats:{etag}"
+                stats = cache.get(key)
+                if stats is None:
+                    stats = snapshot.payload()
+                    cache.set(key, stats, timeout=3600)
+                return Response(stats, headers=headers)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
@@ -459,19 +851,61 @@ class StatsAPIView(APIView):
     def delete(self, request) -> Response:
         return Response({"error": "DELETE request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
     
+class ThroughputAPIView(APIView):
+
+    permission_classes = [IsAuthenticated&(IsValidatorUser|IsAdminUser)]
+
+    def get(self, request) -> Response:
+        serializer = ThroughputInputSerializer(data=request.GET)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = serializer.validated_data
+        config = settings.THROUGHPUT
+        granularity = params["granularity"].upper()
+        # Defaults to the last max_range days, up to now
+        end = params.get("end", None) or timezone.now()
+        start = params.get("start", None) or end - timedelta(days=config["max_range"][granularity])
+        if start > end or end - start > timedelta(days=config["max_range"][granularity]):
+            return Response({"error": f"Range must span at most {config['max_range'][granularity]} days at {params['granularity']} granularity."}, status=status.HTTP_400_BAD_REQUEST)
+        query = ThroughputRollup.objects.filter(granularity=granularity,
+                                                bucket__gte=ThroughputRollup.truncate(start, granularity), bucket__lte=end)
+        if params.get("genome", None):
+            query = query.filter(genome=params["genome"])
+        if params.get("annotator", None):
+            query = query.filter(annotator__username=params["annotator"])
+        group = {"annotator": "annotator__username", "genome": "genome"}.get(params.get("group", None), None)
+        columns = ["bucket", group] if group else ["bucket"]
+        rows = query.values(*columns).annotate(submitted=Sum("submitted"), approved=Sum("approved"), rejected=Sum("rejected")).order_by(*columns)
+        series = [{"bucket": row["bucket"],
+                   **({params["group"]: row[group]} if group else {}),
+                   "submitted": row["submitted"],
+                   "approved": row["approved"],
+                   "rejected": row["rejected"]} for row in rows]
+        return Response({"granularity": params["granularity"], "start": start, "end": end, "series": series}, status=status.HTTP_200_OK)
+
+    def post(self, request) -> Response:
+        return Response({"error": "POST request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def put(self, request) -> Response:
+        return Response({"error": "PUT request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def delete(self, request) -> Response:
+        return Response({"error": "DELETE request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
 class DownloadAPIView(APIView):
 
+    # Rows are written in primary key order, as when streamed
     def download(data: str, cls: type, filters: dict, fields: list):
         response = HttpResponse(content_type='text/plain')
         if filters:
-            res = cls.objects.filter(**{k:v for k, v in filters.items() if v is not None and k != "limit"})
+            res = cls.objects.filter(**{k:v for k, v in filters.items() if v is not None and k not in ["limit", "page_size"]}).order_by("pk")
             if cls == Genome:
                 serializer = GenomeSerializer(res, many=True)
             elif cls == Gene:
                 serializer = GeneSerializer(res, many=True)
             elif cls == Peptide:
                 serializer = PeptideSerializer(res, many=True)
-            if(res.count() > 0):
+            if(res.exists()):
                 response['Content-Disposition'] = f'attachment; filename="{data}.txt"'
                 writer = csv.writer(response, delimiter=';')
                 if(fields is not None):
@@ -488,6 +922,76 @@ class DownloadAPIView(APIView):
         else:
             return Response({"error": "No filters provided."}, status=status.HTTP_400_BAD_REQUEST)
 
+    # Streaming mode
+    # Rows are read in chunks with values_list and written as they come, so that memory stays flat
+
+    SERIALIZERS = {Genome: GenomeSerializer, Gene: GeneSerializer, Peptide: PeptideSerializer}
+
+    # Used to get the columns of the CSV exports, in the order of the API responses
+    def columns(cls: type) -> list:
+        columns = [name for name, field in DownloadAPIView.SERIALIZERS[cls]().fields.items() if not field.write_only]
+        # The genome sequence is added to the representation after decompression
+        return columns + ["sequence"] if cls == Genome else columns
+
+    # Used to group small writes into chunks of about buffer_size bytes
+    def buffered(lines):
+        buffer, size = [], 0
+        for line in lines:
+            buffer.append(line)
+            size += len(line)
+            if size >= settings.DOWNLOADS["buffer_size"]:
+                yield "".join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield "".join(buffer)
+
+    # Used to read the rows of a query in chunks, genomes carry a whole compressed sequence per row
+    def rows(query, columns: list):
+        chunk_size = 1 if query.model == Genome else settings.DOWNLOADS["chunk_size"]
+        for row in query.values_list(*columns).iterator(chunk_size=chunk_size):
+            if query.model == Genome and "sequence" in columns:
+                row = list(row)
+                row[columns.index("sequence")] = decompress(row[columns.index("sequence")]).decode()
+            yield row
+
+    class Echo:
+        """Buffer returning the line written by csv instead of storing it"""
+        def write(self, line: str) -> str:
+            return line
+
+    def stream_csv(query, columns: list):
+        writer = csv.writer(DownloadAPIView.Echo(), delimiter=';')
+        yield writer.writerow(columns)
+        for row in DownloadAPIView.rows(query, columns):
+            yield writer.writerow(row)
+
+    def stream_fasta(query):
+        width = settings.DOWNLOADS["fasta_width"]
+        for name, header, sequence in DownloadAPIView.rows(query, ["name", "header", "sequence"]):
+            # Loaded headers start with the name, default ones (">Gene") do not
+            description = header.lstrip(">")
+            yield f">{description}\n" if description.split(" ", 1)[0] == name else f">{name} {description}\n"
+            for start in range(0, len(sequence), width):
+                yield sequence[start:start + width] + "\n"
+
+    def stream(data: str, cls: type, filters: dict, fields: list, output: str):
+        if not filters:
+            return Response({"error": "No filters provided."}, status=status.HTTP_400_BAD_REQUEST)
+        query = cls.objects.filter(**{k: v for k, v in filters.items() if v is not None and k not in ["limit", "page_size"]}).order_by("pk")
+        if not query.exists():
+            return Response({"error": f"Error in {data} query."}, status=status.HTTP_400_BAD_REQUEST)
+        if output == "fasta":
+            lines, extension = DownloadAPIView.stream_fasta(query), "fasta"
+        else:
+            columns = fields if fields is not None else DownloadAPIView.columns(cls)
+            unknown = [f for f in columns if f not in DownloadAPIView.columns(cls)]
+            if unknown:
+                return Response({"error": f"Unknown field(s): {', '.join(unknown)}."}, status=status.HTTP_400_BAD_REQUEST)
+            lines, extension = DownloadAPIView.stream_csv(query, columns), "txt"
+        response = StreamingHttpResponse(DownloadAPIView.buffered(lines), content_type='text/plain')
+        response['Content-Disposition'] = f'attachment; filename="{data}.{extension}"'
+        return response
+
     def get(self, request):
 
         MODEL_MAP = {
@@ -508,6 +1012,12 @@ class DownloadAPIView(APIView):
 
                 filters = serializer.data
 
+                output = request.data.get("output", "csv") # Format of the file, csv or fasta (always streamed)
+                if output not in ["csv", "fasta"]:
+                    return Response({"error": "Output must be csv or fasta."}, status=status.HTTP_400_BAD_REQUEST)
+                if output == "fasta" or request.data.get("stream", False):
+                    return DownloadAPIView.stream(data, config["class"], filters, request.data.get("fields", None), output)
+
                 return DownloadAPIView.download(data, config["class"], filters, request.data.get("fields", None))
             
             return Response({"error": serializer.error_messages}, status=status.HTTP_400_BAD_REQUEST)
@@ -525,6 +1035,130 @@ class DownloadAPIView(APIView):
     def delete(self, request) -> Response:
         return Response({"error": "DELETE request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
     
+class ExportAPIView(APIView):
+
+    permission_classes = [IsAuthenticated]
+
+    # Used to read the bounds of a single byte range from a Range header, None to serve the whole file
+    # Unsupported units, multiple ranges and invalid headers are ignored, unsatisfiable ranges raise ValueError
+    def byte_range(header: str, size: int):
+        unit, _, ranges = header.partition("=")
+        if unit.strip() != "bytes" or "," in ranges:
+            return None
+        first, _, last = ranges.strip().partition("-")
+        if not (first or last) or not all(part.isdigit() for part in (first, last) if part):
+            return None
+        if not first:
+            # Suffix range, the last bytes of the file
+            if int(last) == 0 or size == 0:
+                raise ValueError("Unsatisfiable range.")
+            return max(size - int(last), 0), size - 1
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+        if start >= size or start > end:
+            raise ValueError("Unsatisfiable range.")
+        return start, end
+
+    # Used to stream a part of an open file
+    def read(file, start: int, length: int):
+        with file:
+            file.seek(start)
+            while length > 0:
+                chunk = file.read(min(settings.DOWNLOADS["buffer_size"], length))
+                if not chunk:
+                    break
+                length -= len(chunk)
+                yield chunk
+
+    def get(self, request):
+        serializer = ExportInputSerializer(data=request.GET)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        genome, export_format = serializer.validated_data["genome"], serializer.validated_data["output"].upper()
+        if not Genome.objects.filter(pk=genome).exists():
+            return Response({"error": "Genome not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        # The last export built is served while the one of the current data is being built
+        version = ExportArtifact.data_version(genome)
+        if stale(genome, version):
+            queue_build(genome, version)
+        artifact = ExportArtifact.objects.filter(genome=genome, format=export_format).first()
+        try:
+            file = open(artifact.file(), "rb") if artifact is not None else None
+        except FileNotFoundError:
+            file = None
+        if file is None:
+            return Response({"message": f"Export of {genome} is being built, retry later."}, status=status.HTTP_202_ACCEPTED,
+                            headers={"Retry-After": "30"})
+
+        headers = cache_headers(f"export-{artifact.version}", artifact.created_at)
+        if not_modified(request, headers):
+            file.close()
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        size = os.fstat(file.fileno()).st_size
+        bounds = None
+        # A range of an outdated copy of the client is not served (If-Range), the whole file is
+        if request.headers.get("Range", None) and request.headers.get("If-Range", headers["ETag"]) in [headers["ETag"], headers["Last-Modified"]]:
+            try:
+                bounds = ExportAPIView.byte_range(request.headers["Range"], size)
+            except ValueError:
+                file.close()
+                return Response({"error": "Range not satisfiable."}, status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                                headers={"Content-Range": f"bytes */{size}"})
+        start, end = bounds or (0, size - 1)
+
+        response = StreamingHttpResponse(ExportAPIView.read(file, start, end - start + 1), content_type="application/gzip",
+                                         status=status.HTTP_206_PARTIAL_CONTENT if bounds else status.HTTP_200_OK)
+        response["Content-Length"] = str(end - start + 1)
+        response["Accept-Ranges"] = "bytes"
+        if bounds:
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Disposition"] = f'attachment; filename="{genome}.{ExportArtifact.EXTENSIONS[export_format]}.gz"'
+        response["X-Export-Current"] = str(artifact.version == version).lower()
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    def post(self, request) -> Response:
+        return Response({"error": "POST request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def put(self, request) -> Response:
+        return Response({"error": "PUT request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def delete(self, request) -> Response:
+        return Response({"error": "DELETE request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+class ColumnarExportAPIView(APIView):
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        if not columnar.available():
+            return Response({"error": "Columnar exports require pyarrow."}, status=status.HTTP_501_NOT_IMPLEMENTED)
+        serializer = ColumnarExportInputSerializer(data=request.GET)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = serializer.validated_data
+        fields = [field.strip() for field in params["fields"].split(",")] if params.get("fields", None) else None
+        try:
+            fields = columnar.columns(params["table"], fields)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        content_type, extension = columnar.OUTPUTS[params["output"]]
+        response = StreamingHttpResponse(columnar.stream(params["table"], params["output"], fields, params.get("genome", None)),
+                                         content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="{params["table"]}.{extension}"'
+        return response
+
+    def post(self, request) -> Response:
+        return Response({"error": "POST request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def put(self, request) -> Response:
+        return Response({"error": "PUT request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def delete(self, request) -> Response:
+        return Response({"error": "DELETE request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
 class TaskAPIView(APIView):
 
     def get(self, request) -> Response:
@@ -544,9 +1178,16 @@ class TaskAPIView(APIView):
         except CustomUser.DoesNotExist:
             return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
         
-        query_result = AsyncTasksCache.objects.filter(**{k: v for k, v in params.items() if v is not None})
+        # Users are serialised by username
+        query_result = AsyncTasksCache.objects.filter(**{k: v for k, v in params.items() if v is not None}).select_related("user")
         # if query_result.count() == 0:
         #     return Response({"error": "No task found."}, status=status.HTTP_404_NOT_FOUND)
+        if(KeysetPagination.requested(request)):
+            # Latest tasks first
+            paginator = KeysetPagination(ordering="-created_at")
+            query_result = paginator.paginate_queryset(query_result, request)
+            serializer = TaskSerializer(query_result, many=True)
+            return paginator.get_paginated_response(serializer.data)
         serializer = TaskSerializer(query_result, many=True)
 
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -555,11 +1196,48 @@ class TaskAPIView(APIView):
         return Response({"error": "POST request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
     
     def put(self, request) -> Response:
-        return Response({"error": "PUT request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+        params = {"action": request.data.get('action', None), # Action can only be cancel
+                "key": request.data.get('key', None)} # Key of the task
+
+        if not request.user.is_authenticated:
+            return Response({"error": "Authentication required."}, status=status.HTTP_401_UNAUTHORIZED)
+
+        try:
+            TaskInputSerializer(data={"key": params["key"]}).is_valid(raise_exception=True)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if params["key"] is None:
+            return Response({"error": "A key parameter must be provided."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if str(params["action"]).lower() == "cancel":
+            return AsyncTasksCache.cancel_task(key=params["key"], user=request.user)
+
+        return Response({"error": "Invalid action"}, status=status.HTTP_400_BAD_REQUEST)
     
     def delete(self, request) -> Response:
         return Response({"error": "DELETE request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
     
+class QueueAPIView(APIView):
+
+    # Authentificated admin users can access this view
+
+    permission_classes = [IsAuthenticated&IsAdminUser]
+
+    def get(self, request) -> Response:
+        # Live depth of each queue and the last decision of the autoscaler
+        return Response([QueueAutoscaler.metrics(name) for name in QUEUES], status=status.HTTP_200_OK)
+
+    def post(self, request) -> Response:
+        return Response({"error": "POST request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def put(self, request) -> Response:
+        return Response({"error": "PUT request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def delete(self, request) -> Response:
+        return Response({"error": "DELETE request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
 class BlastAPIView(APIView):
 
     permission_classes = [IsAuthenticated&(IsAnnotatorUser|IsValidatorUser|IsAdminUser)]
@@ -597,9 +1275,9 @@ class BlastAPIView(APIView):
             sequence = gene.sequence
             # Parameters for the BLAST task
             blast_params = {"sequence": sequence, # Sequence to be blasted
-                    "program": request.data.get('program', "blastn"), # BLAST program to be used
-                    "database": request.data.get('database', "nt"), # BLAST database to be used
-                    "evalue": request.data.get('evalue', 0.001)} # E-value threshold
+                    "program": request.data.get('program', BLAST_DEFAULTS["program"]), # BLAST program to be used
+                    "database": request.data.get('database', BLAST_DEFAULTS["database"]), # BLAST database to be used
+                    "evalue": request.data.get('evalue', BLAST_DEFAULTS["evalue"])} # E-value threshold
             return AsyncTasksCache.get_or_create_task(task_type="BLAST", task_params=blast_params, task_funct=run_blast, user=request.user)
         else:
             return Response({"error": "Gene parameter not provided."}, status=status.HTTP_400_BAD_REQUEST)
@@ -650,8 +1328,8 @@ class PFAMAPIView(APIView):
         # Make paramaters for the PFAM task
         sequence = peptide.sequence
         pfam_params = {"sequence": sequence, # Sequence to be scanned against the PFAM database
-                    "evalue": request.data.get('evalue', 0.001), # E-value threshold
-                    "asp": request.data.get('asp', True), # Active site prediction method
+                    "evalue": request.data.get('evalue', PFAM_DEFAULTS["evalue"]), # E-value threshold
+                    "asp": request.data.get('asp', PFAM_DEFAULTS["asp"]), # Active site prediction method
                     "user": request.user.id, # User who submitted the task
         }
         
@@ -662,4 +1340,54 @@ class PFAMAPIView(APIView):
         pass
     
     def delete(self, request) -> Response:
-        pass
\ No newline at end of file
+        pass
+
+class PipelineAPIView(APIView):
+
+    permission_classes = [IsAuthenticated&(IsValidatorUser|IsAdminUser)]
+
+    def get(self, request) -> Response:
+        # Get the key of the pipeline
+        key = request.GET.get('key', None)
+        try:
+            TaskInputSerializer(data={"key": key}).is_valid(raise_exception=True)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if key is None:
+            return Response({"error": "A key parameter must be provided."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            task_obj = AsyncTasksCache.objects.get(key=key, task="PIPELINE")
+        except AsyncTasksCache.DoesNotExist:
+            return Response({"error": "Pipeline not found."}, status=status.HTTP_404_NOT_FOUND)
+        if task_obj.state == AsyncTasksCache.completed:
+            return AsyncTasksCache.retrieve_task(key=key, task_type="PIPELINE", user=request.user)
+        # Aggregate progress of the batches
+        progress = {"task": task_obj.key, "state": task_obj.state, "params": task_obj.params,
+                    "total": task_obj.items_total, "done": task_obj.items_done, "failed": task_obj.items_failed}
+        return Response(progress, status=status.HTTP_202_ACCEPTED if task_obj.state == AsyncTasksCache.in_progress else status.HTTP_200_OK)
+
+    def post(self, request) -> Response:
+        # Validate the input parameters
+        try:
+            PipelineRunInputSerializer(data=request.data).is_valid(raise_exception=True)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        genome = request.data.get('genome')
+        name = request.data.get('pipeline', None) or "preannotation"
+        if not Genome.objects.filter(name=genome).exists():
+            return Response({"error": "Genome not found."}, status=status.HTTP_404_NOT_FOUND)
+        # Only one run of a pipeline per genome at a time
+        running = AsyncTasksCache.query_cache(params={"pipeline": name, "genome": genome}).filter(task="PIPELINE", state=AsyncTasksCache.in_progress).first()
+        if running is not None:
+            return Response({"key": f"{running.key}"}, status=status.HTTP_200_OK)
+        try:
+            parent = start_pipeline(name, genome, request.user)
+        except Exception as e:
+            return Response({"error": "Pipeline failed to start.", "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"key": f"{parent.key}"}, status=status.HTTP_202_ACCEPTED)
+
+    def put(self, request) -> Response:
+        return Response({"error": "PUT request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def delete(self, request) -> Response:
+        return Response({"error": "DELETE request not supported."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)